@@ -2,6 +2,8 @@ import os
 import subprocess
 import sys
 import ctypes
+import importlib.util
+import marshal
 from flask import Flask, render_template, request, jsonify, send_from_directory
 from pathlib import Path
 import base64
@@ -34,6 +36,30 @@ if not PLACEHOLDER_ICON_PATH.exists() or PLACEHOLDER_ICON_PATH.stat().st_size ==
     with open(PLACEHOLDER_ICON_PATH, 'wb') as f:
         f.write(b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x10\x00\x00\x00\x10\x08\x06\x00\x00\x00\x1f\xf3\xffa\x00\x00\x00\x01sRGB\x00\xae\xce\x1c\xe9\x00\x00\x00\x15IDAT8\x8dcd`\xf8\xcf\xc0\xc0\xc0\xc0\xc8\xc0\xc0\xf0\x9f\xc1\x98\x01\x00\x0f\xf6\x02\xfe\xac\xa0\x93\x94\x00\x00\x00\x00IEND\xaeB`\x82')
         
+def save_bytecode(program_path, code):
+    """把编译好的代码对象按 .pyc 格式（带源码哈希）保存到 programs/__pycache__ 中"""
+    source = program_path.read_bytes()
+    pyc_path = Path(importlib.util.cache_from_source(str(program_path)))
+    try:
+        pyc_path.parent.mkdir(exist_ok=True)
+        # 标志位 0b11：基于哈希并检查源码，与 py_compile 的 CHECKED_HASH 相同
+        pyc_path.write_bytes(importlib.util.MAGIC_NUMBER + (0b11).to_bytes(4, 'little')
+                             + importlib.util.source_hash(source) + marshal.dumps(code))
+    except OSError as e:
+        print(f"保存编译缓存失败: {e}")  # 只是缓存，不影响添加和运行
+
+def check_syntax(program_path):
+    """检查程序语法（有错误时抛出 SyntaxError）；源码与缓存的 .pyc 一致时不再重新编译"""
+    source = program_path.read_bytes()
+    try:
+        with open(importlib.util.cache_from_source(str(program_path)), 'rb') as f:
+            header = f.read(16)
+        if header[:4] == importlib.util.MAGIC_NUMBER and header[8:16] == importlib.util.source_hash(source):
+            return
+    except OSError:
+        pass
+    save_bytecode(program_path, compile(source.decode('utf-8'), str(program_path), 'exec'))
+
 # 路由: 静态文件服务
 @app.route('/static/<path:filename>')
 def serve_static(filename):
@@ -132,10 +158,11 @@ def add_program():
             formatted_code = '\n'.join(formatted_lines)
             
             # 4. 验证代码语法
-            compile(formatted_code, '<string>', 'exec')
+            code = compile(formatted_code, str(program_path), 'exec')
             
-            # 5. 保存格式化后的代码
+            # 5. 保存格式化后的代码，编译结果一并缓存，运行前不用再编译
             program_path.write_text(formatted_code, encoding='utf-8')
+            save_bytecode(program_path, code)
             
         except SyntaxError as e:
             return jsonify({
@@ -230,10 +257,8 @@ def run_program():
             return jsonify({'status': 'error', 'message': f'程序 {program_name} 不存在！'})
 
         try:
-            # 读取原始代码并进行语法检查
-            with open(program_path, 'r', encoding='utf-8') as f:
-                code = f.read()
-            compile(code, program_path, 'exec')
+            # 语法检查（源码没有变化时直接使用缓存的编译结果）
+            check_syntax(program_path)
             
             # 获取Python解释器路径
             python_exe = sys.executable.replace('python.exe', 'pythonw.exe')
@@ -381,8 +406,8 @@ def delete_programs():
 
 # 当这个脚本被直接运行时 (而不是被导入时)
 if __name__ == '__main__':
-    # 启动 Flask 开发服务器
-    # host='0.0.0.0' 让服务器可以被局域网内的其他设备访问 (包括手机)
-    # debug=True 开启调试模式，代码修改后服务器会自动重启，并显示详细错误信息
-    # 在生产环境中应关闭 debug 模式
-    app.run(host='127.0.0.1', port=5000, debug=True) 
\ No newline at end of file
+    # 启动 Flask 开发服务器（生产环境请使用 my_app_platform/serve.py）
+    # host='127.0.0.1' 仅本地访问
+    # FLASK_DEBUG=1 时开启调试模式，代码修改后服务器会自动重启，并显示详细错误信息；
+    # 调试器允许在浏览器中执行任意代码，默认关闭
+    app.run(host='127.0.0.1', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1')
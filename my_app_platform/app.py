@@ -2,345 +2,2805 @@ import os
 import subprocess
 import sys
 import ctypes
-from flask import Flask, render_template, request, jsonify, send_from_directory, current_app
+from flask import Flask, Blueprint, render_template, request, jsonify, send_from_directory, current_app, Response, g
 from flask_cors import CORS  # 添加CORS支持
+from werkzeug.exceptions import BadRequest, HTTPException, RequestEntityTooLarge
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
 from pathlib import Path
 import shutil
 import tempfile
 import uuid
 import json
-
-# 创建 Flask 应用实例
-# __name__ 是 Python 的一个特殊变量，Flask 用它来确定应用根目录，以便查找资源文件（如模板和静态文件）
-app = Flask(__name__)
-CORS(app)  # 启用CORS，允许跨域请求
-
-# 增加请求超时设置
-app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0  # 禁用静态文件缓存
-app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024  # 将最大请求大小提高到32MB
+import queue
+import threading
+import time
+import hashlib
+import importlib.util
+import marshal
+import functools
+import contextlib
+import ast
+import math
+import multiprocessing
+import zipfile
+import zipapp
+import gzip
+import mimetypes
+import argparse
+import base64
+import bisect
+import atexit
+import contextvars
+import copy
+import logging
+import logging.handlers
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePosixPath
+from collections import OrderedDict, deque
+
+import interp_worker
+
+try:
+    from PIL import Image, ImageOps  # 可选：用于生成程序图标缩略图
+except ImportError:
+    Image = None
+
+try:
+    import brotli  # 可选：安装后额外预压缩 br 版本的静态资源
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl  # 跨进程文件锁（Linux/macOS）
+except ImportError:
+    fcntl = None
+    import msvcrt  # Windows 下使用 msvcrt.locking
+
+# 所有路由注册在蓝图上，Flask 应用由文件末尾的 create_app() 创建。
+# 导入本模块没有副作用：创建目录、占位图标、日志线程等初始化都在 create_app() 中完成。
+bp = Blueprint('platform', __name__)
 
 # 定义程序存放的目录，使用相对路径
 PROGRAMS_DIR = 'programs'
-# 确保程序目录存在，如果不存在则创建
-if not os.path.exists(PROGRAMS_DIR):
-    os.makedirs(PROGRAMS_DIR)
 
 # 定义编译后EXE存储目录
 EXE_DIR = 'exe_programs'
-# 确保程序目录存在，如果不存在则创建
-if not os.path.exists(EXE_DIR):
-    os.makedirs(EXE_DIR)
 
 # 添加上传文件夹配置，使用相对路径
 UPLOAD_FOLDER = Path('static/program_icons')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'ico'} # Keep for potential future use or icon validation
 
-# 确保上传文件夹存在
-UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = str(UPLOAD_FOLDER)
-# app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 注释掉旧的，使用上面新的32MB设置
-
 # 支持的编程语言及其打包命令
 SUPPORTED_LANGUAGES = {
     'python': {
         'extension': '.py',
-        'build_command': 'pyinstaller --onefile --noconsole --clean "{source_file}" --distpath "{output_dir}" --workpath "{temp_dir}" --specpath "{temp_dir}" --name "{program_name}"'
+        'build_command': 'pyinstaller --onefile --noconsole --clean "{source_file}" --distpath "{output_dir}" --workpath "{temp_dir}" --specpath "{temp_dir}" --name "{program_name}"',
+        # 预热模式：不加 --clean，保留工作目录里的分析结果和 PYZ 缓存
+        'warm_build_command': 'pyinstaller --onefile --noconsole --noconfirm "{source_file}" --distpath "{output_dir}" --workpath "{temp_dir}" --specpath "{temp_dir}" --name "{program_name}"',
+        # onedir 后端：生成 <output_dir>/<program_name>/ 目录，运行时文件与其他程序共用（见“打包后端”一节）
+        'onedir_build_command': 'pyinstaller --onedir --noconsole --noconfirm --clean "{source_file}" --distpath "{output_dir}" --workpath "{temp_dir}" --specpath "{temp_dir}" --name "{program_name}"'
     } # Removed Java and C++ entries
 }
 
-# 确保占位图标存在
+# 默认的打包后端（见“打包后端”一节）：pyinstaller 生成单文件可执行程序，onedir 生成与其他程序共用运行时的目录，
+# zipapp 生成 .pyz，只需几毫秒
+DEFAULT_PACKAGING_BACKEND = os.environ.get('PACKAGING_BACKEND', 'pyinstaller')
+
+# 打包任务队列配置
+BUILD_WORKERS = max(1, int(os.environ.get('BUILD_WORKERS', '2')))  # 同时运行的打包工作线程数
+BUILD_TIMEOUT = 1200  # 单个打包任务的超时时间（秒），20分钟
+BUILD_JOB_HISTORY = 500  # 内存中最多保留的已结束任务数，防止任务记录无限增长
+BUILD_LOG_BUFFER_LINES = int(os.environ.get('BUILD_LOG_BUFFER_LINES', '500'))  # 每个任务保留的最近日志行数
+BUILD_LOG_MAX_LINE_LENGTH = 2000  # 单行日志的最大长度，超出部分截断
+
+# 批量导入：每个 PyInstaller 打包本身就是独立进程，导入批次用一个线程池并行启动这些进程
+IMPORT_WORKERS = max(1, int(os.environ.get('IMPORT_WORKERS', str(os.cpu_count() or 2))))  # 批量导入时同时打包的程序数，默认等于 CPU 核数
+IMPORT_MAX_PROGRAMS = BUILD_JOB_HISTORY  # 单个压缩包最多包含的程序数，不超过任务记录上限，保证结果报告完整
+IMPORT_MAX_UNCOMPRESSED_BYTES = 256 * 1024 * 1024  # 压缩包解压后的总大小上限，防止压缩炸弹
+IMPORT_BATCH_HISTORY = 50  # 内存中最多保留的导入批次数
+
+# 运行方式：exe 通过 ShellExecuteW 启动打包好的程序（仅 Windows）；
+# interpreted 在预热的 Python 进程池中直接执行 source.py，启动只需几毫秒
+DEFAULT_RUN_MODE = os.environ.get('RUN_MODE', 'exe' if os.name == 'nt' else 'interpreted')
+INTERP_POOL_SIZE = max(1, int(os.environ.get('INTERP_POOL_SIZE', '4')))  # 进程池大小，即可同时解释运行的程序数
+INTERP_RECYCLE_AFTER = int(os.environ.get('INTERP_RECYCLE_AFTER', '50')) or None  # 每个工作进程运行多少次后重建，0 表示不回收
+# fork：每次运行从工作进程 fork 出子进程，互不影响；none：直接在工作进程中运行（Windows 只能用这种方式）
+INTERP_ISOLATION = os.environ.get('INTERP_ISOLATION', 'fork' if hasattr(os, 'fork') else 'none')
+INTERP_WALL_TIMEOUT = float(os.environ.get('INTERP_WALL_TIMEOUT', '600')) or None  # 每次解释运行的墙钟时间上限（秒），0 表示不限制
+INTERP_PRELOAD_MODULES = [m.strip() for m in os.environ.get('INTERP_PRELOAD_MODULES', 'json,math,random,time,tkinter').split(',') if m.strip()]
+
+# /execute：在资源限制下运行程序并返回输出
+EXECUTE_MAX_CONCURRENCY = max(1, int(os.environ.get('EXECUTE_MAX_CONCURRENCY', '4')))  # 同时运行的程序数上限
+EXECUTE_QUEUE_WAIT = 5  # 没有空闲名额时最多等待的秒数
+EXECUTE_WALL_TIMEOUT = float(os.environ.get('EXECUTE_WALL_TIMEOUT', '30'))  # 墙钟时间上限（秒）
+EXECUTE_CPU_SECONDS = int(os.environ.get('EXECUTE_CPU_SECONDS', '10'))  # CPU 时间上限（秒）
+EXECUTE_MEMORY_BYTES = int(os.environ.get('EXECUTE_MEMORY_BYTES', str(512 * 1024 * 1024)))  # 地址空间上限，0 表示不限制
+EXECUTE_OUTPUT_LIMIT = int(os.environ.get('EXECUTE_OUTPUT_LIMIT', str(64 * 1024)))  # stdout/stderr 各自最多保留的字节数
+EXECUTE_RETRY_AFTER = 5  # /execute 没有空闲名额时建议客户端等待的秒数
+
+# 准入控制：打包和运行接口按客户端限速，并限制同时进行的打包和运行数量；
+# 超出时立即返回 429/503 和 Retry-After，而不是让所有请求一起排队变慢
+RATE_LIMIT_PER_MINUTE = float(os.environ.get('RATE_LIMIT_PER_MINUTE', '60'))  # 每个客户端每分钟补充的令牌数，0 表示不限速
+RATE_LIMIT_BURST = max(1, int(os.environ.get('RATE_LIMIT_BURST', '20')))  # 令牌桶容量，即允许的突发请求数
+RATE_LIMIT_MAX_CLIENTS = 10000  # 内存中最多保留的客户端令牌桶数，超出时丢弃最久未访问的
+BUILD_REQUEST_COST = 5  # 添加、更新、导入程序消耗的令牌数（运行程序消耗 1 个）
+BUILD_MAX_PENDING = int(os.environ.get('BUILD_MAX_PENDING', '20'))  # 每个服务进程排队和运行中的打包任务上限，0 表示不限制
+BUILD_MAX_CONCURRENCY = max(1, int(os.environ.get('BUILD_MAX_CONCURRENCY', str(os.cpu_count() or 2))))  # 整台机器同时运行的 PyInstaller 进程数
+BUILD_SLOT_POLL_INTERVAL = 0.5  # 等待空闲打包名额时的轮询间隔（秒）
+RUN_MAX_CONCURRENCY = int(os.environ.get('RUN_MAX_CONCURRENCY', str(INTERP_POOL_SIZE * 4)))  # 每个服务进程已提交、尚未结束的解释运行数上限，0 表示不限制
+RUN_RETRY_AFTER = 2  # 解释运行名额已满时建议客户端等待的秒数
+
+# 预热打包模式（可选）：导入模块集合相同的程序共用一个持久化的 PyInstaller 工作目录
+WARM_BUILDS = os.environ.get('WARM_BUILDS', '0') == '1'
+WARM_BUILD_DIR = Path('build_work')
+WARM_BUILD_NAME = 'warm_app'  # 工作目录按 --name 区分，共用时必须使用固定名称
+
+# 打包缓存目录：相同源码 + 相同工具链的打包结果直接复用
+BUILD_CACHE_DIR = Path('build_cache')
+BUILD_CACHE_MAX_BYTES = int(os.environ.get('BUILD_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))  # 缓存总大小上限，默认2GB
+
+# 字节码缓存目录：源码编译一次后按 .pyc 格式保存，之后的校验、打包和解释运行直接复用
+BYTECODE_CACHE_DIR = Path('bytecode_cache')
+
+# /add_program、/update_program 的上传：请求体边读边写入暂存文件，内存占用与上传大小无关
+UPLOAD_STAGING_DIR = Path('upload_staging')  # 应与 programs/、static/ 在同一文件系统上，暂存文件直接重命名到位
+PROGRAM_UPLOAD_MAX_BYTES = int(os.environ.get('PROGRAM_UPLOAD_MAX_BYTES', str(16 * 1024 * 1024)))  # 请求体（源码 + 图标）上限
+PROGRAM_SOURCE_MAX_BYTES = int(os.environ.get('PROGRAM_SOURCE_MAX_BYTES', str(2 * 1024 * 1024)))  # 源码上限：编译时需要整个读入内存
+UPLOAD_CHUNK_SIZE = 64 * 1024  # 每次从请求体读取的字节数
+UPLOAD_FIELD_MAX_BYTES = 4096  # 名称、语言、打包方式等普通字段的上限
+UPLOAD_MAX_PARTS = 16
+UPLOAD_STAGING_MAX_AGE = 3600  # 启动时删除早于这么多秒的暂存文件（进程异常退出时遗留）
+
+# 产物存储区：按内容（SHA-256）保存可执行文件，exe_programs/ 中内容相同的文件都是它的硬链接
+ARTIFACT_STORE_DIR = Path('artifact_store')  # 必须与 exe_programs/ 在同一文件系统上，才能使用硬链接
+
+# 删除程序时先把目录重命名到回收站，由后台线程限速删除
+TRASH_DIR = Path('.trash')  # 必须与 programs/、exe_programs/ 在同一文件系统上，重命名才是原子操作
+TRASH_GC_BYTES_PER_SEC = int(os.environ.get('TRASH_GC_BYTES_PER_SEC', str(64 * 1024 * 1024)))  # 后台删除速率上限，0 表示不限速
+TRASH_GC_MIN_FILE_COST = 4096  # 小文件也按至少这么多字节计入速率，避免大量小文件集中删除
+TRASH_GC_RETRY_INTERVAL = 60  # 删除失败（例如文件被占用）的条目隔多久重试（秒）
+TRASH_LOCK_PATH = Path('.trash.lock')  # 不能放在回收站目录里，否则会被当作待删除的条目
+
+# /metrics：exe_programs/ 磁盘占用需要遍历目录，结果缓存这么多秒
+METRICS_DISK_USAGE_TTL = 60
+
+# /api/programs 分页参数
+API_PAGE_DEFAULT_LIMIT = 50
+API_PAGE_MAX_LIMIT = 200
+
+# 静态资源：url_for('static', ...) 生成带内容哈希的地址 (?v=...)，带正确版本号的请求可以长期缓存
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+PRECOMPRESSED_ASSETS = ('script.js', 'style.css')  # 启动时预先压缩，请求时直接返回压缩好的内容
+
+# 程序图标缩略图：上传的原图保留（打包时使用），页面上显示缩小后的 WebP
+ICON_THUMB_SIZES = (48, 96)  # 图标显示为 48px（手机上 40px），96px 用于高分辨率屏幕
+ICON_THUMB_QUALITY = 80
+ICON_MAX_PIXELS = 40_000_000  # 超过这个像素数的图片不解码，直接使用原图
+
+# ----- 日志 -----
+# 业务代码只把日志记录放进内存队列（QueueHandler，不会阻塞），由一个后台线程（QueueListener）
+# 写入按大小轮转的 JSON 日志文件和控制台。每条记录带上请求 ID 和打包任务 ID，便于关联同一次
+# 请求或打包产生的日志；PyInstaller 的完整输出不进主日志，写入 logs/builds/<任务ID>.log。
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_DIR = Path(os.environ.get('LOG_DIR', 'logs'))
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', str(10 * 1024 * 1024)))  # 单个日志文件的大小上限
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', '5'))  # 轮转后保留的旧日志文件数
+LOG_CONSOLE = os.environ.get('LOG_CONSOLE', '1') == '1'  # 是否同时输出到控制台（stderr，文本格式）
+BUILD_TRANSCRIPT_DIR = LOG_DIR / 'builds'
+# 打包任务和导入批次的状态另存一份 JSON 文件，多进程部署时任意工作进程都能查询，服务重启后也不丢失
+RUN_STATE_DIR = Path('run_state')
+
+logger = logging.getLogger('my_app_platform')
+_request_id_var = contextvars.ContextVar('request_id', default=None)
+_build_id_var = contextvars.ContextVar('build_id', default=None)
+_REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9._-]{1,64}')
+_LOG_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id', 'build_id'}
+_log_queue = queue.SimpleQueue()
+_log_handlers = []
+_log_listener = None
+
+class _LogQueueHandler(logging.handlers.QueueHandler):
+    """在调用方线程里补上关联 ID 并格式化消息，之后的写入都交给后台线程"""
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        # 回调线程里没有上下文，可以通过 extra= 显式传入关联 ID
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = _request_id_var.get()
+        if getattr(record, 'build_id', None) is None:
+            record.build_id = _build_id_var.get()
+        return record
+
+class _JsonLogFormatter(logging.Formatter):
+    """每条记录输出为一行 JSON；通过 extra= 传入的字段原样附加"""
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for key in ('request_id', 'build_id'):
+            if getattr(record, key, None):
+                entry[key] = getattr(record, key)
+        for key, value in vars(record).items():
+            if key not in _LOG_RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def configure_logging():
+    """创建日志输出并启动后台线程（只执行一次）"""
+    if _log_handlers:
+        return
+    handlers = _log_handlers
+    try:
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_DIR / 'app.log', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+        file_handler.setFormatter(_JsonLogFormatter())
+        handlers.append(file_handler)
+    except OSError as e:
+        print(f"Cannot open log file in {LOG_DIR}: {e}", file=sys.stderr)
+    if LOG_CONSOLE or not handlers:
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(threadName)s] %(message)s'))
+        handlers.append(console_handler)
+    logger.addHandler(_LogQueueHandler(_log_queue))
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    _start_log_listener()
+    atexit.register(_stop_log_listener)  # 退出前写完队列中剩余的记录
+
+def _start_log_listener():
+    global _log_listener
+    if _log_handlers and _log_listener is None:
+        _log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers)
+        _log_listener.start()
+
+def _stop_log_listener():
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+def _before_fork():
+    """
+    fork 之前停止日志线程，并把按大小轮转的日志文件改为 WatchedFileHandler：多个进程各自轮转同一个文件时，
+    一个进程重命名文件后其他进程仍写入旧文件并覆盖备份。多进程下日志只追加写入，由 logrotate 等外部工具
+    轮转，文件被改名后各进程自动重新打开。
+    """
+    _stop_log_listener()
+    for index, handler in enumerate(_log_handlers):
+        if isinstance(handler, logging.handlers.RotatingFileHandler):
+            shared_handler = logging.handlers.WatchedFileHandler(handler.baseFilename, encoding='utf-8')
+            shared_handler.setFormatter(handler.formatter)
+            handler.close()
+            _log_handlers[index] = shared_handler
+
+def _prune_old_files(directory, pattern, keep):
+    """删除目录中多余的文件，按修改时间只保留最近 keep 个"""
+    try:
+        paths = sorted(directory.glob(pattern), key=lambda p: p.stat().st_mtime, reverse=True)
+    except OSError:
+        return
+    for path in paths[keep:]:
+        path.unlink(missing_ok=True)
+
+@bp.before_app_request
+def _assign_request_id():
+    # 沿用反向代理传入的 X-Request-ID，格式不合法或没有时生成一个新的
+    request_id = request.headers.get('X-Request-ID', '')
+    if not _REQUEST_ID_PATTERN.fullmatch(request_id):
+        request_id = uuid.uuid4().hex[:16]
+    g.request_id = request_id
+    g.request_id_token = _request_id_var.set(request_id)
+
+@bp.after_app_request
+def _echo_request_id(response):
+    if g.get('request_id'):
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@bp.teardown_app_request
+def _clear_request_id(exc=None):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        _request_id_var.reset(token)
+
 PLACEHOLDER_ICON_PATH = Path('static/placeholder_icon.png')
-if not PLACEHOLDER_ICON_PATH.exists() or PLACEHOLDER_ICON_PATH.stat().st_size == 0:
+
+def _ensure_placeholder_icon():
+    """确保占位图标存在"""
+    if PLACEHOLDER_ICON_PATH.exists() and PLACEHOLDER_ICON_PATH.stat().st_size > 0:
+        return
     # 创建一个简单的16x16的PNG图标（灰色方块）
     try:
         with open(PLACEHOLDER_ICON_PATH, 'wb') as f:
             f.write(b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x10\x00\x00\x00\x10\x08\x06\x00\x00\x00\x1f\xf3\xffa\x00\x00\x00\x01sRGB\x00\xae\xce\x1c\xe9\x00\x00\x00\x15IDAT8\x8dcd`\xf8\xcf\xc0\xc0\xc0\xc0\xc8\xc0\xc0\xf0\x9f\xc1\x98\x01\x00\x0f\xf6\x02\xfe\xac\xa0\x93\x94\x00\x00\x00\x00IEND\xaeB`\x82')
-        print("Placeholder icon created.")
+        logger.info("Placeholder icon created.")
     except Exception as e:
-        print(f"Error creating placeholder icon: {e}")
-
-# 路由: 静态文件服务
-@app.route('/static/<path:filename>')
+        logger.warning(f"Error creating placeholder icon: {e}")
+
+# ----- 静态资源 -----
+# 模板中的 url_for('static', filename=...) 会自动带上文件内容的哈希 (?v=)，文件一改地址就变，
+# 因此带当前版本号的请求可以返回 immutable 缓存头；其余请求通过 ETag / If-None-Match 重新验证。
+# 程序图标的文件名本身就是 UUID，内容不会变化，同样长期缓存。
+_asset_versions = {}  # filename -> (mtime_ns, size, 哈希)
+_precompressed = {}  # filename -> {'version', 'mtime_ns', 'size', 'identity', 'gzip', 'br'}
+_static_lock = threading.Lock()
+
+def asset_version(filename):
+    """返回静态文件内容哈希的前12位，文件不存在时返回 None；文件修改后自动重新计算"""
+    path = Path(current_app.static_folder) / filename
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    with _static_lock:
+        cached = _asset_versions.get(filename)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+    version = hashlib.sha256(path.read_bytes()).hexdigest()[:12]
+    with _static_lock:
+        _asset_versions[filename] = (stat.st_mtime_ns, stat.st_size, version)
+    return version
+
+def _precompress_asset(filename):
+    """读取并压缩一个静态资源，结果缓存在内存中；文件修改后重新压缩"""
+    path = Path(current_app.static_folder) / filename
+    stat = path.stat()
+    with _static_lock:
+        entry = _precompressed.get(filename)
+        if entry and (entry['mtime_ns'], entry['size']) == (stat.st_mtime_ns, stat.st_size):
+            return entry
+    data = path.read_bytes()
+    entry = {
+        'version': asset_version(filename),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'identity': data,
+        'gzip': gzip.compress(data, compresslevel=9, mtime=0),
+        'br': brotli.compress(data, quality=11) if brotli else None,
+    }
+    with _static_lock:
+        _precompressed[filename] = entry
+    return entry
+
+def precompress_static_assets():
+    for filename in PRECOMPRESSED_ASSETS:
+        try:
+            entry = _precompress_asset(filename)
+            logger.debug(f"Precompressed {filename}: {entry['size']} -> gzip {len(entry['gzip'])}"
+                  + (f", br {len(entry['br'])}" if entry['br'] else '') + ' bytes')
+        except OSError as e:
+            logger.warning(f"Error precompressing {filename}: {e}")
+
+@bp.app_url_defaults
+def add_static_version(endpoint, values):
+    if endpoint == 'static' and 'v' not in values and not values.get('filename', '').startswith('program_icons/'):
+        version = asset_version(values['filename'])
+        if version:
+            values['v'] = version
+
+# 路由: 静态文件服务（替换 Flask 内置的 static 视图，url_for('static', ...) 指向这里）
 def serve_static(filename):
-    return send_from_directory('static', filename)
+    if filename in PRECOMPRESSED_ASSETS:
+        try:
+            entry = _precompress_asset(filename)
+        except OSError:
+            return jsonify({'status': 'error', 'message': f'文件不存在: {filename}'}), 404
+        accepted = request.accept_encodings
+        encoding = 'br' if entry['br'] and accepted['br'] else 'gzip' if accepted['gzip'] else 'identity'
+        response = Response(entry[encoding], mimetype=mimetypes.guess_type(filename)[0])
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.set_etag(f"{entry['version']}-{encoding}")
+        version = entry['version']
+    else:
+        response = send_from_directory(current_app.static_folder, filename)
+        version = None if filename.startswith('program_icons/') else asset_version(filename)
+
+    if filename.startswith('program_icons/') or (version and request.args.get('v') == version):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+# ----- 运行指标 (/metrics) -----
+# Prometheus 文本格式。请求路径上只做一次字典更新：桶的位置在锁外用 bisect 算好，
+# 锁内只有几次整数加法；目录大小等较重的数据只在抓取 /metrics 时计算，并做缓存。
+HTTP_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUILD_DURATION_BUCKETS = (1, 5, 10, 20, 30, 60, 120, 300, 600, 1200)
+METRICS_HELP = {
+    'app_http_requests_total': ('counter', 'HTTP requests by route, method and status'),
+    'app_http_request_duration_seconds': ('histogram', 'Time to produce a response, by route'),
+    'app_builds_total': ('counter', 'Finished build jobs by outcome'),
+    'app_build_duration_seconds': ('histogram', 'Build job duration from start to finish'),
+    'app_build_jobs': ('gauge', 'Build jobs currently queued or running'),
+    'app_running_programs': ('gauge', 'Programs currently running under the server, by mode'),
+    'app_programs': ('gauge', 'Programs in the catalogue'),
+    'app_exe_programs_bytes': ('gauge', 'Disk used by exe_programs/ (hard links counted once)'),
+    'app_artifact_bytes': ('gauge', 'Artifact bytes referenced by programs (logical) and stored once (physical)'),
+    'app_build_cache_events_total': ('counter', 'Build cache lookups, stores and evictions'),
+    'app_trash_freed_bytes_total': ('counter', 'Bytes reclaimed by the trash collector'),
+    'app_admission_rejected_total': ('counter', 'Requests rejected by rate limiting or backpressure, by reason'),
+}
+_metrics_lock = threading.Lock()
+_metric_counters = {}  # (name, labels) -> value
+_metric_gauges = {}  # (name, labels) -> value
+_metric_histograms = {}  # (name, labels) -> [各桶计数..., +Inf 计数], 总和
+_disk_usage_cache = {'value': None, 'at': 0.0}
+
+def metrics_inc(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _metrics_lock:
+        _metric_counters[key] = _metric_counters.get(key, 0) + value
+
+def metrics_gauge_add(name, value, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _metrics_lock:
+        _metric_gauges[key] = _metric_gauges.get(key, 0) + value
+
+def metrics_observe(name, value, buckets, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    index = bisect.bisect_left(buckets, value)
+    with _metrics_lock:
+        entry = _metric_histograms.get(key)
+        if entry is None:
+            entry = _metric_histograms[key] = [[0] * (len(buckets) + 1), 0.0, buckets]
+        entry[0][index] += 1
+        entry[1] += value
+
+@bp.before_app_request
+def _metrics_start_timer():
+    g.metrics_started = time.perf_counter()
+
+@bp.after_app_request
+def _metrics_record_request(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics_observe('app_http_request_duration_seconds', time.perf_counter() - started, HTTP_DURATION_BUCKETS, route=route)
+        metrics_inc('app_http_requests_total', route=route, method=request.method, status=str(response.status_code))
+    return response
+
+def _exe_programs_disk_usage():
+    """exe_programs/ 占用的字节数，同一 inode（与打包缓存共享的硬链接）只计一次"""
+    now = time.monotonic()
+    if _disk_usage_cache['value'] is not None and now - _disk_usage_cache['at'] < METRICS_DISK_USAGE_TTL:
+        return _disk_usage_cache['value']
+    seen = set()
+    total = 0
+    for root, dirs, files in os.walk(EXE_DIR):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    _disk_usage_cache.update(value=total, at=now)
+    return total
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+# 路由: 运行指标（Prometheus 文本格式）
+@bp.route('/metrics')
+def metrics():
+    # 抓取时才计算的指标
+    with _build_jobs_lock:
+        job_states = [job['state'] for job in _build_jobs.values()]
+    with _build_cache_lock:
+        cache_stats = dict(_build_cache_stats)
+    with _trash_lock:
+        trash_freed = _trash_stats['freed_bytes']
+    gauges = {
+        ('app_build_jobs', (('state', 'queued'),)): job_states.count('queued'),
+        ('app_build_jobs', (('state', 'running'),)): job_states.count('running'),
+        ('app_programs', ()): count_programs(),
+        ('app_exe_programs_bytes', ()): _exe_programs_disk_usage(),
+    }
+    for kind, value in artifact_store_totals().items():
+        if kind.endswith('_bytes'):
+            gauges[('app_artifact_bytes', (('kind', kind[:-len('_bytes')]),))] = value
+    counters = {('app_build_cache_events_total', (('event', event),)): value for event, value in cache_stats.items()}
+    counters[('app_trash_freed_bytes_total', ())] = trash_freed
+
+    with _metrics_lock:
+        counters.update(_metric_counters)
+        gauges.update(_metric_gauges)
+        histograms = {key: ([*entry[0]], entry[1], entry[2]) for key, entry in _metric_histograms.items()}
+
+    lines = []
+    for name, (metric_type, help_text) in METRICS_HELP.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        if metric_type == 'histogram':
+            for (metric_name, labels), (bucket_counts, total, buckets) in sorted(histograms.items()):
+                if metric_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], bucket_counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", str(bound)),))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+        else:
+            values = counters if metric_type == 'counter' else gauges
+            for (metric_name, labels), value in sorted(values.items()):
+                if metric_name == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+    return Response('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# ----- 准入控制 -----
+# 每个客户端（按 remote_addr；部署在反向代理后面时需要用 ProxyFix 还原真实地址）一个令牌桶，
+# 令牌按 RATE_LIMIT_PER_MINUTE 匀速补充，不够时返回 429。令牌桶和排队任务数都是进程内的，
+# 多个工作进程时各自计数；同时运行的 PyInstaller 进程数通过文件锁在整台机器上共享。
+_rate_buckets = OrderedDict()  # 客户端 -> [令牌数, 上次补充的时间]，最久未访问的在最前面
+_rate_buckets_lock = threading.Lock()
+_build_duration_avg = None  # 最近打包耗时的指数加权平均（秒），用于估计 Retry-After
+
+def _refill_bucket(client):
+    """补充令牌后返回客户端的令牌桶（调用方持有 _rate_buckets_lock）"""
+    now = time.monotonic()
+    bucket = _rate_buckets.pop(client, None) or [float(RATE_LIMIT_BURST), now]
+    bucket[0] = min(RATE_LIMIT_BURST, bucket[0] + (now - bucket[1]) * RATE_LIMIT_PER_MINUTE / 60)
+    bucket[1] = now
+    _rate_buckets[client] = bucket
+    if len(_rate_buckets) > RATE_LIMIT_MAX_CLIENTS:
+        _rate_buckets.popitem(last=False)
+    return bucket
+
+def _take_tokens(client, cost):
+    """从客户端的令牌桶中取出 cost 个令牌，成功返回 0，否则返回需要等待的秒数"""
+    with _rate_buckets_lock:
+        bucket = _refill_bucket(client)
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return 0
+        return math.ceil((cost - bucket[0]) / (RATE_LIMIT_PER_MINUTE / 60))
+
+def charge_rate_tokens(cost):
+    """按请求实际提交的工作量追加扣除当前客户端的令牌。令牌可以变为负数，之后的请求要等令牌补回来"""
+    if RATE_LIMIT_PER_MINUTE > 0 and cost > 0:
+        with _rate_buckets_lock:
+            _refill_bucket(request.remote_addr or '-')[0] -= cost
+
+def overloaded_response(status, message, retry_after, reason):
+    """429/503 响应，带 Retry-After 头"""
+    metrics_inc('app_admission_rejected_total', reason=reason)
+    logger.info(f"Rejected {request.path} from {request.remote_addr}: {reason}, retry after {retry_after}s")
+    return (jsonify({'status': 'error', 'message': message, 'retry_after': retry_after}), status,
+            {'Retry-After': str(retry_after)})
+
+def rate_limited(cost=1):
+    """路由装饰器：按客户端限速，令牌不够时返回 429"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if RATE_LIMIT_PER_MINUTE > 0:
+                retry_after = _take_tokens(request.remote_addr or '-', min(cost, RATE_LIMIT_BURST))
+                if retry_after:
+                    return overloaded_response(429, f'请求过于频繁，请 {retry_after} 秒后再试', retry_after, 'rate_limit')
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _pending_build_jobs():
+    with _build_jobs_lock:
+        return sum(1 for job in _build_jobs.values() if job['state'] in ('queued', 'running'))
+
+def build_backlog_capacity():
+    """本进程还能接收的打包任务数，不限制时返回 None"""
+    if BUILD_MAX_PENDING <= 0:
+        return None
+    return max(0, BUILD_MAX_PENDING - _pending_build_jobs())
+
+def build_backlog_wait(jobs):
+    """按最近的平均打包耗时，估计队列中再腾出 jobs 个位置所需的秒数"""
+    average = _build_duration_avg or 60
+    return max(1, min(3600, math.ceil(average * jobs / BUILD_MAX_CONCURRENCY)))
+
+def build_backlog_retry_after():
+    """本进程排队和运行中的打包任务达到 BUILD_MAX_PENDING 时返回建议等待的秒数，否则返回 0"""
+    if BUILD_MAX_PENDING <= 0:
+        return 0
+    pending = _pending_build_jobs()
+    if pending < BUILD_MAX_PENDING:
+        return 0
+    return build_backlog_wait(pending - BUILD_MAX_PENDING + 1)
+
+def admit_builds(view):
+    """路由装饰器：打包队列已满时返回 503"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        retry_after = build_backlog_retry_after()
+        if retry_after:
+            return overloaded_response(503, f'打包队列已满，请 {retry_after} 秒后再试', retry_after, 'build_backlog')
+        return view(*args, **kwargs)
+    return wrapper
+
+def _record_build_duration(seconds):
+    global _build_duration_avg
+    _build_duration_avg = seconds if _build_duration_avg is None else 0.8 * _build_duration_avg + 0.2 * seconds
+
+# ----- 程序元数据 (SQLite) -----
+# 所有程序的信息保存在一个 SQLite 数据库中（WAL 模式，读写互不阻塞，多个工作进程可以同时访问）。
+# 添加程序时先插入一条 build_status='building' 的记录占用程序名，打包成功后更新为 'succeeded'，
+# 失败则删除；程序列表和 /api/programs 只返回打包成功的程序。路径统一使用 / 分隔符。
+# 旧版本的 programs/<name>/info.json 在第一次启动时一次性导入。
+PROGRAMS_DB = Path(os.environ.get('PROGRAMS_DB', 'programs.db'))
+PROGRAM_SCHEMA = """
+CREATE TABLE IF NOT EXISTS programs (
+    name TEXT PRIMARY KEY,
+    language TEXT NOT NULL,
+    source_file TEXT NOT NULL,                      -- 相对于 programs/
+    exe_path TEXT,                                  -- 相对于 exe_programs/
+    icon TEXT NOT NULL,                             -- 相对于 static/
+    icon_thumbs TEXT NOT NULL DEFAULT '{}',         -- JSON: {"48": ..., "96": ...}
+    build_status TEXT NOT NULL,                     -- building / succeeded
+    build_job_id TEXT,
+    artifact_sha256 TEXT,
+    artifact_size INTEGER,
+    created_at REAL NOT NULL,
+    last_run REAL,
+    version INTEGER NOT NULL DEFAULT 1,             -- 每次通过 /update_program 重新打包后加一
+    backend TEXT NOT NULL DEFAULT 'pyinstaller'     -- 打包后端，决定产物的启动方式
+);
+CREATE INDEX IF NOT EXISTS programs_by_created ON programs (created_at, name);
+CREATE INDEX IF NOT EXISTS programs_by_last_run ON programs (coalesce(last_run, 0), name);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,                        -- 文件保存在 artifact_store/<前两位>/<sha256>
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL                       -- 引用该文件的程序数，减到 0 时删除
+);
+CREATE TABLE IF NOT EXISTS artifact_files (        -- 目录形式的产物中除可执行文件以外的文件
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,                             -- 相对于 exe_programs/
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (name, path)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+PROGRAM_COLUMNS = ('name', 'language', 'source_file', 'exe_path', 'icon', 'icon_thumbs', 'build_status',
+                   'build_job_id', 'artifact_sha256', 'artifact_size', 'created_at', 'last_run', 'version', 'backend')
+# 在已有数据库上补充的列：列名 -> 列定义
+PROGRAM_ADDED_COLUMNS = {
+    'version': 'INTEGER NOT NULL DEFAULT 1',
+    'backend': "TEXT NOT NULL DEFAULT 'pyinstaller'",
+}
+_db_local = threading.local()  # 每个线程一个连接；fork 后在子进程中重建
+_thumbnail_backfill_started = False
+
+def open_program_db(path=None):
+    """打开数据库连接并确保表结构存在；事务由 db_transaction() 显式控制"""
+    conn = sqlite3.connect(path or PROGRAMS_DB, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')  # WAL 下只在检查点时 fsync，断电最多丢失最近的事务
+    conn.executescript(PROGRAM_SCHEMA)
+    existing = {row['name'] for row in conn.execute('PRAGMA table_info(programs)')}
+    for column, definition in PROGRAM_ADDED_COLUMNS.items():
+        if column not in existing:
+            try:
+                conn.execute(f'ALTER TABLE programs ADD COLUMN {column} {definition}')
+            except sqlite3.OperationalError:
+                pass  # 另一个进程刚刚添加了这一列
+    return conn
+
+def get_db():
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None:
+        conn = _db_local.conn = open_program_db()
+    return conn
+
+@contextlib.contextmanager
+def db_transaction(conn=None):
+    """写事务：BEGIN IMMEDIATE 一开始就拿到写锁，避免读后写升级时的死锁"""
+    conn = conn or get_db()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+def _program_from_row(row):
+    program_info = dict(row)
+    program_info['icon_thumbs'] = json.loads(program_info['icon_thumbs'] or '{}')
+    return program_info
+
+def upsert_program(conn, program_info):
+    """写入一个程序的完整记录（调用方负责事务）"""
+    values = dict(program_info)
+    values['icon_thumbs'] = json.dumps(values.get('icon_thumbs') or {}, sort_keys=True)
+    values.setdefault('build_status', 'succeeded')
+    values.setdefault('version', 1)
+    values.setdefault('backend', 'pyinstaller')
+    row = [values.get(column) for column in PROGRAM_COLUMNS]
+    conn.execute(f"INSERT OR REPLACE INTO programs ({', '.join(PROGRAM_COLUMNS)}) "
+                 f"VALUES ({', '.join('?' * len(PROGRAM_COLUMNS))})", row)
+
+def get_program(program_name):
+    """按名称查询程序（包括正在打包的），不存在时返回 None"""
+    row = get_db().execute('SELECT * FROM programs WHERE name = ?', (program_name,)).fetchone()
+    return _program_from_row(row) if row else None
+
+def list_programs():
+    """返回所有打包成功的程序，按名称排序"""
+    rows = get_db().execute("SELECT * FROM programs WHERE build_status = 'succeeded' ORDER BY name").fetchall()
+    return [_program_from_row(row) for row in rows]
+
+def count_programs():
+    return get_db().execute("SELECT count(*) FROM programs WHERE build_status = 'succeeded'").fetchone()[0]
+
+def _program_conflict(row):
+    """已有记录时返回冲突原因；打包任务已结束（或所在进程已退出）的 building 记录视为残留，返回 None"""
+    if row['build_status'] == 'succeeded':
+        return f'程序 "{row["name"]}" 已存在'
+    job = get_build_job(row['build_job_id']) if row['build_job_id'] else None
+    if job and job['state'] in ('queued', 'running'):
+        return f'程序 "{row["name"]}" 正在打包中，请稍后'
+    return None
+
+def reserve_program(program_name, language, source_file, icon_filename, job_id, backend):
+    """插入 building 状态的记录占用程序名，返回错误信息或 None"""
+    with db_transaction() as conn:
+        row = conn.execute('SELECT * FROM programs WHERE name = ?', (program_name,)).fetchone()
+        if row is not None:
+            conflict = _program_conflict(row)
+            if conflict:
+                return conflict
+            logger.warning(f"Replacing stale record of unfinished build: {program_name}")
+        upsert_program(conn, {
+            'name': program_name,
+            'language': language,
+            'source_file': source_file,
+            'icon': icon_filename,
+            'build_status': 'building',
+            'build_job_id': job_id,
+            'backend': backend,
+            'created_at': time.time(),
+        })
+    return None
+
+def complete_program_build(program_name, job_id, exe_path, icon, icon_thumbs, backend):
+    """打包成功后更新记录并把产物收入存储区，返回更新后的程序信息；记录已被删除（打包期间被清理）时返回 None"""
+    # 在事务外计算哈希
+    artifact_path, artifact_sha256, artifact_size = _artifact_fields(exe_path)
+    extra_files = _artifact_extra_files(artifact_path, backend)
+    if artifact_size is not None:
+        artifact_size += sum(size for _, _, _, size in extra_files)
+    with db_transaction() as conn:
+        updated = conn.execute(
+            "UPDATE programs SET build_status = 'succeeded', exe_path = ?, icon = ?, icon_thumbs = ?, "
+            "artifact_sha256 = ?, artifact_size = ?, created_at = ? "
+            "WHERE name = ? AND build_status = 'building' AND build_job_id = ?",
+            (exe_path, icon, json.dumps(icon_thumbs, sort_keys=True), artifact_sha256, artifact_size, time.time(),
+             program_name, job_id),
+        ).rowcount
+        if updated and artifact_sha256:
+            store_artifact(conn, artifact_path, artifact_sha256)
+            store_artifact_files(conn, program_name, extra_files)
+    return get_program(program_name) if updated else None
+
+def claim_program_update(program_name, job_id):
+    """把更新任务记录到打包成功的程序上（同一程序同时只能有一个更新任务），返回 (程序信息, 错误信息)"""
+    with db_transaction() as conn:
+        row = conn.execute('SELECT * FROM programs WHERE name = ?', (program_name,)).fetchone()
+        if row is None:
+            return None, f'程序 "{program_name}" 不存在'
+        job = get_build_job(row['build_job_id']) if row['build_job_id'] else None
+        if row['build_status'] != 'succeeded' or (job and job['state'] in ('queued', 'running')):
+            return None, f'程序 "{program_name}" 正在打包中，请稍后'
+        conn.execute('UPDATE programs SET build_job_id = ? WHERE name = ?', (job_id, program_name))
+    return _program_from_row(row), None
+
+def swap_program_artifact(program_name, job_id, exe_path, version, backend):
+    """更新任务打包成功后换上新产物，返回换下来的旧记录；程序已被删除或任务已失效时返回 None"""
+    artifact_path, artifact_sha256, artifact_size = _artifact_fields(exe_path)
+    extra_files = _artifact_extra_files(artifact_path, backend)
+    if artifact_size is not None:
+        artifact_size += sum(size for _, _, _, size in extra_files)
+    with db_transaction() as conn:
+        row = conn.execute("SELECT * FROM programs WHERE name = ? AND build_status = 'succeeded' AND build_job_id = ?",
+                           (program_name, job_id)).fetchone()
+        if row is None:
+            return None
+        old_files = conn.execute('SELECT path, sha256 FROM artifact_files WHERE name = ?', (program_name,)).fetchall()
+        conn.execute('UPDATE programs SET exe_path = ?, artifact_sha256 = ?, artifact_size = ?, version = ?, backend = ? '
+                     'WHERE name = ?', (exe_path, artifact_sha256, artifact_size, version, backend, program_name))
+        # 先增加新产物的引用再释放旧的，新旧内容相同时存储区文件不会被删除
+        if artifact_sha256:
+            store_artifact(conn, artifact_path, artifact_sha256)
+            store_artifact_files(conn, program_name, extra_files)
+        if row['artifact_sha256']:
+            release_artifact(conn, row['artifact_sha256'])
+        release_artifact_files(conn, program_name, old_files)
+    return _program_from_row(row)
+
+def set_program_icon(program_name, icon, icon_thumbs):
+    """更换程序图标，返回旧的 (图标, 缩略图)；程序不存在时返回 None"""
+    with db_transaction() as conn:
+        row = conn.execute('SELECT icon, icon_thumbs FROM programs WHERE name = ?', (program_name,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE programs SET icon = ?, icon_thumbs = ? WHERE name = ?',
+                     (icon, json.dumps(icon_thumbs, sort_keys=True), program_name))
+    return row['icon'], json.loads(row['icon_thumbs'] or '{}')
+
+def discard_program(program_name, job_id):
+    """删除本任务占用的 building 记录（打包失败时调用）"""
+    with db_transaction() as conn:
+        conn.execute("DELETE FROM programs WHERE name = ? AND build_status = 'building' AND build_job_id = ?",
+                     (program_name, job_id))
+
+def remove_programs(program_names=None):
+    """在一个事务中删除若干程序（None 表示全部）的记录并释放产物引用，返回被删除的记录"""
+    with db_transaction() as conn:
+        if program_names is None:
+            rows = conn.execute('SELECT * FROM programs').fetchall()
+            conn.execute('DELETE FROM programs')
+        else:
+            rows = []
+            for program_name in program_names:
+                row = conn.execute('SELECT * FROM programs WHERE name = ?', (program_name,)).fetchone()
+                if row is not None:
+                    conn.execute('DELETE FROM programs WHERE name = ?', (program_name,))
+                    rows.append(row)
+        for row in rows:
+            if row['build_status'] == 'succeeded' and row['artifact_sha256']:
+                release_artifact(conn, row['artifact_sha256'])
+            release_artifact_files(conn, row['name'])
+    return [_program_from_row(row) for row in rows]
+
+def record_program_run(program_name):
+    """记录程序的最近运行时间，供按最近运行排序使用"""
+    try:
+        with db_transaction() as conn:
+            conn.execute('UPDATE programs SET last_run = ? WHERE name = ?', (time.time(), program_name))
+    except sqlite3.Error as e:
+        logger.warning(f"Error recording last run for {program_name}: {e}")
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _artifact_fields(exe_path):
+    """可执行文件的 (路径, 哈希, 大小)（exe_path 的解析规则同 resolve_exe_path），文件不存在时为 None"""
+    artifact, _ = resolve_exe_path({'exe_path': exe_path}) if exe_path else (None, None)
+    if artifact is None or not artifact.is_file():
+        return None, None, None
+    return artifact, file_sha256(artifact), artifact.stat().st_size
+
+def migrate_info_json():
+    """一次性导入旧版本的 programs/<name>/info.json（已导入过则跳过），返回导入的程序数"""
+    with db_transaction() as conn:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'info_json_migrated'").fetchone():
+            return 0
+        imported = 0
+        programs_dir = Path(PROGRAMS_DIR)
+        for info_file in sorted(programs_dir.glob('*/info.json')):
+            try:
+                with open(info_file, 'r', encoding='utf-8') as f:
+                    program_info = json.load(f)
+            except Exception as e:
+                logger.warning(f"Error reading program info {info_file}: {e}")
+                continue
+            program_name = info_file.parent.name
+            # 旧记录可能使用 Windows 路径分隔符，也可能没有时间字段（创建时间取 info.json 的修改时间）
+            exe_path = (program_info.get('exe_path') or '').replace('\\', '/') or None
+            icon = program_info.get('icon') or 'placeholder_icon.png'
+            icon_thumbs = program_info.get('icon_thumbs') or {}
+            if not (Path('static') / icon).exists():
+                icon, icon_thumbs = 'placeholder_icon.png', {}
+            elif any(not (Path('static') / thumb).exists() for thumb in icon_thumbs.values()):
+                icon_thumbs = {}  # 缩略图丢失时改用原图，后台会重新生成
+            _, artifact_sha256, artifact_size = _artifact_fields(exe_path)
+            upsert_program(conn, {
+                'name': program_name,
+                'language': program_info.get('language', 'python'),
+                'source_file': (program_info.get('source_file') or f'{program_name}/source.py').replace('\\', '/'),
+                'exe_path': exe_path,
+                'icon': icon,
+                'icon_thumbs': icon_thumbs,
+                'artifact_sha256': artifact_sha256,
+                'artifact_size': artifact_size,
+                'created_at': program_info.get('created_at') or info_file.stat().st_mtime,
+                'last_run': program_info.get('last_run'),
+            })
+            imported += 1
+        conn.execute("INSERT INTO meta (key, value) VALUES ('info_json_migrated', ?)", (str(time.time()),))
+    if imported:
+        logger.info(f"Imported {imported} program(s) from info.json into {PROGRAMS_DB}")
+    return imported
+
+# ----- 产物存储 (内容寻址) -----
+# 打包产物按 SHA-256 保存在 artifact_store/ 中，每个程序的 exe_programs/<name>/ 下放的是它的硬链接，
+# 内容相同的产物在磁盘上只占一份空间。blobs 表记录每个文件被多少个程序引用，删除程序时减一，
+# 减到 0 才删除存储区中的文件。存储区文件设为只读，防止通过某一个硬链接原地修改所有程序的产物。
+# 引用计数和文件操作都在数据库写事务中进行，多个工作进程之间不会互相覆盖。
+def artifact_blob_path(sha256):
+    return ARTIFACT_STORE_DIR / sha256[:2] / sha256
+
+def _link_or_copy(src, dst):
+    """让 dst 成为 src 的硬链接（文件系统不支持时复制）；先写临时文件再替换，dst 始终是完整的"""
+    tmp = dst.with_name(f'.{dst.name}.{uuid.uuid4().hex}')
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+
+def store_artifact(conn, path, sha256):
+    """把 path 处的文件收入存储区，path 换成存储区文件的硬链接，引用计数加一（调用方负责事务）"""
+    path = Path(path)
+    blob = artifact_blob_path(sha256)
+    if blob.exists():
+        if not os.path.samefile(blob, path):
+            _link_or_copy(blob, path)
+    else:
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        _link_or_copy(path, blob)
+        if os.name != 'nt':  # Windows 下只读属性会导致文件无法删除
+            os.chmod(blob, 0o555)
+    conn.execute('INSERT INTO blobs (sha256, size, refcount) VALUES (?, ?, 1) '
+                 'ON CONFLICT (sha256) DO UPDATE SET refcount = refcount + 1',
+                 (sha256, blob.stat().st_size))
+
+def release_artifact(conn, sha256):
+    """引用计数减一，不再被引用时删除存储区中的文件（调用方负责事务）"""
+    conn.execute('UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = ?', (sha256,))
+    if conn.execute('SELECT 1 FROM blobs WHERE sha256 = ? AND refcount <= 0', (sha256,)).fetchone():
+        conn.execute('DELETE FROM blobs WHERE sha256 = ?', (sha256,))
+        try:
+            artifact_blob_path(sha256).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Error removing artifact blob {sha256}: {e}")
+
+def _artifact_extra_files(artifact_path, backend):
+    """目录形式的产物（onedir）中除可执行文件以外的文件，返回 [(绝对路径, 相对于 exe_programs/ 的路径, sha256, 大小)]"""
+    if artifact_path is None or not PACKAGING_BACKENDS.get(backend, {}).get('tree'):
+        return []
+    files = []
+    for root, dirs, names in os.walk(artifact_path.parent):
+        for name in sorted(names):
+            path = Path(root) / name
+            if path == artifact_path or path.is_symlink():
+                continue
+            files.append((path, os.path.relpath(path, EXE_DIR).replace('\\', '/'), file_sha256(path), path.stat().st_size))
+    return files
+
+def store_artifact_files(conn, program_name, files):
+    """把目录产物中的文件逐个收入存储区（调用方负责事务）"""
+    for path, relative, sha256, _ in files:
+        store_artifact(conn, path, sha256)
+        conn.execute('INSERT OR REPLACE INTO artifact_files (name, path, sha256) VALUES (?, ?, ?)',
+                     (program_name, relative, sha256))
+
+def release_artifact_files(conn, program_name, rows=None):
+    """释放程序目录产物中文件的引用；rows 为要释放的 (path, sha256) 记录，默认全部（调用方负责事务）"""
+    if rows is None:
+        rows = conn.execute('SELECT path, sha256 FROM artifact_files WHERE name = ?', (program_name,)).fetchall()
+    for row in rows:
+        conn.execute('DELETE FROM artifact_files WHERE name = ? AND path = ?', (program_name, row['path']))
+        release_artifact(conn, row['sha256'])
+
+def artifact_store_totals():
+    """逻辑大小（每个程序各算一份）与实际占用（每个不同的文件只算一份）"""
+    blobs, references, logical, physical = get_db().execute(
+        'SELECT count(*), coalesce(sum(refcount), 0), coalesce(sum(size * refcount), 0), coalesce(sum(size), 0) '
+        'FROM blobs').fetchone()
+    return {'blobs': blobs, 'references': references, 'logical_bytes': logical, 'physical_bytes': physical,
+            'saved_bytes': logical - physical}
+
+def migrate_artifact_store():
+    """一次性把已有程序的产物收入存储区（已执行过则跳过），返回处理的程序数"""
+    with db_transaction() as conn:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'artifact_store_migrated'").fetchone():
+            return 0
+        stored = 0
+        for row in conn.execute("SELECT name, exe_path FROM programs WHERE build_status = 'succeeded'").fetchall():
+            try:
+                artifact_path, artifact_sha256, artifact_size = _artifact_fields(row['exe_path'])
+                if artifact_sha256:
+                    store_artifact(conn, artifact_path, artifact_sha256)
+                    stored += 1
+            except OSError as e:
+                logger.warning(f"Error moving artifact of {row['name']} into the store: {e}")
+                artifact_sha256 = artifact_size = None
+            conn.execute('UPDATE programs SET artifact_sha256 = ?, artifact_size = ? WHERE name = ?',
+                         (artifact_sha256, artifact_size, row['name']))
+        conn.execute("INSERT INTO meta (key, value) VALUES ('artifact_store_migrated', ?)", (str(time.time()),))
+    if stored:
+        logger.info(f"Moved {stored} existing artifact(s) into {ARTIFACT_STORE_DIR}")
+    return stored
+
+# 路由: 产物存储统计
+@bp.route('/storage_report')
+def storage_report():
+    report = artifact_store_totals()
+    report['dedup_ratio'] = round(report['logical_bytes'] / report['physical_bytes'], 2) if report['physical_bytes'] else None
+    report['exe_programs_disk_bytes'] = _exe_programs_disk_usage()
+    # 被引用最多的文件，便于了解哪些产物被共享
+    report['top_shared'] = [dict(row) for row in get_db().execute(
+        'SELECT sha256, size, refcount FROM blobs WHERE refcount > 1 ORDER BY size * (refcount - 1) DESC LIMIT 10')]
+    return jsonify({'status': 'success', 'storage': report})
+
+def _start_thumbnail_backfill():
+    """第一次请求程序列表时，在后台为缺少缩略图的程序生成缩略图"""
+    global _thumbnail_backfill_started
+    if _thumbnail_backfill_started or Image is None:
+        return
+    _thumbnail_backfill_started = True
+    pending = get_db().execute(
+        "SELECT 1 FROM programs WHERE icon_thumbs = '{}' AND icon != 'placeholder_icon.png' LIMIT 1").fetchone()
+    if pending:
+        threading.Thread(target=_backfill_icon_thumbnails, name='thumbnail-backfill', daemon=True).start()
 
 # 路由: 网站主页
-@app.route('/')
+# 程序列表由 script.js 通过 /api/programs 分页加载
+@bp.route('/')
 def index():
-    programs_dir = Path(PROGRAMS_DIR)
-    programs = []
-    if programs_dir.exists():
-        for program_dir in programs_dir.iterdir():
-            if program_dir.is_dir():
-                info_file = program_dir / 'info.json'
-                if info_file.exists():
-                    try:
-                        with open(info_file, 'r', encoding='utf-8') as f:
-                            program_info = json.load(f)
-                            # Ensure icon path exists, otherwise use placeholder
-                            icon_static_path = Path('static') / program_info.get('icon', 'placeholder_icon.png')
-                            if not icon_static_path.exists():
-                                program_info['icon'] = 'placeholder_icon.png'
-                            programs.append(program_info)
-                    except Exception as e:
-                        print(f"Error reading program info {info_file}: {e}")
-    return render_template('index.html', programs=programs)
+    return render_template('index.html')
+
+# ----- 程序列表 API -----
+# 游标分页：游标记录上一页最后一项的排序键，下一页从它之后开始，翻页期间增删程序不会导致重复或遗漏。
+# 排序键以程序名结尾，保证顺序唯一；每种排序都有对应的索引，查询一页只读取 limit + 1 行。
+API_SORT_FIELDS = {
+    'name': ('name',),
+    'created': ('created_at', 'name'),
+    'last_run': ('coalesce(last_run, 0)', 'name'),
+}
+API_PROGRAM_FIELDS = ('name', 'language', 'backend', 'icon', 'icon_thumbs', 'created_at', 'last_run')
+
+def _encode_cursor(sort_key):
+    return base64.urlsafe_b64encode(json.dumps(list(sort_key)).encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    sort_key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    # 游标来自客户端，每一项都会作为 SQL 参数绑定，只接受 SQLite 能绑定的标量
+    if not isinstance(sort_key, list) or not all(
+            value is None or isinstance(value, (str, float)) or (isinstance(value, int) and -2 ** 63 <= value < 2 ** 63)
+            for value in sort_key):
+        raise ValueError('invalid cursor')
+    return tuple(sort_key)
+
+# 路由: 程序列表（JSON，分页）
+# 参数: limit, cursor, prefix (程序名前缀，不区分大小写), sort (name/created/last_run), order (asc/desc)
+@bp.route('/api/programs')
+def api_programs():
+    sort = request.args.get('sort', 'name')
+    if sort not in API_SORT_FIELDS:
+        return jsonify({'status': 'error', 'message': f'不支持的排序方式：{sort}'}), 400
+    # 按时间排序时默认最新的在前
+    order = request.args.get('order', 'asc' if sort == 'name' else 'desc')
+    if order not in ('asc', 'desc'):
+        return jsonify({'status': 'error', 'message': f'不支持的排序顺序：{order}'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', API_PAGE_DEFAULT_LIMIT)), 1), API_PAGE_MAX_LIMIT)
+        cursor = request.args.get('cursor')
+        after = _decode_cursor(cursor) if cursor else None
+    except (ValueError, TypeError, json.JSONDecodeError):
+        return jsonify({'status': 'error', 'message': '分页参数无效'}), 400
+
+    columns = API_SORT_FIELDS[sort]
+    if after is not None and len(after) != len(columns):
+        return jsonify({'status': 'error', 'message': '分页参数无效'}), 400
+    where = ["build_status = 'succeeded'"]
+    params = []
+    prefix = request.args.get('prefix', '')
+    if prefix:
+        # LIKE 不区分大小写；转义前缀中的通配符
+        where.append("name LIKE ? ESCAPE '\\'")
+        params.append(prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+    if after is not None:
+        where.append(f"({', '.join(columns)}) {'>' if order == 'asc' else '<'} ({', '.join('?' * len(columns))})")
+        params.extend(after)
+    direction = 'ASC' if order == 'asc' else 'DESC'
+    rows = get_db().execute(
+        f"SELECT *, {columns[0]} AS sort_value FROM programs WHERE {' AND '.join(where)} "
+        f"ORDER BY {', '.join(f'{column} {direction}' for column in columns)} LIMIT ?",
+        params + [limit + 1],
+    ).fetchall()
+    page = [_program_from_row(row) for row in rows[:limit]]
+    last = rows[limit - 1] if len(rows) > limit else None
+    _start_thumbnail_backfill()
+
+    body = json.dumps({
+        'status': 'success',
+        'programs': [{field: info.get(field) for field in API_PROGRAM_FIELDS} for info in page],
+        'next_cursor': _encode_cursor((last['sort_value'], last['name'])[-len(columns):]) if last else None,
+    }, ensure_ascii=False, sort_keys=True)
+    response = Response(body, mimetype='application/json')
+    # 强 ETag 由响应内容决定：内容不变时客户端带 If-None-Match 重新验证得到 304
+    response.set_etag(hashlib.sha256(body.encode('utf-8')).hexdigest())
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+# ----- 新程序的校验与保存 -----
+# /add_program 和批量导入共用：先无副作用地校验，再写入 programs/<name>/ 并保存图标
+def check_program_name(program_name):
+    """程序名只能包含字母、数字和下划线，返回错误信息或 None"""
+    if not program_name:
+        return '程序名称不能为空'
+    # Allow underscores in program names
+    if not all(c.isalnum() or c == '_' for c in program_name):
+        return '程序名称只能包含字母、数字和下划线'
+    return None
+
+# ----- 字节码缓存 -----
+# 添加程序时把源码编译一次，代码对象按 .pyc 格式（与 py_compile 的 UNCHECKED_HASH 相同）保存在
+# bytecode_cache/ 中，文件名是“解释器版本 (MAGIC_NUMBER) + 源码”的 SHA-256。之后的校验、打包前的语法检查
+# 只需计算哈希、确认缓存存在；解释运行时工作进程直接读取代码对象，不再解析源码。
+# 内容相同的源码共用一个缓存文件，写入是原子的（临时文件 + os.replace），多个线程或进程同时写入也没有问题。
+# 删除程序、换上新源码或打包失败时，旧源码对应的缓存文件移入回收站，缓存目录不会无限增长。
+def bytecode_cache_key(source_bytes):
+    return hashlib.sha256(importlib.util.MAGIC_NUMBER + source_bytes.replace(b'\r\n', b'\n')).hexdigest()
+
+def bytecode_cache_path(cache_key):
+    return BYTECODE_CACHE_DIR / cache_key[:2] / f'{cache_key}.pyc'
+
+def compile_cached(source, filename):
+    """
+    校验并编译 Python 源码（str 或 UTF-8 编码的 bytes），返回缓存的 .pyc 路径。
+    缓存已存在时不解析源码；有语法错误时抛出 SyntaxError，不写入缓存。
+    """
+    source_text = source if isinstance(source, str) else source.decode('utf-8')
+    # 表单提交的代码是 CRLF，从文件按文本读出的是 LF，两者编译结果相同，使用同一个缓存
+    source_bytes = source_text.replace('\r\n', '\n').encode('utf-8')
+    pyc_path = bytecode_cache_path(bytecode_cache_key(source_bytes))
+    if pyc_path.exists():
+        return pyc_path
+    code = compile(source_text, filename, 'exec', dont_inherit=True)
+    data = (importlib.util.MAGIC_NUMBER + (0b01).to_bytes(4, 'little')
+            + importlib.util.source_hash(source_bytes) + marshal.dumps(code))
+    try:
+        pyc_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = pyc_path.with_name(f'.{pyc_path.name}-{uuid.uuid4().hex[:8]}.tmp')
+        tmp_file.write_bytes(data)
+        os.replace(tmp_file, pyc_path)
+    except OSError as e:
+        logger.warning(f"Failed to write bytecode cache {pyc_path}: {e}")  # 只影响之后是否需要重新编译
+    return pyc_path
+
+def discard_bytecode(source_path, replacement=None):
+    """
+    把 source_path 当前内容对应的缓存文件移入回收站；replacement 是将要换上的新源码，编译结果相同时保留。
+    内容相同的其他程序也使用这个文件，它们下次运行时重新编译。
+    """
+    try:
+        cache_key = bytecode_cache_key(Path(source_path).read_bytes())
+        if replacement is not None and bytecode_cache_key(Path(replacement).read_bytes()) == cache_key:
+            return
+        move_to_trash(bytecode_cache_path(cache_key), 'pyc')
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Error discarding bytecode cache for {source_path}: {e}")
+
+def compile_uploaded_source(upload_source, filename):
+    """校验流式上传的源码（见“流式上传”一节）：上传时已算好缓存键，命中时不读取文件"""
+    pyc_path = bytecode_cache_path(upload_source['cache_key'])
+    if pyc_path.exists():
+        return pyc_path
+    return compile_cached(Path(upload_source['path']).read_bytes(), filename)
+
+def validate_new_program(program_name, program_code, program_language, upload_source=None, cache_bytecode=True):
+    """
+    检查新程序能否添加（除字节码缓存外不修改任何文件），返回错误信息或 None。
+    源码已经流式上传到暂存文件时，program_code 为 None，upload_source 是暂存文件的信息。
+    cache_bytecode=False 时只检查语法，不写入字节码缓存。
+    """
+    error_message = check_program_name(program_name)
+    if error_message:
+        return error_message
+
+    if program_language != 'python': # Only support python now
+        return f'不支持的编程语言：{program_language}'
+
+    # 数据库中没有记录的程序目录视为损坏目录，保存时会被清理
+    row = get_db().execute('SELECT * FROM programs WHERE name = ?', (program_name,)).fetchone()
+    if row is not None:
+        conflict = _program_conflict(row)
+        if conflict:
+            return conflict
+
+    # Check Python syntax before saving（编译结果写入字节码缓存，打包和运行时直接复用）
+    try:
+        if upload_source:
+            compile_uploaded_source(upload_source, f'{program_name}/source.py')
+        elif cache_bytecode:
+            compile_cached(program_code, f'{program_name}/source.py')
+        else:
+            compile(program_code, f'{program_name}/source.py', 'exec', dont_inherit=True)
+    except SyntaxError as e:
+        return f'Python代码语法错误：{str(e)}'
+    except UnicodeDecodeError:
+        return '源代码不是有效的 UTF-8 文本'
+    return None
+
+def stage_program_source(program_name, program_code, program_language, job_id, backend=DEFAULT_PACKAGING_BACKEND,
+                         upload_source=None):
+    """
+    占用程序名并写入源代码（调用前应先通过 validate_new_program），返回 (源文件路径, 错误信息)。
+    job_id 是随后提交的打包任务 ID，用于判断 building 记录是否仍然有效。
+    upload_source 是流式上传的暂存文件，直接移动到位，不再重新写入。
+    """
+    program_dir = Path(PROGRAMS_DIR) / program_name
+    extension = SUPPORTED_LANGUAGES[program_language]['extension']
+    # 插入记录是占用程序名的原子操作，两个请求同时添加同名程序时只有一个能成功
+    error_message = reserve_program(program_name, program_language, f'{program_name}/source{extension}',
+                                    'placeholder_icon.png', job_id, backend)
+    if error_message:
+        return None, error_message
+
+    # Clean up the directory if it's invalid/empty
+    if program_dir.exists() and program_dir.is_dir():
+        logger.warning(f"Removing potentially corrupt directory: {program_dir}")
+        try:
+            shutil.rmtree(program_dir)
+        except Exception as e:
+            logger.error(f"Error removing corrupt directory {program_dir}: {e}")
+            discard_program(program_name, job_id)
+            return None, f'无法清理已存在的损坏目录 "{program_name}"'
+
+    # Create program directory
+    try:
+         program_dir.mkdir(parents=True, exist_ok=True)
+    except Exception as e:
+         logger.error(f"Error creating directory {program_dir}: {e}")
+         discard_program(program_name, job_id)
+         return None, f'创建程序目录失败: {e}'
+
+    # Save source code
+    source_file = program_dir / f'source{extension}'
+    try:
+        if upload_source:
+            shutil.move(upload_source['path'], source_file)
+        else:
+            with open(source_file, 'w', encoding='utf-8') as f:
+                f.write(program_code)
+    except Exception as e:
+        logger.error(f"Error writing source file {source_file}: {e}")
+        # Clean up created directory if saving fails
+        shutil.rmtree(program_dir, ignore_errors=True)
+        discard_program(program_name, job_id)
+        return None, f'保存源代码失败: {e}'
+    return source_file, None
+
+def save_program_icon(original_filename, save):
+    """
+    保存上传的图标，返回相对于 static/ 的路径；没有图标、扩展名不允许或保存失败时返回占位图标。
+    save 是一个接收目标路径并写入文件的函数，例如 FileStorage.save。
+    """
+    if not original_filename:
+        return 'placeholder_icon.png'
+    # Basic check for allowed extensions
+    file_ext = os.path.splitext(original_filename)[1].lower()
+    if file_ext[1:] not in ALLOWED_EXTENSIONS: # Check without dot
+        logger.warning(f"Invalid icon extension: {file_ext}")
+        return 'placeholder_icon.png'
+    # Use UUID for unique filename to avoid conflicts
+    icon_filename = str(uuid.uuid4()) + file_ext
+    icon_save_path = UPLOAD_FOLDER / icon_filename
+    try:
+        save(icon_save_path)
+        logger.debug(f"Icon saved to: {icon_save_path}")
+    except Exception as e:
+        logger.error(f"Error saving icon {icon_filename}: {e}")
+        return 'placeholder_icon.png' # Revert to placeholder on save error
+    # Store path relative to static dir
+    return f"program_icons/{icon_filename}"
+
+# ----- 程序图标缩略图 -----
+# 原图可能有好几 MB，而页面上只显示 48px 的小图标。打包成功后把图标解码一次，
+# 缩放成 ICON_THUMB_SIZES 中的尺寸保存为 WebP，页面通过 srcset 按屏幕分辨率选择。
+# 没有安装 Pillow 或图片无法解码时不生成缩略图，页面继续使用原图。
+def make_icon_thumbnails(icon_relative):
+    """为 static/ 下的图标生成缩略图，返回 {尺寸字符串: 相对于 static/ 的路径}，失败时返回空字典"""
+    if Image is None or not icon_relative or icon_relative == 'placeholder_icon.png':
+        return {}
+    icon_path = Path('static') / icon_relative
+    thumbs = {}
+    try:
+        with Image.open(icon_path) as image:
+            if image.width * image.height > ICON_MAX_PIXELS:
+                logger.warning(f"Icon too large to thumbnail: {icon_path} ({image.width}x{image.height})")
+                return {}
+            image = ImageOps.exif_transpose(image).convert('RGBA')
+            for size in ICON_THUMB_SIZES:
+                thumb = image.copy()
+                thumb.thumbnail((size, size), Image.LANCZOS)
+                thumb_relative = f'{os.path.splitext(icon_relative)[0]}-{size}.webp'
+                thumb.save(Path('static') / thumb_relative, 'WEBP', quality=ICON_THUMB_QUALITY, method=6)
+                thumbs[str(size)] = thumb_relative
+    except Exception as e:
+        logger.warning(f"Error creating thumbnails for {icon_path}: {e}")
+        remove_icon_files(None, thumbs)
+        return {}
+    return thumbs
+
+def remove_icon_files(icon_relative, icon_thumbs=None):
+    """删除上传的图标及其缩略图（占位图标除外），返回错误信息列表"""
+    paths = list((icon_thumbs or {}).values())
+    if icon_relative and icon_relative != 'placeholder_icon.png':
+        paths.append(icon_relative)
+    errors = []
+    for relative in paths:
+        try:
+            (Path('static') / relative).unlink(missing_ok=True)
+        except Exception as e:
+            logger.warning(f"Error removing icon {relative}: {e}")
+            errors.append(str(e))
+    return errors
+
+def _backfill_icon_thumbnails():
+    """为升级前添加、还没有缩略图的程序补生成缩略图"""
+    for program_info in list_programs():
+        if program_info.get('icon_thumbs') or program_info.get('icon', 'placeholder_icon.png') == 'placeholder_icon.png':
+            continue
+        thumbs = make_icon_thumbnails(program_info['icon'])
+        if not thumbs:
+            continue
+        try:
+            with db_transaction() as conn:
+                updated = conn.execute(
+                    "UPDATE programs SET icon_thumbs = ? WHERE name = ? AND icon = ? AND icon_thumbs = '{}'",
+                    (json.dumps(thumbs, sort_keys=True), program_info['name'], program_info['icon'])).rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"Error saving thumbnails for {program_info['name']}: {e}")
+            updated = 0
+        if not updated:
+            remove_icon_files(None, thumbs)  # 程序已被删除，或者其他工作进程已经生成了缩略图
+            continue
+        logger.info(f"Created icon thumbnails for {program_info['name']}")
+
+# ----- 流式上传 -----
+# /add_program 和 /update_program 不使用 request.form/request.files：请求体按 UPLOAD_CHUNK_SIZE 分块读取，
+# 交给 werkzeug 的 MultipartDecoder 解析，code 字段（普通字段或文件均可）和 icon 文件边收边写入
+# upload_staging/ 中的暂存文件，源码同时计算字节码缓存键。每个上传的内存占用只有一个数据块，
+# 与上传大小无关。Content-Length 超过路由上限时不读取请求体直接拒绝；没有 Content-Length
+# （分块传输）时读到超过上限为止。
+_UPLOAD_WHITESPACE = b' \t\n\r\x0b\x0c'
+
+class _SourceStager:
+    """
+    把上传的源码分块写入暂存文件：换行统一为 LF，去掉首尾空白（相当于原来的 code.strip()），
+    同时按 compile_cached 的方式计算缓存键（解释器版本 + 源码的 SHA-256）。
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.size = 0  # 已写入的字节数（包括末尾暂时还不知道是否要去掉的空白）
+        self.content_end = 0  # 最后一个非空白字节之后的位置
+        self.pending_cr = False  # 上一块以 \r 结尾，可能与下一块开头的 \n 组成 CRLF
+        self._digest = hashlib.sha256(importlib.util.MAGIC_NUMBER)  # 包含所有已写入的字节
+        self._content_digest = self._digest.copy()  # 只到 content_end
+
+    def write(self, data):
+        if self.pending_cr:
+            data = b'\r' + data
+        self.pending_cr = data.endswith(b'\r')
+        if self.pending_cr:
+            data = data[:-1]
+        data = data.replace(b'\r\n', b'\n')
+        if not self.size:
+            data = data.lstrip(_UPLOAD_WHITESPACE)
+        if not data:
+            return
+        if self.size + len(data) > PROGRAM_SOURCE_MAX_BYTES:
+            raise RequestEntityTooLarge(f'源代码超过 {PROGRAM_SOURCE_MAX_BYTES // 1024}KB')
+        self.file.write(data)
+        content = data.rstrip(_UPLOAD_WHITESPACE)
+        if content:
+            self._digest.update(content)
+            self._content_digest = self._digest.copy()
+            self.content_end = self.size + len(content)
+        self._digest.update(data[len(content):])
+        self.size += len(data)
+
+    def finish(self):
+        """去掉末尾空白并关闭文件，返回 {'path', 'size', 'cache_key'}；源码为空时返回 None"""
+        self.file.truncate(self.content_end)
+        self.file.close()
+        if not self.content_end:
+            return None
+        return {'path': self.path, 'size': self.content_end, 'cache_key': self._content_digest.hexdigest()}
+
+    def close(self):
+        self.file.close()
+
+def _read_upload_chunks(limit):
+    """按块读取请求体，总量超过 limit 时抛出 RequestEntityTooLarge；结束时产生 None"""
+    received = 0
+    while True:
+        chunk = request.stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            yield None
+            return
+        received += len(chunk)
+        if received > limit:
+            raise RequestEntityTooLarge(f'上传内容超过 {limit // (1024 * 1024)}MB')
+        yield chunk
+
+@contextlib.contextmanager
+def receive_program_upload(limit=PROGRAM_UPLOAD_MAX_BYTES):
+    """
+    流式接收 /add_program、/update_program 的表单，产生
+    {'fields': {字段名: 文本}, 'source': 源码暂存文件信息或 None, 'icon': {'path', 'filename'} 或 None}。
+    暂存文件由调用方移动到最终位置，退出时删除剩下的暂存文件。请求体过大时抛出 RequestEntityTooLarge (413)，
+    格式错误时抛出 BadRequest (400)。
+    """
+    if request.content_length is not None and request.content_length > limit:
+        raise RequestEntityTooLarge(f'上传内容超过 {limit // (1024 * 1024)}MB')
+    UPLOAD_STAGING_DIR.mkdir(exist_ok=True)
+    prefix = uuid.uuid4().hex
+    upload = {'fields': {}, 'source': None, 'icon': None}
+    state = {'source': None, 'icon': None}  # 正在写入的暂存文件，异常退出时需要关闭
+    try:
+        if request.mimetype == 'multipart/form-data':
+            try:
+                _decode_multipart_upload(limit, prefix, upload, state)
+            except ValueError as e:
+                raise BadRequest(f'上传的表单无效：{e}') from e
+        else:
+            # 不是 multipart 的表单（例如 urlencoded）本身不会很大，由 werkzeug 解析后写入暂存文件
+            upload['fields'] = {name: value for name, value in request.form.items() if name != 'code'}
+            state['source'] = _SourceStager(UPLOAD_STAGING_DIR / f'{prefix}-source.tmp')
+            state['source'].write(request.form.get('code', '').encode('utf-8'))
+            upload['source'] = state['source'].finish()
+        yield upload
+    finally:
+        for staged in state.values():
+            if staged:
+                staged.close()
+        for leftover in UPLOAD_STAGING_DIR.glob(f'{prefix}-*'):
+            leftover.unlink(missing_ok=True)
+
+def _remove_stale_uploads():
+    """删除进程异常退出时遗留的暂存文件；较新的文件可能属于其他工作进程正在接收的上传，保留不动"""
+    cutoff = time.time() - UPLOAD_STAGING_MAX_AGE
+    try:
+        for path in UPLOAD_STAGING_DIR.glob('*.tmp'):
+            if path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning(f"Error removing stale uploads: {e}")
+
+def _decode_multipart_upload(limit, prefix, upload, state):
+    boundary = request.mimetype_params.get('boundary', '').encode('latin-1')
+    if not boundary:
+        raise ValueError('缺少 boundary')
+    # 正常情况下解析器只缓存不到两个数据块；找不到分隔符的数据（格式错误）不能无限缓存
+    decoder = MultipartDecoder(boundary, max_form_memory_size=2 * UPLOAD_CHUNK_SIZE)
+    parts = 0
+    part = None
+    field_value = bytearray()
+    for chunk in _read_upload_chunks(limit):
+        try:
+            decoder.receive_data(chunk)
+        except RequestEntityTooLarge:
+            raise ValueError('找不到字段分隔符') from None
+        event = decoder.next_event()
+        while not isinstance(event, (Epilogue, NeedData)):
+            if isinstance(event, (Field, File)):
+                parts += 1
+                if parts > UPLOAD_MAX_PARTS:
+                    raise RequestEntityTooLarge('表单字段过多')
+                part = event
+                field_value.clear()
+                # 重复的 code/icon 会替换掉正在使用的暂存文件，直接拒绝
+                if part.name == 'code' and state['source']:
+                    raise ValueError('有多个 code 字段')
+                if part.name == 'icon' and state['icon'] and isinstance(part, File) and part.filename:
+                    raise ValueError('有多个 icon 文件')
+                if part.name == 'code':
+                    state['source'] = _SourceStager(UPLOAD_STAGING_DIR / f'{prefix}-source-{parts}.tmp')
+                elif part.name == 'icon' and isinstance(part, File) and part.filename:
+                    state['icon'] = open(UPLOAD_STAGING_DIR / f'{prefix}-icon-{parts}.tmp', 'wb')
+            elif isinstance(event, Data):
+                if part.name == 'code':
+                    state['source'].write(event.data)
+                elif part.name == 'icon' and state['icon']:
+                    state['icon'].write(event.data)
+                elif isinstance(part, Field):
+                    field_value += event.data
+                    if len(field_value) > UPLOAD_FIELD_MAX_BYTES:
+                        raise RequestEntityTooLarge(f'表单字段 {part.name} 过长')
+                if not event.more_data:
+                    if part.name == 'code':
+                        upload['source'] = state['source'].finish()
+                    elif part.name == 'icon' and state['icon']:
+                        state['icon'].close()
+                        upload['icon'] = {'path': state['icon'].name, 'filename': part.filename}
+                    elif isinstance(part, Field):
+                        upload['fields'][part.name] = field_value.decode('utf-8', 'replace')
+            event = decoder.next_event()
+        if chunk is None and not isinstance(event, Epilogue):
+            raise ValueError('表单数据不完整')
 
 # 路由: 添加新程序
-@app.route('/add_program', methods=['POST'])
+@bp.route('/add_program', methods=['POST'])
+@admit_builds
+@rate_limited(BUILD_REQUEST_COST)
 def add_program():
     try:
-        program_name = request.form.get('name', '').strip()
-        program_code = request.form.get('code', '').strip()
-        program_language = request.form.get('language', 'python').strip().lower() # Default to python
-
-        if not program_name or not program_code:
-            return jsonify({'status': 'error', 'message': '程序名称和代码不能为空'})
+        with receive_program_upload() as upload:
+            return _add_uploaded_program(upload)
+    except HTTPException as e:
+        # 上传过大 (413) 或表单格式错误 (400)
+        return jsonify({'status': 'error', 'message': e.description}), e.code
+    except Exception as e:
+        logger.exception(f"添加程序时发生意外错误: {e}")
+        return jsonify({'status': 'error', 'message': f'添加程序出错：{str(e)}'})
 
-        # Allow underscores in program names
-        if not all(c.isalnum() or c == '_' for c in program_name):
-             return jsonify({'status': 'error', 'message': '程序名称只能包含字母、数字和下划线'})
+def _add_uploaded_program(upload):
+    form = upload['fields']
+    upload_source = upload['source']
+    program_name = form.get('name', '').strip()
+    program_language = form.get('language', 'python').strip().lower() # Default to python
+    backend = form.get('backend', '').strip().lower() or DEFAULT_PACKAGING_BACKEND
+
+    if not program_name or not upload_source:
+        return jsonify({'status': 'error', 'message': '程序名称和代码不能为空'})
+    if backend not in PACKAGING_BACKENDS:
+        return jsonify({'status': 'error', 'message': f'不支持的打包方式：{backend}'})
+
+    error_message = validate_new_program(program_name, None, program_language, upload_source)
+    if error_message:
+        return jsonify({'status': 'error', 'message': error_message})
+
+    job_id = uuid.uuid4().hex
+    source_file, error_message = stage_program_source(program_name, None, program_language, job_id, backend,
+                                                      upload_source)
+    if error_message:
+        return jsonify({'status': 'error', 'message': error_message})
+
+    # Handle icon upload
+    icon_upload = upload['icon']
+    icon_filename = save_program_icon(icon_upload['filename'] if icon_upload else None,
+                                      functools.partial(shutil.move, icon_upload['path']) if icon_upload else None)
+
+    # 将打包任务放入队列，立即返回任务ID，由后台工作线程完成打包
+    job = enqueue_build_job(program_name, program_language, source_file, icon_filename, job_id=job_id,
+                            backend=backend)
+
+    return jsonify({
+        'status': 'queued',
+        'message': f'程序 "{program_name}" 已加入打包队列',
+        'job_id': job['id'],
+        'icon_path': icon_filename # Send path relative to static/
+    })
+
+# ----- 更新程序 -----
+# 新代码与现有的 source.py 比较语法树，只改了注释、空白或格式时不重新打包，只保存新的源码。
+# 需要重新打包时，新源码先写到 programs/<name>/.pending-<job_id>/，产物打包到
+# exe_programs/<name>/.versions/<版本号>/（程序名不能以点开头，不会与最初添加时的产物 exe_programs/<name>/<name>
+# 重名）；打包成功后在一个事务中换上新产物，再替换 source.py 并回收旧产物。
+# 在此之前程序一直使用旧版本运行；打包失败时旧版本保持不变。
+VERSIONS_DIR_NAME = '.versions'
+
+def normalize_source(program_code):
+    """源码的规范形式：语法树相同（只有注释、空白、格式不同）的代码结果相同"""
+    return ast.dump(ast.parse(program_code), include_attributes=False)
+
+def _replace_source_atomically(source_path, upload_path):
+    """用上传的暂存文件替换 source.py：先移动到同一目录，再原子地重命名"""
+    tmp_file = source_path.with_name(f'.{source_path.name}-{uuid.uuid4().hex[:8]}.tmp')
+    shutil.move(upload_path, tmp_file)
+    os.replace(tmp_file, source_path)
+
+def _replace_program_icon(program_name, icon_upload):
+    """保存新上传的图标并更换（不需要重新打包），返回新图标路径；没有上传图标时返回 None"""
+    if not icon_upload:
+        return None
+    icon_filename = save_program_icon(icon_upload['filename'], functools.partial(shutil.move, icon_upload['path']))
+    icon_thumbs = make_icon_thumbnails(icon_filename)
+    old_icon = set_program_icon(program_name, icon_filename, icon_thumbs)
+    if old_icon is None:
+        remove_icon_files(icon_filename, icon_thumbs)
+        return None
+    remove_icon_files(*old_icon)
+    return icon_filename
+
+# 路由: 更新程序（表单字段与 /add_program 相同，图标和打包方式可选，默认沿用原来的打包方式）
+@bp.route('/update_program', methods=['POST'])
+@admit_builds
+@rate_limited(BUILD_REQUEST_COST)
+def update_program():
+    try:
+        with receive_program_upload() as upload:
+            return _update_uploaded_program(upload)
+    except HTTPException as e:
+        # 上传过大 (413) 或表单格式错误 (400)
+        return jsonify({'status': 'error', 'message': e.description}), e.code
+    except Exception as e:
+        logger.exception(f"更新程序时发生意外错误: {e}")
+        return jsonify({'status': 'error', 'message': f'更新程序出错：{str(e)}'})
+
+def _update_uploaded_program(upload):
+    form = upload['fields']
+    upload_source = upload['source']
+    program_name = form.get('name', '').strip()
+    if not program_name or not upload_source:
+        return jsonify({'status': 'error', 'message': '程序名称和代码不能为空'})
+
+    program_info, error_message = load_program_info(program_name)
+    if error_message:
+        return jsonify({'status': 'error', 'message': error_message})
+    backend = form.get('backend', '').strip().lower() or program_info['backend']
+    if backend not in PACKAGING_BACKENDS:
+        return jsonify({'status': 'error', 'message': f'不支持的打包方式：{backend}'})
+    # 上一次更新还没完成时，source.py 还是旧版本，不能拿来比较
+    pending_job = get_build_job(program_info['build_job_id']) if program_info['build_job_id'] else None
+    if pending_job and pending_job['state'] in ('queued', 'running'):
+        return jsonify({'status': 'error', 'message': f'程序 "{program_name}" 正在打包中，请稍后'})
+    source_path, error_message = resolve_source_path(program_name, program_info)
+    if error_message:
+        return jsonify({'status': 'error', 'message': error_message})
+    try:
+        compile_uploaded_source(upload_source, f'{program_name}/source.py')
+        program_code = Path(upload_source['path']).read_text(encoding='utf-8')
+        new_form = normalize_source(program_code)
+    except SyntaxError as e:
+        return jsonify({'status': 'error', 'message': f'Python代码语法错误：{str(e)}'})
+    except UnicodeDecodeError:
+        return jsonify({'status': 'error', 'message': '源代码不是有效的 UTF-8 文本'})
+    try:
+        old_code = source_path.read_text(encoding='utf-8')
+        old_form = normalize_source(old_code)
+    except (OSError, SyntaxError, ValueError):
+        old_code = old_form = None  # 旧源码无法解析时总是重新打包
+
+    if new_form == old_form and backend == program_info['backend']:
+        icon_filename = _replace_program_icon(program_name, upload['icon'])
+        if old_code != program_code:
+            discard_bytecode(source_path, upload_source['path'])
+            _replace_source_atomically(source_path, upload_source['path'])
+        logger.info(f"Program '{program_name}' updated without rebuild (no code changes)")
+        return jsonify({
+            'status': 'success',
+            'message': f'程序 "{program_name}" 已更新（代码没有实质变化，无需重新打包）',
+            'rebuilt': False,
+            'icon_path': icon_filename,
+        })
 
-        if program_language != 'python': # Only support python now
-            return jsonify({'status': 'error', 'message': f'不支持的编程语言：{program_language}'})
+    job_id = uuid.uuid4().hex
+    program_info, error_message = claim_program_update(program_name, job_id)
+    if error_message:
+        return jsonify({'status': 'error', 'message': error_message})
+    icon_filename = _replace_program_icon(program_name, upload['icon'])
+    # 清理之前中断的更新留下的目录
+    for stale_dir in source_path.parent.glob('.pending-*'):
+        shutil.rmtree(stale_dir, ignore_errors=True)
+    staged_source = source_path.parent / f'.pending-{job_id}' / source_path.name
+    staged_source.parent.mkdir()
+    shutil.move(upload_source['path'], staged_source)
+
+    job = enqueue_build_job(program_name, program_info['language'], staged_source, program_info['icon'],
+                            job_id=job_id, kind='update', backend=backend)
+    return jsonify({
+        'status': 'queued',
+        'message': f'程序 "{program_name}" 已加入打包队列，新版本打包完成前仍使用旧版本',
+        'job_id': job['id'],
+        'rebuilt': True,
+        'icon_path': icon_filename,
+    })
+
+def _run_update_job(job_id):
+    job = get_build_job(job_id)
+    if not job:
+        return
+    program_name = job['program_name']
+    staged_source = Path(job['source_file'])
+    program_info = get_program(program_name)
+    version = (program_info['version'] if program_info else 1) + 1
+    version_dir = Path(EXE_DIR) / program_name / VERSIONS_DIR_NAME / str(version)
+
+    _update_build_job(job_id, state='running', message='正在打包新版本', started_at=time.time())
+    logger.info(f"Update job {job_id} started for program '{program_name}' (version {version})",
+                extra={'program': program_name, 'version': version})
+
+    backend = job.get('backend', 'pyinstaller')
+    build_success, exe_path, error_message = PACKAGING_BACKENDS[backend]['build'](
+        program_name, staged_source, job['language'], on_output=functools.partial(_append_build_log, job_id),
+        exe_dir=version_dir)
+    old_info = None
+    if build_success:
+        try:
+            old_info = swap_program_artifact(program_name, job_id, exe_path.replace('\\', '/'), version, backend)
+            if old_info is None:
+                error_message = '程序已被删除'
+        except Exception as e:
+            logger.error(f"Error swapping artifact for {program_name}: {e}")
+            error_message = f'保存程序信息失败: {e}'
+
+    if old_info is None:
+        # 新源码没有用上，它的缓存文件也不再需要；程序已被删除时 source.py 不存在，直接丢弃
+        current_source = Path(PROGRAMS_DIR) / program_name / staged_source.name
+        discard_bytecode(staged_source, current_source if current_source.exists() else None)
+        shutil.rmtree(staged_source.parent, ignore_errors=True)
+        shutil.rmtree(version_dir, ignore_errors=True)
+        for empty_dir in (version_dir.parent, version_dir.parent.parent):
+            with contextlib.suppress(OSError):
+                empty_dir.rmdir()  # 程序在打包期间被删除时，不留下空目录
+        still_exists = get_program(program_name) is not None
+        _update_build_job(job_id, state='failed', finished_at=time.time(),
+                          message=f'更新程序失败：{error_message}' + ('（仍在使用旧版本）' if still_exists else ''))
+        _record_build_metrics(job_id, 'failed')
+        return
+
+    # 数据库已指向新产物：换上新源码，旧产物移入回收站
+    try:
+        source_path = Path(PROGRAMS_DIR) / old_info['source_file']
+        discard_bytecode(source_path, staged_source)
+        os.replace(staged_source, source_path)
+    except OSError as e:
+        logger.warning(f"Error replacing source of {program_name}: {e}")
+    shutil.rmtree(staged_source.parent, ignore_errors=True)
+    old_exe, _ = resolve_exe_path(old_info)
+    if old_exe:
+        # 回收 exe_programs/<name>/ 下包含旧产物的那一项：.versions/ 中的版本目录、onedir 目录、最初添加时的单个文件，
+        # 或者旧版本使用的 v<版本号>/ 目录
+        program_exe_dir = (Path(EXE_DIR) / program_name).resolve()
+        try:
+            old_parts = old_exe.relative_to(program_exe_dir).parts
+            old_entry = old_parts[:2] if old_parts[0] == VERSIONS_DIR_NAME else old_parts[:1]
+            move_to_trash(program_exe_dir.joinpath(*old_entry), 'exe')
+        except (ValueError, OSError) as e:
+            logger.warning(f"Error removing old artifact of {program_name}: {e}")
+
+    _update_build_job(job_id, state='succeeded', message=f'程序 "{program_name}" 已更新到第 {version} 版',
+                      finished_at=time.time())
+    _record_build_metrics(job_id, 'succeeded')
+    logger.info(f"Update job {job_id} succeeded for program '{program_name}' (version {version})",
+                extra={'program': program_name, 'version': version})
+
+# ----- 打包任务队列 -----
+# /add_program 只负责校验和保存源码，打包由固定数量的后台工作线程从队列中取出执行，
+# 这样几个耗时的 PyInstaller 任务不会占满服务器的请求线程。
+_build_queue = queue.Queue()
+_build_jobs = OrderedDict()  # job_id -> 任务信息，按加入顺序排列
+_build_jobs_lock = threading.Lock()
+_build_workers = []
+# 每个任务的构建日志环形缓冲区，只保留最近 BUILD_LOG_BUFFER_LINES 行，供 /build_logs 订阅。
+# 任务结束、完整日志已写入构建日志文件并且没有订阅者时释放，之后的读取改为读取文件。
+_build_logs = {}  # job_id -> {'lines': deque[(seq, line)], 'next_seq': int, 'done': bool, 'subscribers': int, 'persisted': bool}
+_build_logs_cond = threading.Condition()
+_build_transcripts = {}  # job_id -> 打开的完整构建日志文件（只由该任务的打包线程写入）
+BUILD_STATE_DIR = RUN_STATE_DIR / 'builds'
+BUILD_SLOT_DIR = RUN_STATE_DIR / 'build_slots'
+_JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+def _write_state_file(path, data):
+    """原子地写入 JSON 状态文件，读取方不会看到写了一半的内容"""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = path.with_name(f'.{path.stem}-{uuid.uuid4().hex[:8]}.tmp')
+        tmp_file.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp_file, path)
+    except OSError as e:
+        logger.warning(f"Error writing state file {path}: {e}")
+
+def _read_state_file(path):
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+def _process_identity(pid):
+    """
+    进程的启动标识：开机 ID + /proc/<pid>/stat 中的启动时间。容器重启后 PID 很快会被新进程复用，
+    只比较 PID 会把新进程误认为执行任务的旧进程。没有 /proc 的系统（macOS）返回 None，只能比较 PID。
+    """
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+        with open('/proc/sys/kernel/random/boot_id', encoding='ascii') as f:
+            boot_id = f.read().strip()
+        # 第 2 个字段是括号中的进程名（可能包含空格），从最后一个右括号之后数，启动时间是第 22 个字段
+        start_time = stat[stat.rindex(b')') + 2:].split()[19].decode('ascii')
+    except (OSError, ValueError, IndexError):
+        return None
+    return f'{boot_id}:{start_time}'
+
+def _process_alive(pid, identity=None):
+    """判断记录任务的服务进程是否还在运行；identity 是记录任务时该进程的启动标识"""
+    if not pid or pid == os.getpid() or os.name == 'nt':
+        # 本进程的任务都在内存中；Windows 下只有单进程部署（且 os.kill 会结束目标进程），文件里的都是旧任务
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # 进程存在但属于其他用户
+    # PID 已被其他进程复用
+    return identity is None or _process_identity(pid) == identity
+
+def _ensure_build_workers():
+    """按需启动打包工作线程（只启动一次）"""
+    with _build_jobs_lock:
+        if _build_workers:
+            return
+        for i in range(BUILD_WORKERS):
+            worker = threading.Thread(target=_build_worker_loop, name=f'build-worker-{i}', daemon=True)
+            worker.start()
+            _build_workers.append(worker)
+    logger.info(f"Started {BUILD_WORKERS} build worker(s)")
+
+def enqueue_build_job(program_name, language, source_file, icon_filename, executor=None, job_id=None, kind='add',
+                      backend=DEFAULT_PACKAGING_BACKEND):
+    """
+    创建打包任务并放入队列，返回任务信息的副本。
+    指定 executor 时任务交给该线程池执行（批量导入使用），不占用共享队列的工作线程。
+    job_id 为占用程序名时使用的任务 ID（见 stage_program_source）；kind 为 'add' 或 'update'。
+    """
+    if executor is None:
+        _ensure_build_workers()
+    job_id = job_id or uuid.uuid4().hex
+    job = {
+        'id': job_id,
+        'kind': kind,
+        'backend': backend,
+        'program_name': program_name,
+        'language': language,
+        'source_file': str(source_file),
+        'icon_path': icon_filename,
+        'state': 'queued',  # queued / running / succeeded / failed
+        'message': '等待打包',
+        'queued_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+        'request_id': _request_id_var.get(),
+        'log_file': str(BUILD_TRANSCRIPT_DIR / f"{job_id}.log"),
+        'pid': os.getpid(),  # 执行任务的服务进程
+        'pid_identity': _process_identity(os.getpid()),  # 与 PID 一起判断该进程是否还在运行
+    }
+    with _build_logs_cond:
+        _build_logs[job['id']] = {'lines': deque(maxlen=BUILD_LOG_BUFFER_LINES), 'next_seq': 0, 'done': False,
+                                  'subscribers': 0, 'persisted': False}
+    with _build_jobs_lock:
+        _build_jobs[job['id']] = job
+        # 只丢弃已结束的旧任务，排队或运行中的任务必须保留
+        finished = [jid for jid, j in _build_jobs.items() if j['state'] in ('succeeded', 'failed')]
+        pruned = finished[:max(0, len(_build_jobs) - BUILD_JOB_HISTORY)]
+        for pruned_id in pruned:
+            del _build_jobs[pruned_id]
+        snapshot = dict(job)
+    with _build_logs_cond:
+        for pruned_id in pruned:
+            _build_logs.pop(pruned_id, None)
+    for pruned_id in pruned:
+        (BUILD_TRANSCRIPT_DIR / f'{pruned_id}.log').unlink(missing_ok=True)
+        (BUILD_STATE_DIR / f'{pruned_id}.json').unlink(missing_ok=True)
+    _write_state_file(BUILD_STATE_DIR / f'{job_id}.json', snapshot)
+    if executor is not None:
+        executor.submit(_process_build_job, job['id'])
+        logger.info(f"Build job {job_id} submitted for program '{program_name}'", extra={'job_id': job_id, 'program': program_name})
+    else:
+        _build_queue.put(job['id'])
+        logger.info(f"Build job {job_id} queued for program '{program_name}' (queue size: {_build_queue.qsize()})",
+                    extra={'job_id': job_id, 'program': program_name})
+    return snapshot
+
+def get_build_job(job_id):
+    """返回任务信息的副本，任务不存在时返回 None；不在本进程内存中的任务从状态文件读取"""
+    with _build_jobs_lock:
+        job = _build_jobs.get(job_id)
+        if job:
+            return dict(job)
+    if not _JOB_ID_PATTERN.fullmatch(job_id):
+        return None
+    job = _read_state_file(BUILD_STATE_DIR / f'{job_id}.json')
+    if job and job['state'] in ('queued', 'running') and not _process_alive(job.get('pid'), job.get('pid_identity')):
+        job.update(state='failed', message='打包中断：执行该任务的服务进程已退出，请重新添加程序')
+    return job
+
+def _update_build_job(job_id, **fields):
+    with _build_jobs_lock:
+        job = _build_jobs.get(job_id)
+        if not job:
+            return
+        job.update(fields)
+        snapshot = dict(job)
+    if fields.get('state') in ('succeeded', 'failed'):
+        _append_build_log(job_id, fields.get('message', ''), done=True)
+    # 最后一行日志写完后才更新状态文件，其他进程看到任务结束时日志文件已经完整
+    _write_state_file(BUILD_STATE_DIR / f'{job_id}.json', snapshot)
+
+def _append_build_log(job_id, line, done=False):
+    """追加一行构建日志并唤醒等待中的订阅者；完整内容同时写入构建日志文件"""
+    with _build_logs_cond:
+        log = _build_logs.get(job_id)
+        if log is None or log['done']:
+            return
+        transcript = _build_transcripts.get(job_id)
+        if line:
+            log['lines'].append((log['next_seq'], line[:BUILD_LOG_MAX_LINE_LENGTH]))
+            log['next_seq'] += 1
+        log['done'] = done
+        _build_logs_cond.notify_all()
+    if transcript and line:
+        transcript.write(line + '\n')
+    if done and transcript:
+        # 最后一行写入文件之后才释放缓冲区，此后连接的订阅者从文件中能读到完整日志
+        with _build_logs_cond:
+            log['persisted'] = True
+            _release_build_log(job_id)
+
+def _release_build_log(job_id):
+    """任务已结束、完整日志已在文件中并且没有订阅者时，释放内存中的缓冲区（调用方持有 _build_logs_cond）"""
+    log = _build_logs.get(job_id)
+    if log and log['persisted'] and not log['subscribers']:
+        del _build_logs[job_id]
+
+def _open_build_transcript(job_id):
+    """打开任务的完整构建日志文件（按行缓冲，可以 tail -f）；打不开时返回 None，只保留内存中的日志"""
+    try:
+        BUILD_TRANSCRIPT_DIR.mkdir(parents=True, exist_ok=True)
+        return open(BUILD_TRANSCRIPT_DIR / f'{job_id}.log', 'w', encoding='utf-8', errors='replace', buffering=1)
+    except OSError as e:
+        logger.warning(f"Cannot open build transcript for job {job_id}: {e}")
+        return None
+
+def _process_build_job(job_id):
+    job = get_build_job(job_id)
+    if not job:
+        return
+    # 工作线程不继承请求线程的上下文，关联 ID 从任务信息中恢复
+    request_token = _request_id_var.set(job.get('request_id'))
+    build_token = _build_id_var.set(job_id)
+    transcript = _open_build_transcript(job_id)
+    if transcript:
+        with _build_logs_cond:
+            _build_transcripts[job_id] = transcript
+    try:
+        if job.get('kind') == 'update':
+            _run_update_job(job_id)
+        else:
+            _run_build_job(job_id)
+    except Exception as e:
+        logger.exception(f"打包任务 {job_id} 发生意外错误: {e}")
+        _update_build_job(job_id, state='failed', message=f'打包过程出错：{str(e)}', finished_at=time.time())
+        _record_build_metrics(job_id, 'failed')
+    finally:
+        if transcript:
+            with _build_logs_cond:
+                _build_transcripts.pop(job_id, None)
+            transcript.close()
+        _build_id_var.reset(build_token)
+        _request_id_var.reset(request_token)
+
+def _build_worker_loop():
+    while True:
+        job_id = _build_queue.get()
+        try:
+            _process_build_job(job_id)
+        finally:
+            _build_queue.task_done()
+
+def _run_build_job(job_id):
+    job = get_build_job(job_id)
+    if not job:
+        return
+    program_name = job['program_name']
+    language = job['language']
+    icon_filename = job['icon_path']
+    source_file = Path(job['source_file'])
+    programs_dir = Path(PROGRAMS_DIR)
+    program_dir = programs_dir / program_name
 
-        programs_dir = Path(PROGRAMS_DIR)
-        program_dir = programs_dir / program_name
-
-        # Check if the directory exists and clean up if it's invalid/empty
-        if program_dir.exists() and program_dir.is_dir():
-            info_file = program_dir / 'info.json'
-            # Check if directory is empty or lacks info.json
-            if not info_file.exists() or not any(f for f in program_dir.iterdir() if f.name != 'info.json'):
-                print(f"Removing potentially corrupt directory: {program_dir}")
-                try:
-                    shutil.rmtree(program_dir)
-                except Exception as e:
-                    print(f"Error removing corrupt directory {program_dir}: {e}")
-                    return jsonify({'status': 'error', 'message': f'无法清理已存在的损坏目录 "{program_name}"'})
-            else:
-                return jsonify({'status': 'error', 'message': f'程序 "{program_name}" 已存在'})
+    _update_build_job(job_id, state='running', message='正在打包', started_at=time.time())
+    logger.info(f"Build job {job_id} started for program '{program_name}'", extra={'program': program_name})
 
-        # Check Python syntax before saving
-        try:
-            compile(program_code, '<string>', 'exec')
-        except SyntaxError as e:
-            return jsonify({'status': 'error', 'message': f'Python代码语法错误：{str(e)}'})
+    build_success, exe_path, error_message = PACKAGING_BACKENDS[job.get('backend', 'pyinstaller')]['build'](
+        program_name, source_file, language, on_output=functools.partial(_append_build_log, job_id))
 
-        # Create program directory
-        try:
-             program_dir.mkdir(parents=True, exist_ok=True)
-        except Exception as e:
-             print(f"Error creating directory {program_dir}: {e}")
-             return jsonify({'status': 'error', 'message': f'创建程序目录失败: {e}'})
+    if not build_success:
+        # Clean up created directory and source file if build fails
+        discard_bytecode(source_file)
+        shutil.rmtree(program_dir, ignore_errors=True)
+        # Also remove uploaded icon if it wasn't the placeholder
+        remove_icon_files(icon_filename)
+        discard_program(program_name, job_id)
 
+        _update_build_job(job_id, state='failed', message=f'打包程序失败：{error_message}', finished_at=time.time())
+        _record_build_metrics(job_id, 'failed')
+        return
 
-        # Save source code
-        extension = SUPPORTED_LANGUAGES[program_language]['extension']
-        source_file = program_dir / f'source{extension}'
+    # Save program info
+    exe_path = exe_path.replace('\\', '/')  # Relative to exe_programs/, like 'name/name.exe'
+    icon_thumbs = make_icon_thumbnails(icon_filename)  # {'48': ..., '96': ...}, relative to static/
+    try:
+        program_info = complete_program_build(program_name, job_id, exe_path, icon_filename, icon_thumbs,
+                                              job.get('backend', 'pyinstaller'))
+        if program_info is None:
+            raise RuntimeError('程序记录已被删除')
+    except Exception as e:
+         logger.error(f"Error saving program info for {program_name}: {e}")
+         # Clean up everything if info saving fails
+         discard_bytecode(source_file)
+         shutil.rmtree(program_dir, ignore_errors=True)
+         shutil.rmtree(Path(EXE_DIR) / program_name, ignore_errors=True)
+         remove_icon_files(icon_filename, icon_thumbs)
+         discard_program(program_name, job_id)
+         _update_build_job(job_id, state='failed', message=f'保存程序信息失败: {e}', finished_at=time.time())
+         _record_build_metrics(job_id, 'failed')
+         return
+
+    _update_build_job(job_id, state='succeeded', message=f'程序 "{program_name}" 添加并打包成功！',
+                      icon_thumbs=program_info['icon_thumbs'], finished_at=time.time())
+    _record_build_metrics(job_id, 'succeeded')
+    logger.info(f"Build job {job_id} succeeded for program '{program_name}'", extra={'program': program_name})
+
+def _record_build_metrics(job_id, outcome):
+    job = get_build_job(job_id)
+    metrics_inc('app_builds_total', outcome=outcome)
+    if job and job['started_at'] and job['finished_at']:
+        metrics_observe('app_build_duration_seconds', job['finished_at'] - job['started_at'], BUILD_DURATION_BUCKETS)
+        _record_build_duration(job['finished_at'] - job['started_at'])
+
+def _sse_event(event_id, data, event=None):
+    lines = []
+    if event:
+        lines.append(f'event: {event}')
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.extend(f'data: {part}' for part in data.split('\n'))
+    return '\n'.join(lines) + '\n\n'
+
+# 路由: 实时构建日志（Server-Sent Events）
+# 断线重连时浏览器会带上 Last-Event-ID，从该行之后继续推送；
+# 如果落后太多、所需的行已被环形缓冲区覆盖，先发送一个 skipped 事件说明丢弃的行数。
+@bp.route('/build_logs/<job_id>')
+def build_logs(job_id):
+    try:
+        next_seq = int(request.headers.get('Last-Event-ID', request.args.get('last_event_id', -1))) + 1
+    except ValueError:
+        next_seq = 0
+    with _build_logs_cond:
+        local = job_id in _build_logs
+    if not local:
+        # 任务由其他工作进程执行（或在服务重启前执行），改为读取构建日志文件
+        if not get_build_job(job_id):
+            return jsonify({'status': 'error', 'message': f'打包任务不存在: {job_id}'}), 404
+        return Response(_stream_build_transcript(job_id, max(0, next_seq)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    def stream(next_seq):
+        with _build_logs_cond:
+            log = _build_logs.get(job_id)
+            if log is None:
+                # 任务刚结束，缓冲区已释放
+                yield from _stream_build_transcript(job_id, next_seq)
+                return
+            log['subscribers'] += 1
         try:
-            with open(source_file, 'w', encoding='utf-8') as f:
-                f.write(program_code)
-        except Exception as e:
-            print(f"Error writing source file {source_file}: {e}")
-            # Clean up created directory if saving fails
-            shutil.rmtree(program_dir, ignore_errors=True)
-            return jsonify({'status': 'error', 'message': f'保存源代码失败: {e}'})
-
-        # Handle icon upload
-        icon_file = request.files.get('icon')
-        icon_filename = 'placeholder_icon.png' # Default relative to static
-
-        if icon_file and icon_file.filename:
-             # Basic check for allowed extensions
-             file_ext = os.path.splitext(icon_file.filename)[1].lower()
-             if file_ext[1:] in ALLOWED_EXTENSIONS: # Check without dot
-                 # Use UUID for unique filename to avoid conflicts
-                 icon_filename = str(uuid.uuid4()) + file_ext
-                 icon_save_dir = UPLOAD_FOLDER # Use the Path object
-                 icon_save_path = icon_save_dir / icon_filename
-                 try:
-                     icon_file.save(icon_save_path)
-                     print(f"Icon saved to: {icon_save_path}")
-                     # Store path relative to static dir
-                     icon_filename = f"program_icons/{icon_filename}"
-                 except Exception as e:
-                     print(f"Error saving icon {icon_filename}: {e}")
-                     icon_filename = 'placeholder_icon.png' # Revert to placeholder on save error
-             else:
-                 print(f"Invalid icon extension: {file_ext}")
-                 # Optionally return an error here or just use placeholder
-                 # return jsonify({'status': 'error', 'message': '不允许的图标文件类型'})
-
-
-        # Build executable
-        build_success, exe_path, error_message = build_executable(program_name, source_file, program_language)
-
-        if not build_success:
-            # Clean up created directory and source file if build fails
-            shutil.rmtree(program_dir, ignore_errors=True)
-            # Also remove uploaded icon if it wasn't the placeholder
-            if icon_filename != 'placeholder_icon.png':
-                 icon_to_remove = Path('static') / icon_filename
-                 if icon_to_remove.exists():
-                     try:
-                         icon_to_remove.unlink()
-                         print(f"Removed icon due to build failure: {icon_to_remove}")
-                     except Exception as e:
-                         print(f"Error removing icon {icon_to_remove}: {e}")
-
-            return jsonify({'status': 'error', 'message': f'打包程序失败：{error_message}'})
-
-        # Save program info
-        program_info = {
-            'name': program_name,
-            'language': program_language,
-            'source_file': str(source_file.relative_to(programs_dir)),
-            'exe_path': exe_path, # Should be relative path like 'exe_programs/name/name.exe'
-            'icon': icon_filename # Path relative to static/
+            yield 'retry: 3000\n\n'
+            while True:
+                with _build_logs_cond:
+                    if log['next_seq'] <= next_seq and not log['done']:
+                        _build_logs_cond.wait(timeout=15)
+                    first_seq = log['next_seq'] - len(log['lines'])
+                    pending = [item for item in log['lines'] if item[0] >= next_seq]
+                    done = log['done']
+                if next_seq < first_seq:
+                    yield _sse_event(None, str(first_seq - next_seq), event='skipped')
+                    next_seq = first_seq
+                for seq, line in pending:
+                    yield _sse_event(seq, line)
+                    next_seq = seq + 1
+                if done and not pending:
+                    yield _sse_event(None, '', event='end')
+                    return
+                if not pending:
+                    yield ': keepalive\n\n'
+        finally:
+            # 客户端断开或日志推送完毕
+            with _build_logs_cond:
+                log['subscribers'] -= 1
+                _release_build_log(job_id)
+
+    return Response(stream(max(0, next_seq)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _stream_build_transcript(job_id, next_seq, poll_interval=0.5):
+    """逐行推送构建日志文件，行号即事件 ID，与内存缓冲区的编号一致"""
+    yield 'retry: 3000\n\n'
+    path = BUILD_TRANSCRIPT_DIR / f'{job_id}.log'
+    seq = 0
+    idle_since = time.monotonic()
+    with contextlib.ExitStack() as stack:
+        transcript = None
+        while True:
+            # 先读任务状态再读文件：状态文件在最后一行日志写完之后才会变为结束
+            job = get_build_job(job_id)
+            done = not job or job['state'] not in ('queued', 'running')
+            if transcript is None and path.exists():
+                transcript = stack.enter_context(open(path, encoding='utf-8', errors='replace'))
+            sent = False
+            while transcript:
+                position = transcript.tell()
+                line = transcript.readline()
+                if not line.endswith('\n'):
+                    transcript.seek(position)  # 不完整的行留到下次读取
+                    break
+                if seq >= next_seq:
+                    yield _sse_event(seq, line.rstrip('\n')[:BUILD_LOG_MAX_LINE_LENGTH])
+                    sent = True
+                seq += 1
+            if done:
+                yield _sse_event(None, '', event='end')
+                return
+            if sent:
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since >= 15:
+                yield ': keepalive\n\n'
+                idle_since = time.monotonic()
+            time.sleep(poll_interval)
+
+# 路由: 查询打包任务状态
+@bp.route('/build_status/<job_id>')
+def build_status(job_id):
+    job = get_build_job(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': f'打包任务不存在: {job_id}'}), 404
+    job['queue_position'] = None
+    if job['state'] == 'queued':
+        with _build_jobs_lock:
+            queued_ids = [j['id'] for j in _build_jobs.values() if j['state'] == 'queued']
+        if job_id in queued_ids:
+            job['queue_position'] = queued_ids.index(job_id) + 1
+    return jsonify({'status': 'success', 'job': job})
+
+# 路由: 下载完整的构建日志（/build_logs 只保留最近的若干行）
+@bp.route('/build_transcript/<job_id>')
+def build_transcript(job_id):
+    if not _JOB_ID_PATTERN.fullmatch(job_id) or not (BUILD_TRANSCRIPT_DIR / f'{job_id}.log').exists():
+        return jsonify({'status': 'error', 'message': f'构建日志不存在: {job_id}'}), 404
+    response = send_from_directory(BUILD_TRANSCRIPT_DIR.absolute(), f'{job_id}.log', mimetype='text/plain')
+    response.cache_control.no_cache = True
+    return response
+
+# ----- 批量导入 -----
+# 压缩包中每个程序占一个目录：<name>/source.py，可选 <name>/icon.png（或 jpg/jpeg/gif/ico）。
+# 所有程序先统一校验（包括 compile() 语法检查），通过的才写入磁盘并打包，结果按程序逐个报告。
+_import_executor = None
+_import_batches = OrderedDict()  # batch_id -> {'id', 'created_at', 'results': [...]}
+_import_lock = threading.Lock()
+IMPORT_STATE_DIR = RUN_STATE_DIR / 'imports'
+
+def _get_import_executor():
+    global _import_executor
+    with _import_lock:
+        if _import_executor is None:
+            _import_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix='import-build')
+            logger.info(f"Started import build pool with {IMPORT_WORKERS} worker(s)")
+        return _import_executor
+
+def read_import_archive(archive):
+    """
+    读取 zip 压缩包，返回 (entries, 错误信息)。
+    entries: 程序名 -> {'code': 源码字节或 None, 'icon': (文件名, 字节) 或 None, 'error': 错误信息或 None}；
+    程序名取文件所在目录名，因此压缩包外面多包一层目录也可以。不同位置的同名目录无法区分，
+    这个程序名记为错误，不导入其中任何一个。
+    """
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            members = [info for info in zf.infolist() if not info.is_dir() and not info.filename.startswith('__MACOSX/')]
+            if sum(info.file_size for info in members) > IMPORT_MAX_UNCOMPRESSED_BYTES:
+                return None, f'压缩包解压后超过 {IMPORT_MAX_UNCOMPRESSED_BYTES // (1024 * 1024)}MB'
+            entries = {}
+            directories = {}  # 程序名 -> 第一次出现的目录
+            for info in members:
+                parts = PurePosixPath(info.filename.replace('\\', '/')).parts
+                if len(parts) < 2:
+                    continue  # 根目录下的文件不属于任何程序
+                program_name, filename = parts[-2], parts[-1]
+                entry = entries.setdefault(program_name, {'code': None, 'icon': None, 'error': None})
+                directory = '/'.join(parts[:-1])
+                first_directory = directories.setdefault(program_name, directory)
+                if directory != first_directory:
+                    entry['error'] = entry['error'] or f'压缩包中有多个同名目录：{first_directory}/、{directory}/'
+                    continue
+                if filename == 'source.py':
+                    entry['code'] = zf.read(info)
+                elif os.path.splitext(filename)[0] == 'icon':
+                    entry['icon'] = (filename, zf.read(info))
+    except zipfile.BadZipFile:
+        return None, '不是有效的 zip 压缩包'
+    if not entries:
+        return None, '压缩包中没有找到程序（需要 <程序名>/source.py）'
+    if len(entries) > IMPORT_MAX_PROGRAMS:
+        return None, f'一次最多导入 {IMPORT_MAX_PROGRAMS} 个程序'
+    return entries, None
+
+def import_programs(entries, executor=None, max_jobs=None):
+    """
+    校验全部程序后，保存并提交通过校验的程序打包，返回导入批次信息。
+    max_jobs 限制提交的打包任务数（见“准入控制”一节），超出的程序标记为 rejected，需要重新导入。
+    """
+    results = []
+    valid = []
+    for program_name in sorted(entries):
+        entry = entries[program_name]
+        result = {'name': program_name, 'state': 'invalid', 'message': None, 'job_id': None}
+        results.append(result)
+        if entry.get('error'):
+            result['message'] = entry['error']
+            continue
+        if entry['code'] is None:
+            result['message'] = '缺少 source.py'
+            continue
+        try:
+            program_code = entry['code'].decode('utf-8-sig').strip()
+        except UnicodeDecodeError:
+            result['message'] = 'source.py 不是 UTF-8 编码'
+            continue
+        if not program_code:
+            result['message'] = '程序代码为空'
+            continue
+        # 只做语法检查，字节码缓存等到程序真正加入打包时再写入，未导入的程序不留下缓存文件
+        result['message'] = validate_new_program(program_name, program_code, 'python', cache_bytecode=False)
+        if result['message'] is None:
+            valid.append((result, program_code, entry['icon']))
+
+    rejected = valid[max_jobs:] if max_jobs is not None else []
+    for result, _, _ in rejected:
+        result.update(state='rejected', message='打包队列已满，未加入打包，请稍后重新导入')
+    valid = valid[:len(valid) - len(rejected)]
+
+    executor = executor or _get_import_executor()
+    for result, program_code, icon in valid:
+        job_id = uuid.uuid4().hex
+        source_file, error_message = stage_program_source(result['name'], program_code, 'python', job_id)
+        if error_message:
+            result['message'] = error_message
+            continue
+        compile_cached(program_code, f"{result['name']}/source.py")
+        icon_name, icon_data = icon or (None, None)
+        icon_filename = save_program_icon(icon_name, lambda path, data=icon_data: path.write_bytes(data))
+        job = enqueue_build_job(result['name'], 'python', source_file, icon_filename, executor=executor, job_id=job_id)
+        result.update(state=job['state'], message=job['message'], job_id=job['id'])
+
+    batch = {'id': uuid.uuid4().hex, 'created_at': time.time(), 'results': results}
+    with _import_lock:
+        _import_batches[batch['id']] = batch
+        pruned = []
+        while len(_import_batches) > IMPORT_BATCH_HISTORY:
+            pruned.append(_import_batches.popitem(last=False)[0])
+    for batch_id in pruned:
+        (IMPORT_STATE_DIR / f'{batch_id}.json').unlink(missing_ok=True)
+    # 各程序的状态查询时从打包任务获取，批次本身写入后不再变化
+    _write_state_file(IMPORT_STATE_DIR / f"{batch['id']}.json", batch)
+    logger.info(f"Import batch {batch['id']}: {len(valid)} program(s) submitted, "
+                f"{len(results) - len(valid) - len(rejected)} invalid, {len(rejected)} rejected (build queue full)")
+    return get_import_batch(batch['id'])
+
+def get_import_batch(batch_id):
+    """返回导入批次的最新结果：每个程序的状态取自对应的打包任务"""
+    with _import_lock:
+        batch = _import_batches.get(batch_id)
+    if batch is None:
+        # 其他工作进程（或服务重启前）创建的批次
+        if not _JOB_ID_PATTERN.fullmatch(batch_id):
+            return None
+        batch = _read_state_file(IMPORT_STATE_DIR / f'{batch_id}.json')
+        if batch is None:
+            return None
+    results = [dict(r) for r in batch['results']]
+    for result in results:
+        job = get_build_job(result['job_id']) if result['job_id'] else None
+        if job:
+            result['state'], result['message'] = job['state'], job['message']
+    summary = {}
+    for result in results:
+        summary[result['state']] = summary.get(result['state'], 0) + 1
+    return {'id': batch_id, 'created_at': batch['created_at'], 'summary': summary, 'results': results}
+
+# 路由: 批量导入程序
+# 表单字段 archive 为 zip 压缩包，立即返回每个程序的校验结果和打包任务ID
+@bp.route('/import_programs', methods=['POST'])
+@admit_builds
+@rate_limited(BUILD_REQUEST_COST)
+def import_programs_route():
+    try:
+        archive = request.files.get('archive')
+        if not archive or not archive.filename:
+            return jsonify({'status': 'error', 'message': '请上传 zip 压缩包 (字段名 archive)'})
+        entries, error_message = read_import_archive(archive.stream)
+        if error_message:
+            return jsonify({'status': 'error', 'message': error_message})
+        # 打包队列只剩部分位置时，只提交放得下的程序
+        batch = import_programs(entries, max_jobs=build_backlog_capacity())
+        queued = len([r for r in batch['results'] if r['job_id']])
+        rejected = batch['summary'].get('rejected', 0)
+        # 进入路由时已经扣除了一个程序的令牌，其余按实际提交的程序数补扣
+        charge_rate_tokens(BUILD_REQUEST_COST * (queued - 1))
+        response = {
+            'status': 'success',
+            'message': f'{queued} 个程序已加入打包队列，{len(batch["results"]) - queued - rejected} 个未通过校验',
+            'batch': batch,
         }
-
+        if rejected:
+            retry_after = build_backlog_wait(rejected)
+            response.update(status='partial', retry_after=retry_after,
+                            message=response['message'] + f'，{rejected} 个因打包队列已满未加入，请 {retry_after} 秒后重新导入')
+        return jsonify(response)
+    except Exception as e:
+        logger.exception(f"批量导入时发生意外错误: {e}")
+        return jsonify({'status': 'error', 'message': f'批量导入出错：{str(e)}'})
+
+# 路由: 查询批量导入结果
+@bp.route('/import_status/<batch_id>')
+def import_status(batch_id):
+    batch = get_import_batch(batch_id)
+    if not batch:
+        return jsonify({'status': 'error', 'message': f'导入批次不存在: {batch_id}'}), 404
+    return jsonify({'status': 'success', 'batch': batch})
+
+def import_programs_cli(argv):
+    """命令行批量导入：python app.py import-programs archive.zip [--jobs N]，等待全部打包结束后输出报告"""
+    global IMPORT_WORKERS
+    parser = argparse.ArgumentParser(prog='app.py import-programs', description='从 zip 压缩包批量导入并打包程序')
+    parser.add_argument('archive', help='包含 <程序名>/source.py 的 zip 压缩包')
+    parser.add_argument('--jobs', type=int, default=IMPORT_WORKERS, help=f'同时打包的程序数 (默认 {IMPORT_WORKERS})')
+    parser.add_argument('--json', action='store_true', help='以 JSON 格式输出结果报告')
+    args = parser.parse_args(argv)
+
+    IMPORT_WORKERS = max(1, args.jobs)
+    init_runtime()
+    entries, error_message = read_import_archive(args.archive)
+    if error_message:
+        print(f"导入失败: {error_message}", file=sys.stderr)
+        return 2
+    started = time.perf_counter()
+    batch = import_programs(entries)
+    _get_import_executor().shutdown(wait=True)
+    batch = get_import_batch(batch['id'])
+    batch['elapsed_s'] = round(time.perf_counter() - started, 2)
+
+    if args.json:
+        print(json.dumps(batch, ensure_ascii=False, indent=2))
+    else:
+        for result in batch['results']:
+            print(f"{result['name']:<30} {result['state']:<10} {result['message']}")
+        print(f"共 {len(batch['results'])} 个程序，用时 {batch['elapsed_s']} 秒: {batch['summary']}")
+    return 0 if set(batch['summary']) <= {'succeeded'} else 1
+
+# ----- 打包缓存 -----
+# 缓存键由源码字节、Python 版本、PyInstaller 版本和打包命令模板共同决定，
+# 任何一项变化都会得到不同的键。超出大小上限时按最近最少使用（LRU）淘汰。
+_build_cache_index = None  # cache_key -> 产物大小，按最近使用顺序排列；首次使用时从磁盘加载
+_build_cache_lock = threading.Lock()
+_build_cache_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+def artifact_filename(program_name):
+    """PyInstaller 生成的可执行文件名：Windows 下为 name.exe，其他系统没有后缀"""
+    return program_name + ('.exe' if os.name == 'nt' else '')
+
+@functools.lru_cache(maxsize=None)
+def _toolchain_version(command):
+    """获取打包工具的版本号（每个进程只查询一次）"""
+    try:
+        result = subprocess.run(f'{command} --version', shell=True, capture_output=True,
+                                encoding='utf-8', errors='ignore', timeout=60)
+        return result.stdout.strip() or 'unknown'
+    except Exception as e:
+        logger.warning(f"Error querying {command} version: {e}")
+        return 'unknown'
+
+def build_cache_key(source_file, language):
+    """根据源码内容和工具链计算缓存键"""
+    build_command = SUPPORTED_LANGUAGES[language]['build_command']
+    digest = hashlib.sha256()
+    for part in (b'build-cache-v1', sys.version.encode(),
+                 _toolchain_version(build_command.split()[0]).encode(), build_command.encode()):
+        digest.update(part)
+        digest.update(b'\0')
+    with open(source_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _load_build_cache_index():
+    """扫描缓存目录，按修改时间从旧到新建立索引（调用方需持有锁）"""
+    global _build_cache_index
+    if _build_cache_index is not None:
+        return _build_cache_index
+    entries = []
+    if BUILD_CACHE_DIR.exists():
+        for entry_dir in BUILD_CACHE_DIR.iterdir():
+            artifact = entry_dir / 'artifact'
+            if entry_dir.name.startswith('.'):
+                # 上次异常退出遗留的临时目录
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            elif artifact.is_file():
+                stat = artifact.stat()
+                entries.append((entry_dir.stat().st_mtime, entry_dir.name, stat.st_size))
+    _build_cache_index = OrderedDict((key, size) for _, key, size in sorted(entries))
+    return _build_cache_index
+
+def build_cache_fetch(cache_key, target_path):
+    """缓存命中时把产物放到 target_path（优先硬链接），返回是否命中"""
+    entry_dir = BUILD_CACHE_DIR / cache_key
+    with _build_cache_lock:
+        index = _load_build_cache_index()
+        if cache_key not in index:
+            _build_cache_stats['misses'] += 1
+            return False
         try:
-            with open(program_dir / 'info.json', 'w', encoding='utf-8') as f:
-                json.dump(program_info, f, ensure_ascii=False, indent=4)
+            target_path.unlink(missing_ok=True)
+            try:
+                os.link(entry_dir / 'artifact', target_path)
+            except OSError:
+                shutil.copy2(entry_dir / 'artifact', target_path)
+            os.utime(entry_dir)  # 更新最近使用时间，重启后仍能保持 LRU 顺序
         except Exception as e:
-             print(f"Error writing info.json for {program_name}: {e}")
-             # Clean up everything if info saving fails
-             shutil.rmtree(program_dir, ignore_errors=True)
-             shutil.rmtree(Path(EXE_DIR) / program_name, ignore_errors=True)
-             if icon_filename != 'placeholder_icon.png':
-                  icon_to_remove = Path('static') / icon_filename
-                  if icon_to_remove.exists(): icon_to_remove.unlink(missing_ok=True)
-             return jsonify({'status': 'error', 'message': f'保存程序信息失败: {e}'})
+            logger.warning(f"Error fetching build cache entry {cache_key}: {e}")
+            index.pop(cache_key, None)
+            _build_cache_stats['misses'] += 1
+            return False
+        index.move_to_end(cache_key)
+        _build_cache_stats['hits'] += 1
+        return True
+
+def build_cache_store(cache_key, artifact_path):
+    """把新打包的产物复制进缓存，并按大小上限淘汰最旧的条目"""
+    try:
+        size = artifact_path.stat().st_size
+        if size > BUILD_CACHE_MAX_BYTES:
+            return
+        BUILD_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # 先写到临时目录再重命名，避免并发读取到写了一半的产物
+        tmp_dir = BUILD_CACHE_DIR / f'.tmp-{uuid.uuid4().hex}'
+        tmp_dir.mkdir()
+        # 产物随后会收入只读的存储区，不会被原地修改，可以与缓存共用同一个文件
+        try:
+            os.link(artifact_path, tmp_dir / 'artifact')
+        except OSError:
+            shutil.copy2(artifact_path, tmp_dir / 'artifact')
+        with _build_cache_lock:
+            index = _load_build_cache_index()
+            entry_dir = BUILD_CACHE_DIR / cache_key
+            if cache_key in index or entry_dir.exists():
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return
+            os.rename(tmp_dir, entry_dir)
+            index[cache_key] = size
+            _build_cache_stats['stores'] += 1
+            total = sum(index.values())
+            while total > BUILD_CACHE_MAX_BYTES and len(index) > 1:
+                old_key, old_size = index.popitem(last=False)
+                try:
+                    move_to_trash(BUILD_CACHE_DIR / old_key, 'cache')  # 持有锁期间不做耗时的删除
+                except OSError:
+                    shutil.rmtree(BUILD_CACHE_DIR / old_key, ignore_errors=True)
+                total -= old_size
+                _build_cache_stats['evictions'] += 1
+                logger.info(f"Evicted build cache entry {old_key}")
+    except Exception as e:
+        logger.warning(f"Error storing build cache entry {cache_key}: {e}")
+
+# 路由: 打包缓存统计
+@bp.route('/build_cache_stats')
+def build_cache_stats():
+    with _build_cache_lock:
+        index = _load_build_cache_index()
+        stats = dict(_build_cache_stats)
+        stats['entries'] = len(index)
+        stats['bytes'] = sum(index.values())
+    stats['max_bytes'] = BUILD_CACHE_MAX_BYTES
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return jsonify({'status': 'success', 'cache': stats})
+
+# ----- 预热打包工作目录 -----
+# PyInstaller 的分析结果和 PYZ 缓存保存在 --workpath/<name>/ 下。预热模式去掉 --clean，
+# 并让导入模块集合相同的程序在同一个工作目录里用固定名称打包，从而复用这些缓存。
+# 同一工作目录同时只允许一个打包进程使用：进程内用线程锁，多个进程之间用文件锁。
+_warm_dir_locks = {}
+_warm_dir_locks_guard = threading.Lock()
+
+def _import_set(source_code):
+    """源码中导入的顶层模块名集合（包括函数内或条件分支里的导入）"""
+    modules = set()
+    for node in ast.walk(ast.parse(source_code)):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules.add(node.module.split('.')[0])
+    return sorted(modules)
+
+@contextlib.contextmanager
+def _file_lock(lock_path):
+    """跨进程的排他文件锁"""
+    with open(lock_path, 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK 重试约10秒后仍拿不到锁会抛出异常，继续等待
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
 
+def _try_file_lock(f):
+    """非阻塞地获取排他文件锁，成功返回 True"""
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+@contextlib.contextmanager
+def _build_slot(on_output=None):
+    """占用一个打包名额，没有空闲名额时等待。
+    名额是 BUILD_SLOT_DIR 下的 BUILD_MAX_CONCURRENCY 个锁文件，同一台机器上的所有服务进程共用；
+    进程退出时文件锁由系统释放，不会遗留被占用的名额。"""
+    BUILD_SLOT_DIR.mkdir(parents=True, exist_ok=True)
+    waited = False
+    while True:
+        for index in range(BUILD_MAX_CONCURRENCY):
+            f = open(BUILD_SLOT_DIR / f'slot-{index}.lock', 'a+b')
+            if not _try_file_lock(f):
+                f.close()
+                continue
+            try:
+                yield
+            finally:
+                if not fcntl:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                f.close()  # flock 随文件关闭释放
+            return
+        if not waited:
+            waited = True
+            logger.info(f"All {BUILD_MAX_CONCURRENCY} build slot(s) are busy, waiting")
+            if on_output:
+                on_output(f'同时运行的打包已达上限 ({BUILD_MAX_CONCURRENCY})，等待空闲名额')
+        time.sleep(BUILD_SLOT_POLL_INTERVAL)
+
+@contextlib.contextmanager
+def _build_workspace(source_code, language, temp_dir):
+    """返回本次打包使用的工作目录等参数；预热模式下持有该工作目录的锁直到打包结束"""
+    if not WARM_BUILDS:
+        yield {'warm': False, 'work_dir': temp_dir, 'source_file': None, 'output_dir': None,
+               'program_name': None, 'command_key': 'build_command'}
+        return
+
+    digest = hashlib.sha256()
+    for part in [sys.version, SUPPORTED_LANGUAGES[language]['warm_build_command']] + _import_set(source_code):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    work_dir = WARM_BUILD_DIR / digest.hexdigest()[:16]
+    work_dir.mkdir(parents=True, exist_ok=True)
+    with _warm_dir_locks_guard:
+        thread_lock = _warm_dir_locks.setdefault(work_dir.name, threading.Lock())
+    with thread_lock, _file_lock(work_dir / '.lock'):
+        logger.debug(f"Using warm build directory: {work_dir}")
+        yield {'warm': True, 'work_dir': work_dir, 'source_file': work_dir / 'source.py',
+               'output_dir': work_dir / 'dist', 'program_name': WARM_BUILD_NAME,
+               'command_key': 'warm_build_command'}
+
+def _run_build_command(cmd, program_name, on_output=None):
+    """执行打包命令并逐行转发输出，返回 (是否成功, 错误信息)"""
+    with _build_slot(on_output):
+        return _run_build_process(cmd, program_name, on_output)
+
+def _run_build_process(cmd, program_name, on_output=None):
+    logger.debug(f"Executing build command: {cmd}")
 
-        return jsonify({
-            'status': 'success',
-            'message': f'程序 "{program_name}" 添加并打包成功！',
-            'icon_path': icon_filename # Send path relative to static/
-        })
+    try:
+        # Log PATH environment variable
+        logger.debug(f"PATH Environment Variable: {os.environ.get('PATH', 'Not Set')}")
+
+        # Run PyInstaller，stderr 合并到 stdout，逐行读取并实时转发
+        process = subprocess.Popen(
+            cmd,
+            shell=True, # Often necessary on Windows for complex commands/paths
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            cwd=os.getcwd(), # Run from the project root context
+            encoding='utf-8', # Specify encoding for stdout/stderr
+            errors='ignore' # Ignore decoding errors
+        )
+        # 超时由计时器负责结束进程，读取循环随之结束
+        timed_out = threading.Event()
+        def _kill_on_timeout():
+            timed_out.set()
+            process.kill()
+        watchdog = threading.Timer(BUILD_TIMEOUT, _kill_on_timeout) # 20 min timeout
+        watchdog.daemon = True
+        watchdog.start()
+        last_line = ''  # 只保留最后一行作为错误摘要，不在内存中累积完整输出
+        try:
+            for line in process.stdout:
+                line = line.rstrip('\r\n')
+                if not line.strip():
+                    continue
+                last_line = line
+                if on_output:
+                    on_output(line)
+            process.wait()
+        finally:
+            watchdog.cancel()
+            process.stdout.close()
+
+        logger.debug(f"Build process return code: {process.returncode}")
+
+        if timed_out.is_set():
+            logger.warning("Build process timed out.")
+            return False, "打包进程超时 (超过20分钟)，可能是程序过大或系统资源不足。"
+
+        if process.returncode != 0:
+            # Provide more specific error if possible
+            error_msg = f"打包失败 (返回码: {process.returncode})"
+            if last_line:
+                 # Use last line of PyInstaller output as potential summary
+                 error_msg += f": {last_line[:200]}"
+            return False, error_msg
 
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"添加程序时发生意外错误: {error_details}")
-        return jsonify({'status': 'error', 'message': f'添加程序出错：{str(e)}'})
+        logger.exception(f"Exception during build command execution: {e}")
+        return False, f"执行打包命令时发生异常: {str(e)}"
+
+    return True, None
 
 # 打包程序为可执行文件
-def build_executable(program_name, source_file, language):
-    print(f"开始打包程序: {program_name}, 语言: {language}")
+def build_executable(program_name, source_file, language, on_output=None, exe_dir=None):
+    """
+    打包程序；on_output 为可选回调，PyInstaller 每输出一行调用一次。
+    exe_dir 为产物所在目录，默认是 exe_programs/<name>/（更新程序时每个版本使用单独的子目录）。
+    """
+    logger.info(f"开始打包程序: {program_name}, 语言: {language}")
     try:
         if language != 'python': # Only support python
-            print(f"不支持的语言: {language}")
+            logger.warning(f"不支持的语言: {language}")
             return False, None, f"不支持的语言：{language}"
 
         # Log environment details
-        print(f"Python Version: {sys.version}")
-        print(f"Python Executable: {sys.executable}")
-        print(f"Working Directory: {os.getcwd()}")
-        print(f"Source File Path: {source_file} (Exists: {os.path.exists(source_file)})")
+        logger.debug(f"Python Version: {sys.version}")
+        logger.debug(f"Python Executable: {sys.executable}")
+        logger.debug(f"Working Directory: {os.getcwd()}")
+        logger.debug(f"Source File Path: {source_file} (Exists: {os.path.exists(source_file)})")
 
-        exe_dir = Path(EXE_DIR) / program_name # Path where the final exe should be
+        exe_dir = Path(exe_dir or Path(EXE_DIR) / program_name) # Path where the final exe should be
         if not exe_dir.exists():
             try:
                 exe_dir.mkdir(parents=True)
             except Exception as e:
-                 print(f"Error creating EXE output directory {exe_dir}: {e}")
+                 logger.error(f"Error creating EXE output directory {exe_dir}: {e}")
                  return False, None, f"创建EXE输出目录失败: {e}"
 
-        print(f"EXE Output Directory: {exe_dir} (Exists: {exe_dir.exists()})")
+        logger.debug(f"EXE Output Directory: {exe_dir} (Exists: {exe_dir.exists()})")
 
         # Create temporary directory for build artifacts
         with tempfile.TemporaryDirectory() as temp_dir:
-            print(f"Temporary build directory: {temp_dir}")
+            logger.debug(f"Temporary build directory: {temp_dir}")
 
-            # Check Python syntax again (redundant but safe)
+            # Check Python syntax again（添加程序时已编译过，通常直接命中字节码缓存）
             try:
-                print(f"Checking Python syntax...")
+                logger.debug(f"Checking Python syntax...")
                 with open(source_file, 'r', encoding='utf-8') as f:
                     source_code = f.read()
-                compile(source_code, str(source_file), 'exec')
-                print("Python syntax OK.")
+                compile_cached(source_code, str(source_file))
+                logger.debug("Python syntax OK.")
             except SyntaxError as e:
-                print(f"Python Syntax Error: {e}")
+                logger.warning(f"Python Syntax Error: {e}")
                 return False, None, f"Python代码语法错误: {str(e)}"
 
             # Verify source file exists before attempting build
             if not os.path.exists(source_file):
-                print(f"Source file does not exist before build: {source_file}")
+                logger.warning(f"Source file does not exist before build: {source_file}")
                 return False, None, f"源文件不存在: {source_file}"
 
-            # Prepare paths for PyInstaller command, ensuring quotes and correct separators
-            source_file_str = str(source_file.absolute()).replace('\\', '/')
-            output_dir_str = str(exe_dir.absolute()).replace('\\', '/') # PyInstaller --distpath needs absolute
-            temp_dir_str = str(Path(temp_dir).absolute()).replace('\\', '/') # workpath/specpath need absolute
-
-            cmd_template = SUPPORTED_LANGUAGES[language]['build_command']
-            cmd = cmd_template.format(
-                source_file=f'"{source_file_str}"',
-                output_dir=f'"{output_dir_str}"',
-                temp_dir=f'"{temp_dir_str}"',
-                program_name=f'"{program_name}"' # Ensure program name is quoted if it contains spaces
-            )
-
-            print(f"Executing build command: {cmd}")
+            # 预期生成的可执行文件路径（Windows 下带 .exe 后缀）
+            expected_exe_name = artifact_filename(program_name)
+            final_exe_path = exe_dir / expected_exe_name # Absolute path
 
-            try:
-                # Log PATH environment variable
-                print(f"PATH Environment Variable: {os.environ.get('PATH', 'Not Set')}")
-
-                # Run PyInstaller
-                process = subprocess.Popen(
-                    cmd,
-                    shell=True, # Often necessary on Windows for complex commands/paths
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    cwd=os.getcwd(), # Run from the project root context
-                    encoding='utf-8', # Specify encoding for stdout/stderr
-                    errors='ignore' # Ignore decoding errors
-                )
-                stdout, stderr = process.communicate(timeout=1200) # 20 min timeout
-
-                print(f"Build process return code: {process.returncode}")
-                print(f"Build stdout:\n{stdout}")
-                print(f"Build stderr:\n{stderr}")
-
-                if process.returncode != 0:
-                    # Provide more specific error if possible
-                    error_msg = f"打包失败 (返回码: {process.returncode})"
-                    if stderr:
-                         # Try to extract a key error message from PyInstaller output
-                         lines = stderr.strip().split('\n')
-                         if lines: error_msg += f": {lines[-1]}" # Use last line as potential summary
-                         else: error_msg += f": {stderr[:200]}..." # Use first 200 chars
-                    elif stdout: # Sometimes errors go to stdout
-                         error_msg += f": {stdout[:200]}..."
-                    return False, None, error_msg
-
-            except subprocess.TimeoutExpired:
-                process.kill()
-                print("Build process timed out.")
-                return False, None, "打包进程超时 (超过20分钟)，可能是程序过大或系统资源不足。"
-            except Exception as e:
-                import traceback
-                error_trace = traceback.format_exc()
-                print(f"Exception during build command execution: {e}")
-                print(f"Traceback: {error_trace}")
-                return False, None, f"执行打包命令时发生异常: {str(e)}"
+            # 命中打包缓存时直接放置缓存的产物，跳过 PyInstaller
+            cache_key = build_cache_key(source_file, language)
+            cache_hit = build_cache_fetch(cache_key, final_exe_path)
+            if cache_hit:
+                logger.info(f"Build cache hit for {program_name} (key: {cache_key[:12]})")
+                if on_output:
+                    on_output(f"命中打包缓存 ({cache_key[:12]})，跳过 PyInstaller")
+            else:
+                # 先移除旧产物，避免 PyInstaller 原地覆盖与缓存共享的硬链接文件
+                final_exe_path.unlink(missing_ok=True)
+                with _build_workspace(source_code, language, temp_dir) as workspace:
+                    # 预热模式下在共享工作目录里用固定名称打包，结束后再把产物移到最终位置
+                    build_source = workspace['source_file'] or source_file
+                    if workspace['warm']:
+                        shutil.copyfile(source_file, build_source)
+                    build_output_dir = workspace['output_dir'] or exe_dir
+                    build_name = workspace['program_name'] or program_name
+
+                    # Prepare paths for PyInstaller command, ensuring quotes and correct separators
+                    source_file_str = str(Path(build_source).absolute()).replace('\\', '/')
+                    output_dir_str = str(Path(build_output_dir).absolute()).replace('\\', '/') # PyInstaller --distpath needs absolute
+                    temp_dir_str = str(Path(workspace['work_dir']).absolute()).replace('\\', '/') # workpath/specpath need absolute
+
+                    cmd_template = SUPPORTED_LANGUAGES[language][workspace['command_key']]
+                    cmd = cmd_template.format(
+                        source_file=f'"{source_file_str}"',
+                        output_dir=f'"{output_dir_str}"',
+                        temp_dir=f'"{temp_dir_str}"',
+                        program_name=f'"{build_name}"' # Ensure program name is quoted if it contains spaces
+                    )
+
+                    build_started = time.perf_counter()
+                    build_ok, error_msg = _run_build_command(cmd, program_name, on_output)
+                    build_seconds = time.perf_counter() - build_started
+                    logger.info(f"PyInstaller finished in {build_seconds:.1f}s (warm: {workspace['warm']})",
+                                extra={'program': program_name, 'duration_s': round(build_seconds, 2), 'warm': workspace['warm']})
+                    if on_output:
+                        on_output(f"PyInstaller 用时 {build_seconds:.1f} 秒{'（预热模式）' if workspace['warm'] else ''}")
+                    if not build_ok:
+                        return False, None, error_msg
+
+                    if workspace['warm']:
+                        produced = Path(build_output_dir) / artifact_filename(build_name)
+                        if produced.exists():
+                            os.replace(produced, final_exe_path)
 
             # Verify the expected executable file was created
-            expected_exe_name = program_name + '.exe'
-            final_exe_path = exe_dir / expected_exe_name # Absolute path
-
-            print(f"Looking for generated EXE: {final_exe_path} (Exists: {final_exe_path.exists()})")
+            logger.debug(f"Looking for generated EXE: {final_exe_path} (Exists: {final_exe_path.exists()})")
 
             if final_exe_path.exists():
-                print(f"Successfully found EXE: {final_exe_path}")
+                logger.debug(f"Successfully found EXE: {final_exe_path}")
+                if not cache_hit:
+                    build_cache_store(cache_key, final_exe_path)
                 # 获取绝对路径字符串，并尝试用字符串操作计算相对路径
                 try:
                     final_exe_abs_str = str(final_exe_path.resolve(strict=True))
                     exe_dir_base_abs_str = str(Path(EXE_DIR).resolve(strict=True))
-                    print(f"Attempting string manipulation for relative path: EXE={final_exe_abs_str}, Base={exe_dir_base_abs_str}")
+                    logger.debug(f"Attempting string manipulation for relative path: EXE={final_exe_abs_str}, Base={exe_dir_base_abs_str}")
 
                     # 确保基础路径后有一个分隔符，以便正确匹配
                     if not exe_dir_base_abs_str.endswith(os.path.sep):
@@ -349,14 +2809,14 @@ def build_executable(program_name, source_file, language):
                     if final_exe_abs_str.startswith(exe_dir_base_abs_str):
                         # 截取相对路径部分
                         relative_exe_path = final_exe_abs_str[len(exe_dir_base_abs_str):]
-                        print(f"Storing relative path via string manipulation: {relative_exe_path}")
+                        logger.debug(f"Storing relative path via string manipulation: {relative_exe_path}")
                         return True, relative_exe_path, None
                     else:
-                        print("EXE path does not start with base EXE dir path. Falling back.")
+                        logger.warning("EXE path does not start with base EXE dir path. Falling back.")
                         raise ValueError("String path prefix mismatch") # Trigger fallback
 
                 except (ValueError, FileNotFoundError) as e:
-                    print(f"Error calculating relative path from {final_exe_path} to {EXE_DIR} (using string method or fallback): {e}")
+                    logger.warning(f"Error calculating relative path from {final_exe_path} to {EXE_DIR} (using string method or fallback): {e}")
                     # 回退逻辑保持不变：尝试 CWD 相对路径，然后绝对路径
                     try:
                          cwd_path = Path.cwd().resolve() # Ensure CWD is resolved
@@ -364,36 +2824,296 @@ def build_executable(program_name, source_file, language):
                          if 'final_exe_abs_path' not in locals():
                               final_exe_abs_path = final_exe_path.resolve(strict=True)
                          fallback_relative_path = str(final_exe_abs_path.relative_to(cwd_path))
-                         print(f"Fallback: Storing relative path to CWD {cwd_path}: {fallback_relative_path}")
+                         logger.warning(f"Fallback: Storing relative path to CWD {cwd_path}: {fallback_relative_path}")
                          return True, fallback_relative_path, None
                     except (ValueError, FileNotFoundError) as e2:
-                         print(f"Fallback relative path calculation (to CWD) also failed: {e2}")
+                         logger.warning(f"Fallback relative path calculation (to CWD) also failed: {e2}")
                          # 最终后备：如果连 CWD 相对路径也失败，直接存储绝对路径
                          if 'final_exe_abs_path' not in locals():
                               final_exe_abs_path = final_exe_path.resolve(strict=True)
-                         print(f"Final Fallback: Storing absolute path: {final_exe_abs_path}")
+                         logger.warning(f"Final Fallback: Storing absolute path: {final_exe_abs_path}")
                          return True, str(final_exe_abs_path), None # Store absolute path as last resort
 
             else:
                 # List contents of the output directory if expected file not found
-                print(f"Expected EXE not found. Contents of {exe_dir}:")
+                logger.error(f"Expected EXE not found. Contents of {exe_dir}:")
                 try:
                      for item in exe_dir.glob('**/*'):
-                         print(f"  - {item} (Is Dir: {item.is_dir()})")
+                         logger.debug(f"  - {item} (Is Dir: {item.is_dir()})")
                 except Exception as list_e:
-                    print(f"  Error listing directory contents: {list_e}")
+                    logger.warning(f"  Error listing directory contents: {list_e}")
 
                 return False, None, "打包过程未生成预期的EXE文件，请检查PyInstaller日志。"
 
     except Exception as e:
-        import traceback
-        print(f"打包过程中发生意外错误: {e}")
-        print(traceback.format_exc())
+        logger.exception(f"打包过程中发生意外错误: {e}")
         return False, None, f"打包过程出错：{str(e)}"
 
 
+# ----- 打包后端 -----
+# 每个后端提供两个函数：
+#   build(program_name, source_file, language, on_output=None, exe_dir=None) -> (是否成功, 相对于 exe_programs/ 的产物路径, 错误信息)
+#   command(产物的绝对路径, gui) -> 启动产物的命令参数列表；gui=True 表示不需要控制台窗口（/run_program）
+# 程序使用的后端保存在数据库的 backend 列中，运行时据此选择启动方式。
+ZIPAPP_INTERPRETER = '/usr/bin/env python3'  # .pyz 的 shebang，Linux/macOS 下可以直接执行
+ZIPAPP_MTIME = 946684800  # 2000-01-01：压缩包内文件使用固定的时间，相同源码打包出相同的字节，便于产物存储去重
+
+def _check_source(source_file, language):
+    """打包前检查语言和语法，返回错误信息或 None"""
+    if language != 'python':
+        return f"不支持的语言：{language}"
+    try:
+        with open(source_file, 'r', encoding='utf-8') as f:
+            compile_cached(f.read(), str(source_file))
+    except SyntaxError as e:
+        logger.warning(f"Python Syntax Error: {e}")
+        return f"Python代码语法错误: {str(e)}"
+    except OSError:
+        return f"源文件不存在: {source_file}"
+    return None
+
+def build_zipapp(program_name, source_file, language, on_output=None, exe_dir=None):
+    """用标准库 zipapp 把程序打包成 .pyz；不包含解释器和第三方库，运行时使用服务器上的 Python"""
+    exe_dir = Path(exe_dir or Path(EXE_DIR) / program_name)
+    error_message = _check_source(source_file, language)
+    if error_message:
+        return False, None, error_message
+
+    started = time.perf_counter()
+    target = exe_dir / f'{program_name}.pyz'
+    tmp_file = exe_dir / f'.{program_name}-{uuid.uuid4().hex[:8]}.pyz'
+    try:
+        exe_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory() as staging:
+            main_file = Path(staging) / '__main__.py'
+            shutil.copyfile(source_file, main_file)
+            os.utime(main_file, (ZIPAPP_MTIME, ZIPAPP_MTIME))
+            zipapp.create_archive(staging, tmp_file, interpreter=ZIPAPP_INTERPRETER, compressed=True)
+        # 先写临时文件再替换：目标可能是存储区文件的硬链接，不能原地覆盖
+        os.replace(tmp_file, target)
+    except Exception as e:
+        logger.exception(f"打包过程中发生意外错误: {e}")
+        tmp_file.unlink(missing_ok=True)
+        return False, None, f"打包过程出错：{str(e)}"
+
+    build_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"zipapp finished in {build_ms:.1f}ms", extra={'program': program_name, 'duration_s': round(build_ms / 1000, 4)})
+    if on_output:
+        on_output(f"zipapp 用时 {build_ms:.1f} 毫秒")
+    return True, os.path.relpath(target, EXE_DIR).replace('\\', '/'), None
+
+def _normalize_zip_order(zip_path):
+    """按文件名重新排列 zip 中的条目。PyInstaller 每次生成的 base_library.zip 内容相同、顺序不同，
+    排序后不同程序的文件字节完全相同，才能在产物存储中共用"""
+    with zipfile.ZipFile(zip_path) as archive:
+        entries = archive.infolist()
+        if [entry.filename for entry in entries] == sorted(entry.filename for entry in entries):
+            return
+        tmp_file = zip_path.with_name(f'.{zip_path.name}.tmp')
+        with zipfile.ZipFile(tmp_file, 'w') as normalized:
+            for entry in sorted(entries, key=lambda entry: entry.filename):
+                normalized.writestr(entry, archive.read(entry), compress_type=entry.compress_type)
+    os.replace(tmp_file, zip_path)
+
+def build_onedir(program_name, source_file, language, on_output=None, exe_dir=None):
+    """
+    PyInstaller --onedir 打包，产物是 exe_programs/<name>/<name>/ 目录，启动时不需要解压运行时。
+    目录中的 Python 运行时（libpython、扩展模块、base_library.zip 等）对所有程序都相同，收入产物存储后
+    各程序的这些文件都是同一份文件的硬链接，每个程序实际只占用自己的可执行文件（引导程序和字节码）
+    以及额外依赖的空间。不使用打包缓存和预热工作目录。
+    """
+    exe_dir = Path(exe_dir or Path(EXE_DIR) / program_name)
+    error_message = _check_source(source_file, language)
+    if error_message:
+        return False, None, error_message
+
+    app_dir = exe_dir / program_name
+    # 旧产物中的文件可能是存储区的只读硬链接，不能让 PyInstaller 原地覆盖
+    shutil.rmtree(app_dir, ignore_errors=True)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cmd = SUPPORTED_LANGUAGES[language]['onedir_build_command'].format(
+            source_file=str(Path(source_file).absolute()).replace('\\', '/'),
+            output_dir=str(exe_dir.absolute()).replace('\\', '/'),
+            temp_dir=str(Path(temp_dir).absolute()).replace('\\', '/'),
+            program_name=program_name,
+        )
+        build_started = time.perf_counter()
+        build_ok, error_msg = _run_build_command(cmd, program_name, on_output)
+        build_seconds = time.perf_counter() - build_started
+    logger.info(f"PyInstaller (onedir) finished in {build_seconds:.1f}s", extra={'program': program_name, 'duration_s': round(build_seconds, 2)})
+    if on_output:
+        on_output(f"PyInstaller 用时 {build_seconds:.1f} 秒（onedir）")
+    final_exe_path = app_dir / artifact_filename(program_name)
+    if not build_ok or not final_exe_path.is_file():
+        shutil.rmtree(app_dir, ignore_errors=True)
+        return False, None, error_msg or "打包过程未生成预期的EXE文件，请检查PyInstaller日志。"
+
+    for zip_path in app_dir.rglob('base_library.zip'):
+        try:
+            _normalize_zip_order(zip_path)
+        except (OSError, zipfile.BadZipFile) as e:
+            logger.warning(f"Error normalizing {zip_path}: {e}")
+    return True, os.path.relpath(final_exe_path, EXE_DIR).replace('\\', '/'), None
+
+def _executable_command(artifact_path, gui=False):
+    return [str(artifact_path)]
+
+def _zipapp_command(artifact_path, gui=False):
+    interpreter = Path(sys.executable)
+    if gui and os.name == 'nt' and interpreter.with_name('pythonw.exe').exists():
+        interpreter = interpreter.with_name('pythonw.exe')  # 与 --noconsole 一致，不弹出控制台窗口
+    return [str(interpreter), str(artifact_path)]
+
+# tree=True 表示产物是可执行文件所在的整个目录，目录中的每个文件都单独收入产物存储
+PACKAGING_BACKENDS = {
+    'pyinstaller': {'build': build_executable, 'command': _executable_command},
+    'onedir': {'build': build_onedir, 'command': _executable_command, 'tree': True},
+    'zipapp': {'build': build_zipapp, 'command': _zipapp_command},
+}
+
+def artifact_command(program_info, artifact_path, gui=False):
+    """按程序的打包后端返回启动产物的命令参数列表"""
+    backend = PACKAGING_BACKENDS.get(program_info.get('backend') or 'pyinstaller', PACKAGING_BACKENDS['pyinstaller'])
+    return backend['command'](artifact_path, gui)
+
+
+# ----- 解释运行进程池 -----
+# 工作进程在启动时预加载常用模块；Linux/macOS 下通过 forkserver 创建，避免从带有后台线程的
+# Web 进程直接 fork。进程池在第一次解释运行时才创建。
+_interp_pool = None
+_interp_pool_lock = threading.Lock()
+# 进程池的任务队列没有上限，已提交、尚未结束的运行数由这个信号量限制
+_run_slots = threading.BoundedSemaphore(RUN_MAX_CONCURRENCY) if RUN_MAX_CONCURRENCY > 0 else None
+
+def _get_interp_pool():
+    global _interp_pool
+    with _interp_pool_lock:
+        if _interp_pool is None:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                ctx = multiprocessing.get_context('forkserver')
+                # 预加载 __main__ 后，工作进程从 forkserver 继承即可，不必各自重新导入主模块
+                ctx.set_forkserver_preload(['__main__', 'interp_worker'] + INTERP_PRELOAD_MODULES)
+            else:
+                ctx = multiprocessing.get_context('spawn')
+            _interp_pool = ctx.Pool(
+                processes=INTERP_POOL_SIZE,
+                initializer=interp_worker.preload,
+                initargs=(INTERP_PRELOAD_MODULES,),
+                maxtasksperchild=INTERP_RECYCLE_AFTER,
+            )
+            logger.info(f"Started interpreter pool: {INTERP_POOL_SIZE} worker(s), recycle after {INTERP_RECYCLE_AFTER}, isolation={INTERP_ISOLATION}")
+        return _interp_pool
+
+def run_interpreted(program_name, source_file):
+    """把程序提交到解释运行进程池，立即返回；已提交的运行数达到 RUN_MAX_CONCURRENCY 时返回 False"""
+    run_slots = _run_slots
+    if run_slots and not run_slots.acquire(blocking=False):
+        return False
+    source_file = Path(source_file).resolve()
+    try:
+        bytecode_file = str(compile_cached(source_file.read_bytes(), str(source_file)).resolve())
+    except (OSError, SyntaxError, ValueError):
+        bytecode_file = None  # 由工作进程直接运行源码，错误信息照常输出
+    request_id = _request_id_var.get()  # 回调在进程池的结果线程里执行
+    def _finished():
+        metrics_gauge_add('app_running_programs', -1, mode='interpreted')
+        if run_slots:
+            run_slots.release()
+    def _on_done(exit_code):
+        _finished()
+        logger.info(f"Interpreted program '{program_name}' exited with code {exit_code}",
+                    extra={'program': program_name, 'exit_code': exit_code, 'request_id': request_id})
+    def _on_error(e):
+        _finished()
+        if isinstance(e, TimeoutError):
+            logger.warning(f"Interpreted program '{program_name}' timed out: {e}",
+                           extra={'program': program_name, 'request_id': request_id})
+            return
+        logger.error(f"Interpreted program '{program_name}' failed in worker: {e}",
+                     extra={'program': program_name, 'request_id': request_id})
+    metrics_gauge_add('app_running_programs', 1, mode='interpreted')
+    try:
+        _get_interp_pool().apply_async(
+            interp_worker.run_program,
+            (str(source_file), str(source_file.parent), INTERP_ISOLATION, bytecode_file, INTERP_WALL_TIMEOUT),
+            callback=_on_done, error_callback=_on_error,
+        )
+    except Exception:
+        _finished()
+        raise
+    return True
+
+def load_program_info(program_name):
+    """从数据库读取打包成功的程序信息，返回 (程序信息, 错误信息)"""
+    try:
+        program_info = get_program(program_name)
+    except sqlite3.Error as e:
+        logger.warning(f"Error reading program info for {program_name}: {e}")
+        return None, f'读取程序信息失败: {e}'
+    if program_info is None:
+        return None, f'程序 "{program_name}" 不存在'
+    if program_info['build_status'] != 'succeeded':
+        return None, f'程序 "{program_name}" 正在打包中，请稍后'
+    return program_info, None
+
+def resolve_source_path(program_name, program_info):
+    """返回程序源代码的路径，返回 (路径, 错误信息)"""
+    # 旧版本导入的记录可能保存的是 Windows 路径分隔符
+    source_relative = program_info.get('source_file', f'{program_name}/source.py').replace('\\', '/')
+    source_path = Path(PROGRAMS_DIR) / source_relative
+    if not source_path.exists():
+        return None, f'找不到程序源代码: {source_relative}'
+    return source_path, None
+
+def resolve_exe_path(program_info):
+    """根据程序信息中的 exe_path 找到可执行文件的绝对路径，返回 (路径, 错误信息)"""
+    exe_relative_or_abs_path_str = program_info.get('exe_path')
+    if not exe_relative_or_abs_path_str:
+        return None, '程序信息中缺少可执行文件路径 (exe_path)'
+
+    # 旧版本导入的记录可能保存的是 Windows 路径分隔符
+    exe_relative_or_abs_path_str = exe_relative_or_abs_path_str.replace('\\', '/')
+    exe_path_obj = Path(exe_relative_or_abs_path_str)
+    exe_abs_path = None # Initialize
+
+    # 检查存储的路径是否已经是绝对路径
+    if exe_path_obj.is_absolute():
+        if exe_path_obj.exists():
+            exe_abs_path = exe_path_obj # 直接使用存储的绝对路径
+            logger.debug(f"Using stored absolute path: {exe_abs_path}")
+        else:
+            logger.warning(f"Stored absolute path does not exist: {exe_path_obj}")
+            return None, f'记录的绝对可执行文件路径无效或文件丢失: {exe_path_obj}'
+    else:
+        # 存储的是相对路径，尝试解析
+        # 优先相对于 EXE_DIR 解析
+        potential_path1 = (Path(EXE_DIR).resolve() / exe_relative_or_abs_path_str).resolve() # Resolve combined path
+        # 其次相对于 CWD 解析 (作为后备)
+        potential_path2 = (Path.cwd() / exe_relative_or_abs_path_str).resolve() # Resolve combined path
+
+        if potential_path1.exists():
+             exe_abs_path = potential_path1
+             logger.debug(f"Resolved relative path using EXE_DIR: {exe_abs_path}")
+        elif potential_path2.exists():
+             exe_abs_path = potential_path2
+             logger.debug(f"Resolved relative path using CWD: {exe_abs_path}")
+        else:
+             # 如果两种方式都找不到，则报告错误
+             logger.warning(f"Cannot find executable using relative path: {exe_relative_or_abs_path_str}")
+             logger.warning(f"Checked relative to EXE_DIR: {potential_path1}")
+             logger.warning(f"Checked relative to CWD: {potential_path2}")
+             return None, f'找不到可执行文件，相对路径无效: {exe_relative_or_abs_path_str}'
+
+    # 最终检查 exe_abs_path 是否有效且存在
+    if not exe_abs_path or not exe_abs_path.exists():
+        logger.warning(f"Executable file still not found or path invalid at final path: {exe_abs_path}")
+        return None, f'最终计算的可执行文件路径无效: {exe_abs_path}'
+
+    return exe_abs_path, None
+
 # 路由: 运行程序
-@app.route('/run_program', methods=['POST'])
+@bp.route('/run_program', methods=['POST'])
+@rate_limited()
 def run_program():
     try:
         data = request.get_json()
@@ -402,74 +3122,46 @@ def run_program():
         if not program_name:
             return jsonify({'status': 'error', 'message': '未提供程序名称'})
 
-        programs_dir = Path(PROGRAMS_DIR)
-        program_dir = programs_dir / program_name
-        info_file = program_dir / 'info.json'
-
-        if not info_file.exists():
-            return jsonify({'status': 'error', 'message': f'程序信息文件 "info.json" 不存在于 {program_dir}'})
-
-        try:
-            with open(info_file, 'r', encoding='utf-8') as f:
-                program_info = json.load(f)
-        except Exception as e:
-            print(f"Error reading info.json {info_file}: {e}")
-            return jsonify({'status': 'error', 'message': f'读取程序信息失败: {e}'})
+        program_info, error_message = load_program_info(program_name)
+        if error_message:
+            return jsonify({'status': 'error', 'message': error_message})
 
-
-        exe_relative_or_abs_path_str = program_info.get('exe_path')
-        if not exe_relative_or_abs_path_str:
-            return jsonify({'status': 'error', 'message': '程序信息中缺少可执行文件路径 (exe_path)'})
-
-        exe_path_obj = Path(exe_relative_or_abs_path_str)
-        exe_abs_path = None # Initialize
-
-        # 检查存储的路径是否已经是绝对路径
-        if exe_path_obj.is_absolute():
-            if exe_path_obj.exists():
-                exe_abs_path = exe_path_obj # 直接使用存储的绝对路径
-                print(f"Using stored absolute path: {exe_abs_path}")
-            else:
-                print(f"Stored absolute path does not exist: {exe_path_obj}")
-                return jsonify({'status': 'error', 'message': f'记录的绝对可执行文件路径无效或文件丢失: {exe_path_obj}'})
-        else:
-            # 存储的是相对路径，尝试解析
-            # 优先相对于 EXE_DIR 解析
-            potential_path1 = (Path(EXE_DIR).resolve() / exe_relative_or_abs_path_str).resolve() # Resolve combined path
-            # 其次相对于 CWD 解析 (作为后备)
-            potential_path2 = (Path.cwd() / exe_relative_or_abs_path_str).resolve() # Resolve combined path
-
-            if potential_path1.exists():
-                 exe_abs_path = potential_path1
-                 print(f"Resolved relative path using EXE_DIR: {exe_abs_path}")
-            elif potential_path2.exists():
-                 exe_abs_path = potential_path2
-                 print(f"Resolved relative path using CWD: {exe_abs_path}")
-            else:
-                 # 如果两种方式都找不到，则报告错误
-                 print(f"Cannot find executable using relative path: {exe_relative_or_abs_path_str}")
-                 print(f"Checked relative to EXE_DIR: {potential_path1}")
-                 print(f"Checked relative to CWD: {potential_path2}")
-                 return jsonify({'status': 'error', 'message': f'找不到可执行文件，相对路径无效: {exe_relative_or_abs_path_str}'})
-
-        # 最终检查 exe_abs_path 是否有效且存在
-        if not exe_abs_path or not exe_abs_path.exists():
-            print(f"Executable file still not found or path invalid at final path: {exe_abs_path}")
-            return jsonify({'status': 'error', 'message': f'最终计算的可执行文件路径无效: {exe_abs_path}'})
+        run_mode = data.get('mode') or DEFAULT_RUN_MODE
+        if run_mode == 'interpreted':
+            source_path, error_message = resolve_source_path(program_name, program_info)
+            if error_message:
+                return jsonify({'status': 'error', 'message': error_message})
+            try:
+                submitted = run_interpreted(program_name, source_path)
+            except Exception as e:
+                logger.error(f"Error submitting interpreted run for {program_name}: {e}")
+                return jsonify({'status': 'error', 'message': f'解释运行程序失败：{str(e)}'})
+            if not submitted:
+                return overloaded_response(503, '当前运行的程序过多，请稍后再试', RUN_RETRY_AFTER, 'run_busy')
+            logger.info(f"Submitted interpreted run for '{program_name}'")
+            record_program_run(program_name)
+            return jsonify({'status': 'success', 'message': '程序启动成功', 'mode': 'interpreted'})
+        elif run_mode != 'exe':
+            return jsonify({'status': 'error', 'message': f'不支持的运行方式：{run_mode}'})
+
+        exe_abs_path, error_message = resolve_exe_path(program_info)
+        if error_message:
+            return jsonify({'status': 'error', 'message': error_message})
 
         # Use ShellExecuteW to run the program
-        print(f"Attempting to run executable: {exe_abs_path}")
+        command = artifact_command(program_info, exe_abs_path, gui=True)
+        logger.debug(f"Attempting to run executable: {command}")
         SW_SHOWNORMAL = 1
         try:
              result = ctypes.windll.shell32.ShellExecuteW(
                  None,       # hwnd
                  "open",     # lpOperation
-                 str(exe_abs_path), # lpFile
-                 None,       # lpParameters
+                 command[0], # lpFile
+                 subprocess.list2cmdline(command[1:]) or None, # lpParameters
                  str(exe_abs_path.parent), # lpDirectory
                  SW_SHOWNORMAL # nShowCmd
              )
-             print(f"ShellExecuteW result code: {result}")
+             logger.debug(f"ShellExecuteW result code: {result}")
 
              if result <= 32:
                  # Map common error codes
@@ -480,29 +3172,257 @@ def run_program():
                      30: "DDE事务已中止", 31: "目标应用程序没有响应", 32: "共享冲突"
                  }
                  error_msg = error_messages.get(result, f"未知错误，代码：{result}")
-                 print(f"Failed to run program '{program_name}'. Error: {error_msg}")
+                 logger.error(f"Failed to run program '{program_name}'. Error: {error_msg}")
                  return jsonify({'status': 'error', 'message': f'运行程序失败：{error_msg}'})
 
-             print(f"Successfully launched program '{program_name}'")
+             logger.info(f"Successfully launched program '{program_name}'")
+             record_program_run(program_name)
              return jsonify({'status': 'success', 'message': '程序启动成功'}) # Keep success message for potential frontend use
 
         except Exception as e:
-            import traceback
-            error_trace = traceback.format_exc()
-            print(f"Exception during ShellExecuteW for {program_name}: {e}")
-            print(f"Traceback: {error_trace}")
+            logger.exception(f"Exception during ShellExecuteW for {program_name}: {e}")
             return jsonify({'status': 'error', 'message': f'运行程序时发生系统错误：{str(e)}'})
 
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"运行程序路由时发生意外错误: {e}")
-        print(f"Traceback: {error_trace}")
+        logger.exception(f"运行程序路由时发生意外错误: {e}")
         return jsonify({'status': 'error', 'message': f'运行程序出错：{str(e)}'})
 
 
+# ----- 带输出捕获的运行 -----
+# 子进程先经过一个很小的启动脚本设置 rlimit，再 exec 成真正的程序，这样不需要在多线程的
+# Web 进程里使用 preexec_fn。Windows 没有 resource 模块，只能限制墙钟时间。
+_RLIMIT_LAUNCHER = (
+    "import os, resource, sys\n"
+    "cpu, mem = int(sys.argv[1]), int(sys.argv[2])\n"
+    "resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))\n"
+    "resource.setrlimit(resource.RLIMIT_CORE, (0, 0))\n"
+    "if mem:\n"
+    "    resource.setrlimit(resource.RLIMIT_AS, (mem, mem))\n"
+    "os.execv(sys.argv[3], sys.argv[3:])\n"
+)
+_execute_slots = threading.BoundedSemaphore(EXECUTE_MAX_CONCURRENCY)
+
+def _read_bounded(stream, limit, result):
+    """读取整个流，只保留前 limit 个字节，其余的丢弃但计数，避免缓冲区无限增长"""
+    kept = bytearray()
+    dropped = 0
+    for chunk in iter(lambda: stream.read(8192), b''):
+        room = limit - len(kept)
+        if room > 0:
+            kept += chunk[:room]
+        dropped += max(0, len(chunk) - max(room, 0))
+    stream.close()
+    result['text'] = kept.decode('utf-8', errors='replace')
+    result['truncated_bytes'] = dropped
+
+def execute_captured(cmd, cwd, stdin_data=b'', timeout=EXECUTE_WALL_TIMEOUT):
+    """在资源限制下运行命令，返回退出码、输出和耗时"""
+    if os.name != 'nt':
+        cmd = [sys.executable, '-c', _RLIMIT_LAUNCHER, str(EXECUTE_CPU_SECONDS), str(EXECUTE_MEMORY_BYTES)] + cmd
+    env = dict(os.environ, PYTHONIOENCODING='utf-8', PYTHONUNBUFFERED='1')
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.PIPE if stdin_data else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,  # 独立进程组，超时时连同子进程一起结束
+    )
+    outputs = {'stdout': {}, 'stderr': {}}
+    readers = [threading.Thread(target=_read_bounded, args=(getattr(process, name), EXECUTE_OUTPUT_LIMIT, outputs[name]), daemon=True)
+               for name in outputs]
+    for reader in readers:
+        reader.start()
+    if stdin_data:
+        try:
+            process.stdin.write(stdin_data)
+            process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+    timed_out = False
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        if os.name != 'nt':
+            try:
+                os.killpg(process.pid, 9)
+            except ProcessLookupError:
+                pass
+        else:
+            process.kill()
+        process.wait()
+    for reader in readers:
+        reader.join(timeout=5)
+    return {
+        'exit_code': process.returncode,
+        'timed_out': timed_out,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+        'stdout': outputs['stdout'].get('text', ''),
+        'stderr': outputs['stderr'].get('text', ''),
+        'stdout_truncated_bytes': outputs['stdout'].get('truncated_bytes', 0),
+        'stderr_truncated_bytes': outputs['stderr'].get('truncated_bytes', 0),
+    }
+
+# 路由: 运行程序并返回输出
+# 请求体: {"name": 程序名, "target": "source" 或 "artifact", "stdin": 可选输入, "timeout": 可选秒数}
+@bp.route('/execute', methods=['POST'])
+@rate_limited()
+def execute_program():
+    try:
+        data = request.get_json() or {}
+        program_name = data.get('name', '')
+        target = data.get('target', 'source')
+
+        if not program_name or not all(c.isalnum() or c == '_' for c in program_name):
+            return jsonify({'status': 'error', 'message': '程序名称无效'})
+        if target not in ('source', 'artifact'):
+            return jsonify({'status': 'error', 'message': f'不支持的运行目标：{target}'})
+        try:
+            timeout = float(data.get('timeout', EXECUTE_WALL_TIMEOUT))
+        except (TypeError, ValueError):
+            timeout = math.nan
+        # nan 与上限比较总是 False，min() 会原样返回，process.wait(nan) 永远不会超时
+        if not math.isfinite(timeout) or timeout <= 0:
+            return jsonify({'status': 'error', 'message': 'timeout 必须是大于 0 的数字'}), 400
+        timeout = min(timeout, EXECUTE_WALL_TIMEOUT)
+
+        program_info, error_message = load_program_info(program_name)
+        if error_message:
+            return jsonify({'status': 'error', 'message': error_message})
+
+        if target == 'source':
+            source_path, error_message = resolve_source_path(program_name, program_info)
+            if error_message:
+                return jsonify({'status': 'error', 'message': error_message})
+            source_path = source_path.resolve()
+            cmd, cwd = [sys.executable, str(source_path)], source_path.parent
+        else:
+            exe_abs_path, error_message = resolve_exe_path(program_info)
+            if error_message:
+                return jsonify({'status': 'error', 'message': error_message})
+            cmd, cwd = artifact_command(program_info, exe_abs_path), exe_abs_path.parent
+
+        if not _execute_slots.acquire(timeout=EXECUTE_QUEUE_WAIT):
+            return overloaded_response(503, '当前运行的程序过多，请稍后再试', EXECUTE_RETRY_AFTER, 'execute_busy')
+        metrics_gauge_add('app_running_programs', 1, mode='execute')
+        try:
+            result = execute_captured(cmd, cwd, str(data.get('stdin', '')).encode('utf-8'), timeout)
+        finally:
+            metrics_gauge_add('app_running_programs', -1, mode='execute')
+            _execute_slots.release()
+
+        record_program_run(program_name)
+        logger.info(f"Executed '{program_name}' ({target}): exit={result['exit_code']}, {result['duration_ms']}ms, timed_out={result['timed_out']}",
+                    extra={'program': program_name, 'exit_code': result['exit_code'], 'duration_ms': result['duration_ms']})
+        result.update({'status': 'success', 'name': program_name, 'target': target})
+        return jsonify(result)
+
+    except Exception as e:
+        logger.exception(f"执行程序时发生意外错误: {e}")
+        return jsonify({'status': 'error', 'message': f'执行程序出错：{str(e)}'})
+
+# ----- 回收站 -----
+# 删除请求只把目录重命名进 .trash/（同一文件系统内是 O(1) 的原子操作）就返回，
+# 真正释放磁盘由后台线程按 TRASH_GC_BYTES_PER_SEC 限速完成，避免集中删除大文件时拖慢其他请求。
+_trash_wakeup = threading.Event()
+_trash_collector = None
+_trash_lock = threading.Lock()
+_trash_stats = {'moved': 0, 'collected': 0, 'freed_bytes': 0, 'errors': 0}
+
+def move_to_trash(path, kind):
+    """把目录或文件重命名到回收站，路径不存在时返回 False；重命名失败时抛出异常"""
+    TRASH_DIR.mkdir(exist_ok=True)
+    # 名称以时间开头，后台线程按先删除先回收的顺序处理
+    target = TRASH_DIR / f'{time.time():.6f}-{uuid.uuid4().hex[:8]}-{kind}-{Path(path).name}'
+    try:
+        os.rename(path, target)
+    except FileNotFoundError:
+        return False
+    with _trash_lock:
+        _trash_stats['moved'] += 1
+    _ensure_trash_collector()
+    _trash_wakeup.set()
+    return True
+
+def _ensure_trash_collector():
+    global _trash_collector
+    with _trash_lock:
+        if _trash_collector is None:
+            _trash_collector = threading.Thread(target=_trash_collector_loop, name='trash-collector', daemon=True)
+            _trash_collector.start()
+
+def _trash_collector_loop():
+    while True:
+        _trash_wakeup.wait(timeout=TRASH_GC_RETRY_INTERVAL)
+        _trash_wakeup.clear()
+        # 多个工作进程共用一个回收站：同一时间只有一个进程在删除，总速率仍不超过上限
+        with _file_lock(TRASH_LOCK_PATH):
+            try:
+                entries = sorted(TRASH_DIR.iterdir()) if TRASH_DIR.exists() else []
+            except OSError as e:
+                logger.warning(f"Error listing trash directory: {e}")
+                continue
+            pacer = {'started': time.monotonic(), 'charged': 0}
+            for entry in entries:
+                _collect_trash_entry(entry, pacer)
+
+def _pace_trash_io(pacer, nbytes):
+    """按删除的字节数限速：删除进度超前于速率上限时睡眠"""
+    if TRASH_GC_BYTES_PER_SEC <= 0:
+        return
+    pacer['charged'] += max(nbytes, TRASH_GC_MIN_FILE_COST)
+    ahead = pacer['charged'] / TRASH_GC_BYTES_PER_SEC - (time.monotonic() - pacer['started'])
+    if ahead > 0:
+        time.sleep(ahead)
+
+def _collect_trash_entry(entry, pacer):
+    freed = 0
+    try:
+        if entry.is_dir() and not entry.is_symlink():
+            for root, dirs, files in os.walk(entry, topdown=False):
+                for name in files:
+                    file_path = os.path.join(root, name)
+                    size = os.lstat(file_path).st_size
+                    os.unlink(file_path)
+                    freed += size
+                    _pace_trash_io(pacer, size)
+                for name in dirs:
+                    dir_path = os.path.join(root, name)
+                    if os.path.islink(dir_path):
+                        os.unlink(dir_path)
+                    else:
+                        os.rmdir(dir_path)
+            os.rmdir(entry)
+        else:
+            size = entry.lstat().st_size
+            entry.unlink()
+            freed += size
+            _pace_trash_io(pacer, size)
+    except OSError as e:
+        # 留在回收站中，下次唤醒时重试
+        logger.warning(f"Error collecting trash entry {entry}: {e}")
+        with _trash_lock:
+            _trash_stats['errors'] += 1
+            _trash_stats['freed_bytes'] += freed
+        return
+    with _trash_lock:
+        _trash_stats['collected'] += 1
+        _trash_stats['freed_bytes'] += freed
+
+# 路由: 回收站状态
+@bp.route('/trash_stats')
+def trash_stats():
+    with _trash_lock:
+        stats = dict(_trash_stats)
+    stats['pending'] = len(list(TRASH_DIR.iterdir())) if TRASH_DIR.exists() else 0
+    stats['bytes_per_sec'] = TRASH_GC_BYTES_PER_SEC
+    return jsonify({'status': 'success', 'trash': stats})
+
 # 路由: 批量删除程序
-@app.route('/delete_programs', methods=['POST'])
+@bp.route('/delete_programs', methods=['POST'])
 def delete_programs():
     try:
         data = request.get_json()
@@ -518,52 +3438,31 @@ def delete_programs():
         success_count = 0
         errors = []
 
+        # 先在一个事务中删除数据库记录（同时取得图标路径），再清理文件
+        removed = {program_info['name']: program_info for program_info in remove_programs(program_names)}
+
         for program_name in program_names:
             program_dir = programs_dir / program_name
             program_exe_dir = exe_dir / program_name
-            icon_path = None
+            program_info = removed.get(program_name, {})
             error_messages = []
 
-            # 获取图标路径
-            info_file = program_dir / 'info.json'
-            if info_file.exists():
-                try:
-                    with open(info_file, 'r', encoding='utf-8') as f:
-                        program_info = json.load(f)
-                        icon_relative = program_info.get('icon', '')
-                        if icon_relative and icon_relative != 'placeholder_icon.png':
-                            # 构造静态文件绝对路径
-                            icon_path = Path(current_app.static_folder) / icon_relative
-                except Exception as e:
-                    error_messages.append(f"读取图标信息失败: {str(e)}")
-
-            # 删除源代码目录
+            # 源代码目录和EXE目录移入回收站，由后台线程删除；源码的字节码缓存一并移入
+            source_relative = program_info.get('source_file', f'{program_name}/source.py').replace('\\', '/')
+            discard_bytecode(programs_dir / source_relative)
             try:
-                shutil.rmtree(program_dir)
-                print(f"已删除源代码目录: {program_dir}")
-            except FileNotFoundError:
-                print(f"源代码目录不存在: {program_dir}")
+                move_to_trash(program_dir, 'src')
             except Exception as e:
                 error_messages.append(f"删除源代码失败: {str(e)}")
 
-            # 删除EXE目录
             try:
-                shutil.rmtree(program_exe_dir)
-                print(f"已删除EXE目录: {program_exe_dir}")
-            except FileNotFoundError:
-                print(f"EXE目录不存在: {program_exe_dir}")
+                move_to_trash(program_exe_dir, 'exe')
             except Exception as e:
                 error_messages.append(f"删除EXE文件失败: {str(e)}")
 
-            # 删除图标文件
-            if icon_path:
-                try:
-                    icon_path.unlink()
-                    print(f"已删除图标: {icon_path}")
-                except FileNotFoundError:
-                    print(f"图标文件不存在: {icon_path}")
-                except Exception as e:
-                    error_messages.append(f"删除图标失败: {str(e)}")
+            # 删除图标文件和缩略图
+            for icon_error in remove_icon_files(program_info.get('icon'), program_info.get('icon_thumbs')):
+                error_messages.append(f"删除图标失败: {icon_error}")
 
             # 统计结果
             if not error_messages:
@@ -571,6 +3470,8 @@ def delete_programs():
             else:
                 errors.append(f"程序 '{program_name}': {', '.join(error_messages)}")
 
+        logger.info(f"已删除 {success_count}/{len(program_names)} 个程序，磁盘空间由后台回收")
+
         # 构造响应
         if success_count == len(program_names):
             return jsonify({'status': 'success', 'message': f'成功删除 {success_count} 个程序'})
@@ -584,77 +3485,118 @@ def delete_programs():
             return jsonify({'status': 'error', 'message': '删除失败', 'errors': errors})
 
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"删除程序时发生意外错误: {e}")
         return jsonify({'status': 'error', 'message': f'服务器错误: {str(e)}'})
 
 # 清理所有程序（包括旧格式和空目录）
-@app.route('/clean_all_programs', methods=['POST'])
+@bp.route('/clean_all_programs', methods=['POST'])
 def clean_all_programs():
-    print("开始清理所有程序...")
+    logger.info("开始清理所有程序...")
     programs_dir = Path(PROGRAMS_DIR)
     exe_dir = Path(EXE_DIR)
     icon_dir = Path('static/program_icons')
     errors = []
 
-    # Clean programs directory
-    if programs_dir.exists():
-        print(f"清理目录: {programs_dir}")
-        for item in programs_dir.iterdir():
-            try:
-                if item.is_dir():
-                    print(f"  删除子目录: {item}")
-                    shutil.rmtree(item)
-                elif item.is_file(): # Should not happen with current structure, but clean anyway
-                    print(f"  删除文件: {item}")
-                    item.unlink()
-            except Exception as e:
-                err_msg = f"删除 {item} 时出错: {e}"
-                print(f"  错误: {err_msg}")
-                errors.append(err_msg)
+    removed_programs = [program_info['name'] for program_info in remove_programs(None)]
 
-    # Clean EXE directory
-    if exe_dir.exists():
-        print(f"清理目录: {exe_dir}")
-        for item in exe_dir.iterdir():
+    # Clean programs, EXE directories, leftover artifact blobs and bytecode cache: 每一项都移入回收站，由后台线程删除
+    for base_dir, kind in ((programs_dir, 'src'), (exe_dir, 'exe'), (ARTIFACT_STORE_DIR, 'blob'),
+                           (BYTECODE_CACHE_DIR, 'pyc')):
+        if not base_dir.exists():
+            continue
+        for item in base_dir.iterdir():
             try:
-                if item.is_dir():
-                    print(f"  删除子目录: {item}")
-                    shutil.rmtree(item)
-                elif item.is_file():
-                    print(f"  删除文件: {item}")
-                    item.unlink()
+                if move_to_trash(item, kind) and kind == 'src' and item.name not in removed_programs:
+                    removed_programs.append(item.name)
             except Exception as e:
                 err_msg = f"删除 {item} 时出错: {e}"
-                print(f"  错误: {err_msg}")
+                logger.warning(f"  错误: {err_msg}")
                 errors.append(err_msg)
 
     # Clean icons directory (excluding placeholder)
     if icon_dir.exists():
-        print(f"清理目录: {icon_dir}")
         for icon in icon_dir.iterdir():
             # Keep placeholder and potentially default icon if needed later
             if icon.is_file() and icon.name not in ['placeholder_icon.png', 'default_icon.png']:
                  try:
-                    print(f"  删除图标: {icon}")
                     icon.unlink()
                  except Exception as e:
                      err_msg = f"删除图标 {icon} 时出错: {e}"
-                     print(f"  错误: {err_msg}")
+                     logger.warning(f"  错误: {err_msg}")
                      errors.append(err_msg)
 
+    logger.info(f"已清理 {len(removed_programs)} 个程序目录，磁盘空间由后台回收")
+
     if not errors:
         return jsonify({'status': 'success', 'message': '所有程序已成功清理完毕'})
     else:
         error_summary = '，'.join(errors)
         return jsonify({'status': 'error', 'message': f'清理程序时发生错误：{error_summary}'})
 
+# ----- 应用工厂 -----
+# create_app() 可以重复调用，进程级的初始化只执行一次。生产环境由 serve.py 在主进程中创建应用
+# (preload)，再 fork 出多个工作进程：后台线程不会被 fork 复制，日志线程在 fork 前停止、fork 后
+# 在父子进程中各自重新启动；打包线程、进程池等在子进程中按需重新创建。
+_runtime_initialized = False
+_runtime_lock = threading.Lock()
+
+def init_runtime():
+    """创建数据目录、占位图标，启动日志线程（每个进程只执行一次）"""
+    global _runtime_initialized
+    with _runtime_lock:
+        if _runtime_initialized:
+            return
+        for directory in (PROGRAMS_DIR, EXE_DIR, UPLOAD_FOLDER):
+            os.makedirs(directory, exist_ok=True)
+        configure_logging()
+        _ensure_placeholder_icon()
+        migrate_info_json()
+        migrate_artifact_store()
+        _prune_old_files(BUILD_TRANSCRIPT_DIR, '*.log', BUILD_JOB_HISTORY)
+        _prune_old_files(BUILD_STATE_DIR, '*.json', BUILD_JOB_HISTORY)
+        _prune_old_files(IMPORT_STATE_DIR, '*.json', IMPORT_BATCH_HISTORY)
+        _remove_stale_uploads()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(before=_before_fork, after_in_parent=_start_log_listener,
+                                after_in_child=_reinit_after_fork)
+        _runtime_initialized = True
+
+def _reinit_after_fork():
+    global _build_queue, _interp_pool, _import_executor, _trash_collector, _db_local, _run_slots
+    _start_log_listener()
+    _db_local = threading.local()  # SQLite 连接不能跨进程使用
+    # 父进程中的线程、线程池和进程池在子进程里都不可用，清空后由各自的 _ensure/_get 函数重新创建
+    _build_workers.clear()
+    _build_queue = queue.Queue()
+    _interp_pool = None
+    _run_slots = threading.BoundedSemaphore(RUN_MAX_CONCURRENCY) if RUN_MAX_CONCURRENCY > 0 else None
+    _import_executor = None
+    _trash_collector = None
+
+def create_app():
+    """创建并配置 Flask 应用"""
+    init_runtime()
+    # __name__ 是 Python 的一个特殊变量，Flask 用它来确定应用根目录，以便查找资源文件（如模板和静态文件）
+    app = Flask(__name__)
+    CORS(app)  # 启用CORS，允许跨域请求
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0  # 未带版本号的静态文件每次都用 ETag 向服务器确认
+    app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024  # 将最大请求大小提高到32MB
+    app.config['UPLOAD_FOLDER'] = str(UPLOAD_FOLDER)
+    app.register_blueprint(bp)
+    app.view_functions['static'] = serve_static
+    with app.app_context():
+        precompress_static_assets()
+    return app
+
 
 # 当这个脚本被直接运行时 (而不是被导入时)
 if __name__ == '__main__':
-    # 启动 Flask 开发服务器
+    if len(sys.argv) > 1 and sys.argv[1] == 'import-programs':
+        sys.exit(import_programs_cli(sys.argv[2:]))
+
+    # 启动 Flask 开发服务器（生产环境请使用 serve.py）
     # host='127.0.0.1' 仅本地访问
-    # debug=True 开启调试模式，显示详细错误信息
+    # FLASK_DEBUG=1 时开启调试模式，显示详细错误信息；调试器允许执行任意代码，默认关闭
     # use_reloader=False 禁用自动重载，防止因文件变动导致频繁重启
-    print("Starting Flask server...")
-    app.run(host='127.0.0.1', port=5000, debug=True, use_reloader=False) 
\ No newline at end of file
+    logger.info("Starting Flask development server...")
+    create_app().run(host='127.0.0.1', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1', use_reloader=False) 
\ No newline at end of file
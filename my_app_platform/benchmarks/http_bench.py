@@ -0,0 +1,293 @@
+"""
+HTTP 接口的负载与延迟测试。
+
+对每个程序数量 N，在临时目录中生成 N 个合成程序，在子进程中启动应用（PyInstaller 替换为
+一个只生成空文件的脚本，可离线快速运行），再用多个并发客户端请求各个接口，统计吞吐量和
+p50/p95/p99 延迟。结果保存为 JSON，便于在不同提交之间比较。
+
+--server dev 使用 Flask 开发服务器（werkzeug，单进程多线程）；--server production 使用
+serve.py 中的生产服务器（gunicorn 多进程 + 多线程，Windows 下为 waitress）。
+
+用法（在 my_app_platform 目录下）:
+    python benchmarks/http_bench.py [--programs 10,1000,10000] [--requests 200] [--concurrency 8]
+                                    [--server dev|production] [--workers 4] [--threads 8]
+                                    [--output bench_results.json]
+"""
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlencode
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+# 代替 PyInstaller：解析 --distpath/--name，生成一个很小的“可执行文件”
+STUB_PYINSTALLER = '''\
+import os, sys
+args = sys.argv[1:]
+dist, name = args[args.index('--distpath') + 1], args[args.index('--name') + 1]
+os.makedirs(dist, exist_ok=True)
+with open(os.path.join(dist, name + ('.exe' if os.name == 'nt' else '')), 'wb') as f:
+    f.write(b'stub')
+'''
+
+
+def seed_programs(workspace, count, prefix='bench'):
+    """直接生成 count 个程序（与打包成功后的目录结构和数据库记录相同），返回程序名列表"""
+    sys.path.insert(0, str(APP_DIR))
+    import app as app_module
+
+    names = []
+    now = time.time()
+    conn = app_module.open_program_db(workspace / 'programs.db')
+    try:
+        with app_module.db_transaction(conn):
+            for i in range(count):
+                name = f'{prefix}_{i:06d}'
+                program_dir = workspace / 'programs' / name
+                exe_dir = workspace / 'exe_programs' / name
+                program_dir.mkdir(parents=True)
+                exe_dir.mkdir(parents=True)
+                (program_dir / 'source.py').write_text('pass\n', encoding='utf-8')
+                (exe_dir / name).write_bytes(b'stub')
+                app_module.upsert_program(conn, {
+                    'name': name,
+                    'language': 'python',
+                    'source_file': f'{name}/source.py',
+                    'exe_path': f'{name}/{name}',
+                    'icon': 'placeholder_icon.png',
+                    'created_at': now - i,
+                    'last_run': None,
+                })
+                names.append(name)
+    finally:
+        conn.close()
+    return names
+
+
+def _serve(workspace, port, ready, server_kind, workers, threads):
+    """子进程：在工作目录中创建应用并启动 HTTP 服务"""
+    os.chdir(workspace)
+    sys.path.insert(0, str(APP_DIR))
+    import app as app_module
+
+    stub = Path(workspace) / 'stub_pyinstaller.py'
+    stub.write_text(STUB_PYINSTALLER, encoding='utf-8')
+    for key in ('build_command', 'warm_build_command'):
+        command = app_module.SUPPORTED_LANGUAGES['python'][key]
+        app_module.SUPPORTED_LANGUAGES['python'][key] = command.replace('pyinstaller', f'"{sys.executable}" "{stub}"', 1)
+    application = app_module.create_app()
+    if server_kind == 'production':
+        import serve
+        serve.serve(application, '127.0.0.1', port, workers, threads, on_ready=ready.set)
+        return
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', port, application, threaded=True)
+    ready.set()
+    server.serve_forever()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _request(port, method, path, body=None, headers=None):
+    """发送一个请求，返回 (耗时秒数, 是否成功)"""
+    started = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        data = response.read()
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - started
+    ok = 200 <= response.status < 400
+    if ok and response.headers.get('Content-Type', '').startswith('application/json'):
+        ok = json.loads(data).get('status') in ('success', 'queued', 'partial')
+    return elapsed, ok
+
+
+def _json_request(port, path, payload):
+    return _request(port, 'POST', path, json.dumps(payload), {'Content-Type': 'application/json'})
+
+
+def _form_request(port, path, fields):
+    boundary = uuid.uuid4().hex
+    parts = [f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n' for k, v in fields.items()]
+    body = (''.join(parts) + f'--{boundary}--\r\n').encode('utf-8')
+    return _request(port, 'POST', path, body, {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+
+def drive(label, calls, concurrency):
+    """用 concurrency 个线程执行 calls（无参函数列表），返回统计结果"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(lambda call: call(), calls))
+    wall = time.perf_counter() - started
+    latencies = sorted(elapsed * 1000 for elapsed, _ in samples)
+    if len(latencies) >= 2:
+        q = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = q[49], q[94], q[98]
+    else:
+        p50 = p95 = p99 = latencies[0]
+    result = {
+        'endpoint': label,
+        'requests': len(samples),
+        'errors': sum(1 for _, ok in samples if not ok),
+        'concurrency': concurrency,
+        'throughput_rps': round(len(samples) / wall, 1),
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'p50_ms': round(p50, 2),
+        'p95_ms': round(p95, 2),
+        'p99_ms': round(p99, 2),
+        'max_ms': round(latencies[-1], 2),
+    }
+    print(f"  {label:<20} {result['throughput_rps']:>8} req/s  p50 {result['p50_ms']:>8} ms  "
+          f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  errors {result['errors']}", file=sys.stderr)
+    return result
+
+
+def bench_catalogue(count, args):
+    """对 count 个程序的目录运行全部接口测试"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = Path(tmp)
+        (workspace / 'static' / 'program_icons').mkdir(parents=True)
+        started = time.perf_counter()
+        names = seed_programs(workspace, count)
+        print(f"N={count}: seeded in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        port = _free_port()
+        ready = multiprocessing.Event()
+        server = multiprocessing.Process(target=_serve, args=(str(workspace), port, ready, args.server,
+                                                             args.workers, args.threads))
+        server.start()
+        try:
+            if not ready.wait(60):
+                raise SystemExit('server did not start')
+            # 预热：第一次请求会打开数据库连接并启动进程池
+            _request(port, 'GET', '/api/programs')
+            _json_request(port, '/run_program', {'name': names[0], 'mode': 'interpreted'})
+
+            n = args.requests
+            results.append(drive('index', [lambda: _request(port, 'GET', '/')] * n, args.concurrency))
+            results.append(drive('api_programs', [lambda: _request(port, 'GET', '/api/programs?limit=50')] * n,
+                                 args.concurrency))
+            prefix_path = '/api/programs?' + urlencode({'prefix': 'bench_0000', 'sort': 'created'})
+            results.append(drive('api_programs_prefix', [lambda: _request(port, 'GET', prefix_path)] * n,
+                                 args.concurrency))
+            run_calls = [lambda name=names[i % count]: _json_request(port, '/run_program', {'name': name, 'mode': 'interpreted'})
+                         for i in range(n)]
+            results.append(drive('run_program', run_calls, args.concurrency))
+            add_calls = [lambda i=i: _form_request(port, '/add_program', {'name': f'added_{i:06d}', 'code': f'print({i})'})
+                         for i in range(n)]
+            results.append(drive('add_program', add_calls, args.concurrency))
+
+            # 每个请求删除一个不同的程序，最多删除一半，保证后面的测试仍有数据
+            deletable = names[count // 2:][:n]
+            delete_calls = [lambda name=name: _json_request(port, '/delete_programs', {'programs': [name]})
+                            for name in deletable]
+            if delete_calls:
+                results.append(drive('delete_programs', delete_calls, args.concurrency))
+
+            # 清理全部程序是破坏性的：每轮测量前重新生成程序，只统计清理请求本身
+            clean_samples = []
+            for round_no in range(args.clean_runs):
+                if round_no:
+                    seed_programs(workspace, count, prefix=f'reseed{round_no}')
+                clean_samples.append(drive('clean_all_programs', [lambda: _request(port, 'POST', '/clean_all_programs')], 1))
+            if clean_samples:
+                latencies = sorted(r['mean_ms'] for r in clean_samples)
+                results.append({
+                    'endpoint': 'clean_all_programs',
+                    'requests': len(latencies),
+                    'errors': sum(r['errors'] for r in clean_samples),
+                    'concurrency': 1,
+                    'throughput_rps': round(1000 / statistics.fmean(latencies), 2),
+                    'mean_ms': round(statistics.fmean(latencies), 2),
+                    'p50_ms': round(statistics.median(latencies), 2),
+                    'p95_ms': latencies[-1],
+                    'p99_ms': latencies[-1],
+                    'max_ms': latencies[-1],
+                })
+        finally:
+            server.terminate()
+            server.join()
+    for result in results:
+        result['programs'] = count
+        result['server'] = args.server
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--programs', default='10,1000,10000', help='逗号分隔的程序数量列表 (10 到 50000)')
+    parser.add_argument('--requests', type=int, default=200, help='每个接口的请求数')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发客户端数')
+    parser.add_argument('--clean-runs', type=int, default=3, help='clean_all_programs 的测量次数')
+    parser.add_argument('--server', choices=('dev', 'production'), default='dev', help='被测的 HTTP 服务器')
+    parser.add_argument('--workers', type=int, default=4, help='production 模式的工作进程数')
+    parser.add_argument('--threads', type=int, default=8, help='production 模式每个工作进程的线程数')
+    parser.add_argument('--output', default='bench_results.json', help='结果 JSON 文件路径')
+    args = parser.parse_args()
+    # 在导入 app 模块（seed_programs 中）之前设置：逐请求的日志会影响测量结果
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('LOG_CONSOLE', '0')
+    # 所有请求都来自同一个客户端，关闭准入控制，测量的是接口本身的开销
+    for name in ('RATE_LIMIT_PER_MINUTE', 'BUILD_MAX_PENDING', 'RUN_MAX_CONCURRENCY'):
+        os.environ.setdefault(name, '0')
+
+    counts = [int(c) for c in args.programs.split(',') if c.strip()]
+    if any(not 10 <= c <= 50000 for c in counts):
+        parser.error('程序数量必须在 10 到 50000 之间')
+
+    results = []
+    for count in counts:
+        results.extend(bench_catalogue(count, args))
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'requests_per_endpoint': args.requests,
+            'concurrency': args.concurrency,
+            'server': args.server,
+            'workers': args.workers if args.server == 'production' else 1,
+            'threads': args.threads if args.server == 'production' else None,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+打包产物的启动时间测试。
+
+用每一种打包后端（PACKAGING_BACKENDS）打包几个参考程序，然后反复启动产物，统计从启动进程到
+收到第一个字节输出的时间（冷启动、热启动）、峰值内存（RSS）和产物大小。/run_program 只报告
+进程是否启动成功，这里测的是程序真正开始工作需要多久。
+
+- 冷启动：每次启动前用 posix_fadvise(DONTNEED) 把产物文件从页缓存中清除（不需要 root 权限），
+  onefile 产物每次都要重新解压运行时；系统 Python 的文件（zipapp 使用）不会被清除。
+- 峰值 RSS：由一个很小的启动器进程 fork/exec 产物，用 os.wait4 取得产物及其已回收的子进程中最大的
+  RSS（onefile 的引导程序会再启动一个子进程）。启动器本身约 5 MB，是测量的下限。
+  Windows 没有 os.wait4 和 posix_fadvise，只统计时间。
+- snake_game 是 tkinter 程序：需要 DISPLAY，或者系统中有 Xvfb（会自动启动一个虚拟显示）；
+  程序前面会加一段代码，在第一帧绘制完成后输出一行并退出。都没有时跳过。
+
+所有文件都写在临时目录中，不影响项目本身。
+
+用法（在 my_app_platform 目录下）:
+    python benchmarks/startup_bench.py [--backends pyinstaller,onedir,zipapp] [--programs hello,stdlib,snake_game]
+                                       [--runs 10] [--cold-runs 3] [--output startup_results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+LAUNCH_TIMEOUT = 60
+
+# 在 mainloop 开始后的第一个空闲时刻（第一帧已绘制）输出一行，再稍等后关闭窗口
+GUI_PRELUDE = '''\
+import tkinter as _bench_tkinter
+_bench_mainloop = _bench_tkinter.Misc.mainloop
+def _bench_first_frame(self, n=0):
+    self.after_idle(lambda: (print('ready', flush=True), self.after(100, self.destroy)))
+    _bench_mainloop(self, n)
+_bench_tkinter.Misc.mainloop = _bench_first_frame
+'''
+
+# 启动器：argv 为 (结果管道 fd, 命令...)；等待产物退出后写入 "启动时刻 退出码 峰值RSS"
+LAUNCHER = '''\
+import os, sys, time
+result_fd, cmd = int(sys.argv[1]), sys.argv[2:]
+started = time.monotonic()
+pid = os.fork()
+if pid == 0:
+    try:
+        os.execvp(cmd[0], cmd)
+    finally:
+        os._exit(127)
+_, status, usage = os.wait4(pid, 0)
+os.write(result_fd, ('%r %d %d' % (started, os.waitstatus_to_exitcode(status), usage.ru_maxrss)).encode())
+'''
+
+REFERENCE_PROGRAMS = {
+    'hello': {'source': "print('ready')\n", 'gui': False},
+    'stdlib': {'source': "import json, random, datetime, collections\nprint(json.dumps({'ready': True}))\n", 'gui': False},
+    'snake_game': {'source_file': APP_DIR / 'programs' / 'snake_game' / 'source.py', 'gui': True},
+}
+
+
+def _program_source(spec):
+    if 'source_file' in spec:
+        return GUI_PRELUDE + Path(spec['source_file']).read_text(encoding='utf-8')
+    return spec['source']
+
+
+def _start_virtual_display():
+    """没有 DISPLAY 时尝试启动 Xvfb，返回 (进程, DISPLAY)；无法提供显示时返回 (None, None)"""
+    if os.environ.get('DISPLAY') or os.name == 'nt':
+        return None, os.environ.get('DISPLAY') or (':0' if os.name != 'nt' else None)
+    if not shutil.which('Xvfb'):
+        return None, None
+    display = f':{90 + os.getpid() % 100}'
+    process = subprocess.Popen(['Xvfb', display, '-nolisten', 'tcp', '-screen', '0', '1024x768x24'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1)
+    if process.poll() is not None:
+        return None, None
+    return process, display
+
+
+def _artifact_files(artifact_path, tree):
+    if not tree:
+        return [artifact_path]
+    return [path for path in artifact_path.parent.rglob('*') if path.is_file()]
+
+
+def _evict_from_page_cache(files):
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    for path in files:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def _launch(cmd, cwd, env):
+    """启动进程，返回 (进程, 启动时刻, 结果管道)。
+
+    在 Linux 上 exec 之前父进程的内存峰值会计入子进程的 ru_maxrss（本脚本导入 app 后约 40 MB），
+    所以 POSIX 下通过一个很小的启动器进程 fork/exec 产物并用 wait4 取得资源使用情况。
+    启动器在 fork 前记录 time.monotonic()，输出时间从这一刻算起，不包含启动器自身的启动时间。
+    """
+    if not hasattr(os, 'wait4'):
+        started = time.monotonic()
+        return subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL), started, None
+    read_fd, write_fd = os.pipe()
+    try:
+        process = subprocess.Popen([sys.executable, '-S', '-c', LAUNCHER, str(write_fd), *cmd], cwd=cwd, env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, pass_fds=(write_fd,))
+    finally:
+        os.close(write_fd)
+    return process, None, read_fd
+
+
+def launch_once(cmd, cwd, env):
+    """启动一次，返回 (首次输出的毫秒数, 总耗时毫秒数, 峰值 RSS 字节数, 退出码)"""
+    process, started, result_fd = _launch(cmd, cwd, env)
+    try:
+        first = process.stdout.read(1)
+        first_at = time.monotonic()
+        deadline = first_at + LAUNCH_TIMEOUT
+        while process.stdout.read(65536):
+            if time.monotonic() > deadline:
+                process.kill()
+                break
+    finally:
+        process.stdout.close()
+    process.wait(LAUNCH_TIMEOUT)
+    finished = time.monotonic()
+    if result_fd is None:
+        return (first_at - started) * 1000 if first else None, (finished - started) * 1000, None, process.returncode
+    with os.fdopen(result_fd, 'rb') as f:
+        report = f.read().split()
+    if len(report) != 3:
+        return None, None, None, process.returncode or -1
+    started, returncode, max_rss = float(report[0]), int(report[1]), int(report[2])
+    # Linux 的 ru_maxrss 单位是 KB，macOS 是字节
+    peak_rss = max_rss if sys.platform == 'darwin' else max_rss * 1024
+    return (first_at - started) * 1000 if first else None, (finished - started) * 1000, peak_rss, returncode
+
+
+def _summary(samples, index):
+    values = [sample[index] for sample in samples if sample[index] is not None]
+    return round(statistics.median(values), 1) if values else None
+
+
+def bench_artifact(app_module, backend, program, artifact_path, args, env):
+    cmd = app_module.artifact_command({'backend': backend}, artifact_path)
+    files = _artifact_files(artifact_path, app_module.PACKAGING_BACKENDS[backend].get('tree'))
+    cold = []
+    for _ in range(args.cold_runs):
+        _evict_from_page_cache(files)
+        cold.append(launch_once(cmd, artifact_path.parent, env))
+    launch_once(cmd, artifact_path.parent, env)  # 预热页缓存
+    warm = [launch_once(cmd, artifact_path.parent, env) for _ in range(args.runs)]
+    failures = sum(1 for sample in cold + warm if sample[3] != 0 or sample[0] is None)
+    result = {
+        'backend': backend,
+        'program': program,
+        'cold_first_output_ms': _summary(cold, 0),
+        'warm_first_output_ms': _summary(warm, 0),
+        'warm_total_ms': _summary(warm, 1),
+        'peak_rss_bytes': max((sample[2] for sample in warm if sample[2]), default=None),
+        'artifact_bytes': sum(path.stat().st_size for path in files),
+        'artifact_files': len(files),
+        'failures': failures,
+    }
+    print(f"  {backend:<12} {program:<11} cold {result['cold_first_output_ms']!s:>8} ms  "
+          f"warm {result['warm_first_output_ms']!s:>8} ms  rss {(result['peak_rss_bytes'] or 0) / 1048576:7.1f} MB  "
+          f"size {result['artifact_bytes'] / 1048576:7.2f} MB  failures {failures}", file=sys.stderr)
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default='', help='逗号分隔的打包后端，默认全部')
+    parser.add_argument('--programs', default=','.join(REFERENCE_PROGRAMS), help='逗号分隔的参考程序')
+    parser.add_argument('--runs', type=int, default=10, help='每个产物的热启动次数')
+    parser.add_argument('--cold-runs', type=int, default=3, help='每个产物的冷启动次数')
+    parser.add_argument('--output', default='startup_results.json', help='结果 JSON 文件路径')
+    args = parser.parse_args()
+    output = Path(args.output).resolve()
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('LOG_CONSOLE', '0')
+
+    programs = [name.strip() for name in args.programs.split(',') if name.strip()]
+    unknown = [name for name in programs if name not in REFERENCE_PROGRAMS]
+    if unknown:
+        parser.error(f"未知的参考程序: {', '.join(unknown)}")
+
+    display_process, display = _start_virtual_display()
+    results = []
+    skipped = []
+    try:
+        with tempfile.TemporaryDirectory() as workspace:
+            os.chdir(workspace)
+            Path('static').mkdir()
+            sys.path.insert(0, str(APP_DIR))
+            import app as app_module
+            app_module.init_runtime()
+
+            backends = [name.strip() for name in args.backends.split(',') if name.strip()] or list(app_module.PACKAGING_BACKENDS)
+            env = dict(os.environ)
+            if display:
+                env['DISPLAY'] = display
+            for program in programs:
+                spec = REFERENCE_PROGRAMS[program]
+                if spec['gui'] and not display:
+                    print(f"{program}: 没有可用的显示（DISPLAY 或 Xvfb），跳过", file=sys.stderr)
+                    skipped.append(program)
+                    continue
+                program_dir = Path(app_module.PROGRAMS_DIR) / program
+                program_dir.mkdir(parents=True, exist_ok=True)
+                source_file = program_dir / 'source.py'
+                source_file.write_text(_program_source(spec), encoding='utf-8')
+                for backend in backends:
+                    started = time.perf_counter()
+                    ok, exe_path, error = app_module.PACKAGING_BACKENDS[backend]['build'](
+                        program, source_file, 'python', exe_dir=Path(app_module.EXE_DIR) / backend / program)
+                    if not ok:
+                        raise SystemExit(f'build failed ({backend}/{program}): {error}')
+                    build_seconds = time.perf_counter() - started
+                    print(f"{backend}/{program}: built in {build_seconds:.1f}s", file=sys.stderr)
+                    artifact_path, error = app_module.resolve_exe_path({'exe_path': exe_path})
+                    if error:
+                        raise SystemExit(error)
+                    result = bench_artifact(app_module, backend, program, artifact_path, args, env)
+                    result['build_seconds'] = round(build_seconds, 2)
+                    results.append(result)
+    finally:
+        if display_process:
+            display_process.terminate()
+
+    report = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'runs': args.runs,
+            'cold_runs': args.cold_runs,
+            'skipped_programs': skipped,
+        },
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+比较普通打包与预热打包（WARM_BUILDS）的耗时。
+
+每一轮都会在源码末尾追加不同的注释，使打包缓存无法命中，但导入模块集合保持不变，
+模拟“不同程序、相同依赖”的常见情况。所有文件都写在临时目录中，不影响项目本身。
+
+用法（在 my_app_platform 目录下）:
+    python benchmarks/warm_build.py [--runs 3] [--source programs/snake_game/source.py]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+
+def run_builds(app_module, source_code, label, runs, warm):
+    app_module.WARM_BUILDS = warm
+    timings = []
+    for i in range(runs):
+        program_name = f'{label}_{i}'
+        program_dir = Path(app_module.PROGRAMS_DIR) / program_name
+        program_dir.mkdir(parents=True, exist_ok=True)
+        source_file = program_dir / 'source.py'
+        source_file.write_text(f'{source_code}\n# benchmark run {label} {i}\n', encoding='utf-8')
+        started = time.perf_counter()
+        ok, _, error = app_module.build_executable(program_name, source_file, 'python')
+        elapsed = time.perf_counter() - started
+        if not ok:
+            raise SystemExit(f'build failed ({label} #{i}): {error}')
+        timings.append(elapsed)
+        print(f'{label} build #{i}: {elapsed:.2f}s', file=sys.stderr)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='每种模式打包的次数')
+    parser.add_argument('--source', default=str(APP_DIR / 'programs' / 'snake_game' / 'source.py'))
+    args = parser.parse_args()
+
+    source_code = Path(args.source).read_text(encoding='utf-8')
+    with tempfile.TemporaryDirectory() as workspace:
+        os.chdir(workspace)
+        Path('static').mkdir()
+        sys.path.insert(0, str(APP_DIR))
+        import app as app_module
+        app_module.init_runtime()
+
+        cold = run_builds(app_module, source_code, 'cold', args.runs, warm=False)
+        # 第一次预热打包需要填充工作目录，单独统计
+        prime = run_builds(app_module, source_code, 'prime', 1, warm=True)
+        warm = run_builds(app_module, source_code, 'warm', args.runs, warm=True)
+
+    result = {
+        'source': args.source,
+        'runs': args.runs,
+        'python': sys.version.split()[0],
+        'cold_median_s': round(statistics.median(cold), 2),
+        'warm_first_s': round(prime[0], 2),
+        'warm_median_s': round(statistics.median(warm), 2),
+        'speedup': round(statistics.median(cold) / statistics.median(warm), 2),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
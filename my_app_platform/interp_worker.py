@@ -0,0 +1,165 @@
+"""
+解释运行模式的工作进程代码。
+
+Flask 应用启动一个进程池，池中的进程事先导入好常用模块，收到运行请求后直接执行
+programs/<name>/source.py（有字节码缓存时直接执行缓存的代码对象，不再解析源码），
+省去 PyInstaller 打包和 onefile 解压的时间。
+这个模块保持精简，不依赖 Flask，工作进程只需要导入它和需要预加载的模块。
+"""
+import importlib
+import importlib.util
+import marshal
+import os
+import runpy
+import signal
+import sys
+import time
+import traceback
+import types
+
+
+def preload(module_names):
+    """进程池初始化函数：预先导入常用模块，导入失败的模块直接跳过"""
+    for name in module_names:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            print(f"[interp-worker {os.getpid()}] 预加载模块 {name} 失败: {e}", file=sys.stderr)
+
+
+def _with_filename(code, filename):
+    """把代码对象（包括嵌套的函数、类）中的文件名改为 filename，使异常回溯指向程序的源文件"""
+    if code.co_filename == filename:
+        return code
+    consts = tuple(_with_filename(c, filename) if isinstance(c, types.CodeType) else c for c in code.co_consts)
+    return code.replace(co_filename=filename, co_consts=consts)
+
+
+def _load_bytecode(bytecode_file, source_file):
+    """读取应用缓存的 .pyc，返回代码对象；文件不存在或不是当前解释器生成的时返回 None"""
+    try:
+        with open(bytecode_file, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if data[:4] != importlib.util.MAGIC_NUMBER:
+        return None
+    try:
+        code = marshal.loads(memoryview(data)[16:])
+    except (EOFError, ValueError, TypeError):
+        return None
+    return _with_filename(code, source_file)
+
+
+def _run_main(code, source_file):
+    """与 runpy.run_path 相同：在临时替换的 __main__ 模块中执行代码对象"""
+    module = types.ModuleType('__main__')
+    module.__dict__.update(__file__=source_file, __cached__=None, __loader__=None, __package__='', __spec__=None)
+    saved_main = sys.modules.get('__main__')
+    sys.modules['__main__'] = module
+    try:
+        exec(code, module.__dict__)
+    finally:
+        if saved_main is None:
+            sys.modules.pop('__main__', None)
+        else:
+            sys.modules['__main__'] = saved_main
+
+
+def _exec_program(source_file, program_dir, bytecode_file=None):
+    os.chdir(program_dir)
+    sys.argv = [source_file]
+    sys.path.insert(0, program_dir)
+    code = _load_bytecode(bytecode_file, source_file) if bytecode_file else None
+    if code is None:
+        runpy.run_path(source_file, run_name='__main__')
+    else:
+        _run_main(code, source_file)
+
+
+class _WallTimeout(BaseException):
+    """isolation='none' 时由 SIGALRM 在程序中抛出；继承 BaseException，程序里的 except Exception 拦不住"""
+
+
+def _raise_wall_timeout(signum, frame):
+    raise _WallTimeout()
+
+
+def _wait_child(pid, timeout):
+    """等待子进程结束，返回退出码；超过 timeout 秒（None 表示不限制）时结束子进程所在的进程组，抛出 TimeoutError"""
+    if not timeout:
+        _, status = os.waitpid(pid, 0)
+        return os.waitstatus_to_exitcode(status)
+    deadline = time.monotonic() + timeout
+    delay = 0.01
+    while True:
+        waited, status = os.waitpid(pid, os.WNOHANG)
+        if waited:
+            return os.waitstatus_to_exitcode(status)
+        if time.monotonic() >= deadline:
+            try:
+                os.killpg(pid, signal.SIGKILL)  # 连同程序启动的子进程一起结束
+            except OSError:
+                os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            raise TimeoutError(f'程序运行超过 {timeout:g} 秒，已被终止')
+        time.sleep(delay)
+        delay = min(delay * 2, 0.1)
+
+
+def _exit_code(e):
+    if e.code is None:
+        return 0
+    return e.code if isinstance(e.code, int) else 1
+
+
+def run_program(source_file, program_dir, isolation='fork', bytecode_file=None, timeout=None):
+    """
+    执行一个程序，返回退出码；运行超过 timeout 秒时结束程序并抛出 TimeoutError。
+
+    bytecode_file 是应用缓存的编译结果（.pyc），可以使用时直接执行，不再解析源码；否则运行 source_file。
+
+    isolation='fork' 时从当前（已预加载的）工作进程 fork 出子进程来运行，程序对全局状态的修改
+    不会影响工作进程；isolation='none' 时直接在工作进程里运行，需要配合进程池的回收次数使用，
+    超时由 SIGALRM 在程序中抛出异常（Windows 没有 SIGALRM，不限制运行时间）。
+    """
+    if isolation == 'fork' and hasattr(os, 'fork'):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                os.setpgid(0, 0)  # 独立进程组，超时时连同子进程一起结束
+                _exec_program(source_file, program_dir, bytecode_file)
+            except SystemExit as e:
+                code = _exit_code(e)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        return _wait_child(pid, timeout)
+
+    saved_cwd, saved_argv, saved_path = os.getcwd(), sys.argv[:], sys.path[:]
+    alarm = timeout and hasattr(signal, 'setitimer')
+    if alarm:
+        saved_handler = signal.signal(signal.SIGALRM, _raise_wall_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        _exec_program(source_file, program_dir, bytecode_file)
+        return 0
+    except _WallTimeout:
+        raise TimeoutError(f'程序运行超过 {timeout:g} 秒，已被终止') from None
+    except SystemExit as e:
+        return _exit_code(e)
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, saved_handler)
+        os.chdir(saved_cwd)
+        sys.argv[:] = saved_argv
+        sys.path[:] = saved_path
@@ -0,0 +1,89 @@
+"""
+生产环境入口：用多进程、多线程的 WSGI 服务器运行应用，代替 app.py 中的 Flask 开发服务器。
+
+Linux/macOS 使用 gunicorn：应用在主进程中创建一次（preload），再 fork 出 --workers 个工作进程，
+每个进程用 --threads 个线程处理请求；工作进程异常退出时由主进程重新创建。
+Windows 没有 fork，使用 waitress 在单个进程中以多线程方式运行。
+
+用法（在 my_app_platform 目录下）:
+    python serve.py [--host 127.0.0.1] [--port 5000] [--workers N] [--threads 8]
+"""
+import argparse
+import os
+import sys
+
+import app as app_module
+
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', str(min(os.cpu_count() or 1, 4))))
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '8'))
+# /execute 最长运行 EXECUTE_WALL_TIMEOUT 秒，/build_logs 是长连接；超时只用于发现卡死的工作进程
+SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', '120'))
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # Windows 或未安装 gunicorn
+    BaseApplication = None
+
+
+if BaseApplication is not None:
+    class PreloadedApplication(BaseApplication):
+        """把已经创建好的 Flask 应用交给 gunicorn，工作进程 fork 后直接使用"""
+
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+
+def serve(application, host, port, workers=SERVER_WORKERS, threads=SERVER_THREADS, on_ready=None):
+    """运行 WSGI 服务器直到进程退出；on_ready 在开始接受连接后调用（gunicorn 下在主进程中调用）"""
+    if BaseApplication is not None:
+        options = {
+            'bind': f'{host}:{port}',
+            'workers': max(1, workers),
+            'threads': max(1, threads),
+            'worker_class': 'gthread',
+            'preload_app': True,
+            'timeout': SERVER_TIMEOUT,
+            'graceful_timeout': 30,
+            'accesslog': None,
+            'loglevel': 'warning',
+        }
+        if on_ready:
+            options['when_ready'] = lambda server: on_ready()
+        PreloadedApplication(application, options).run()
+        return
+
+    try:
+        import waitress
+    except ImportError:
+        sys.exit('需要安装 gunicorn (Linux/macOS) 或 waitress (Windows)：pip install -r requirements.txt')
+    server = waitress.create_server(application, host=host, port=port, threads=max(1, threads))
+    if on_ready:
+        on_ready()
+    server.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='工作进程数（Windows 下忽略）')
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help='每个工作进程的线程数')
+    args = parser.parse_args()
+
+    application = app_module.create_app()
+    app_module.logger.info(f"Starting production server on {args.host}:{args.port} "
+                           f"({args.workers} worker(s) x {args.threads} thread(s))")
+    serve(application, args.host, args.port, args.workers, args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -149,11 +149,144 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // 右键点击：通过 /execute 运行程序，并把捕获到的输出显示在页面上
+    function handleProgramExecute(event) {
+        var programItem = event.target.closest('.program-item');
+        if (!programItem) return;
+        event.preventDefault();
+        
+        if (programItem.getAttribute('data-processing') === 'true') {
+            return;
+        }
+        
+        var programName = programItem.dataset.programName;
+        var outputSection = document.getElementById('program-output');
+        var outputStatus = document.getElementById('output-status');
+        var outputArea = document.getElementById('output-area');
+        if (!outputSection || !outputArea) return;
+        
+        outputSection.classList.remove('hidden');
+        showMessage(outputStatus, '正在运行 ' + programName + '...', 'info');
+        outputArea.textContent = '';
+        programItem.setAttribute('data-processing', 'true');
+        programItem.style.opacity = '0.7';
+        
+        fetch('/execute', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ name: programName, target: 'source' })
+        })
+        .then(function(response) { return response.json(); })
+        .then(function(result) {
+            if (result.status !== 'success') {
+                showMessage(outputStatus, result.message, 'error');
+                return;
+            }
+            var summary = programName + ' 退出码 ' + result.exit_code + '，用时 ' + result.duration_ms + ' 毫秒';
+            if (result.timed_out) {
+                summary += '（超时，已终止）';
+            }
+            showMessage(outputStatus, summary, result.exit_code === 0 ? 'success' : 'error');
+            
+            var text = result.stdout;
+            if (result.stdout_truncated_bytes) {
+                text += '\n... 省略 ' + result.stdout_truncated_bytes + ' 字节输出';
+            }
+            if (result.stderr) {
+                text += (text ? '\n' : '') + '[stderr]\n' + result.stderr;
+                if (result.stderr_truncated_bytes) {
+                    text += '\n... 省略 ' + result.stderr_truncated_bytes + ' 字节输出';
+                }
+            }
+            outputArea.textContent = text || '（没有输出）';
+        })
+        .catch(function(error) {
+            showMessage(outputStatus, '运行程序出错: ' + error, 'error');
+        })
+        .finally(function() {
+            programItem.style.opacity = '1';
+            programItem.removeAttribute('data-processing');
+        });
+    }
+    
     // 绑定程序点击事件
     if (programsContainer) {
         programsContainer.addEventListener('click', handleProgramClick);
+        programsContainer.addEventListener('contextmenu', handleProgramExecute);
+    }
+    
+    // ----- 程序列表分页加载 -----
+    
+    var PROGRAM_PAGE_SIZE = 48;
+    var programPager = { cursor: null, done: false, loading: false };
+    var programsSentinel = document.getElementById('programs-sentinel');
+    
+    // 加载下一页程序并追加到网格
+    function loadNextProgramPage() {
+        if (programPager.loading || programPager.done || !programsContainer) {
+            return Promise.resolve();
+        }
+        programPager.loading = true;
+        var url = '/api/programs?limit=' + PROGRAM_PAGE_SIZE;
+        if (programPager.cursor) {
+            url += '&cursor=' + encodeURIComponent(programPager.cursor);
+        }
+        return fetch(url)
+        .then(function(response) { return response.json(); })
+        .then(function(result) {
+            if (result.status !== 'success') {
+                throw new Error(result.message);
+            }
+            result.programs.forEach(function(program) {
+                // 新添加的程序可能已经在网格中
+                if (!findProgramItem(program.name)) {
+                    programsContainer.appendChild(createProgramItem(program));
+                }
+            });
+            programPager.cursor = result.next_cursor;
+            programPager.done = !result.next_cursor;
+            updateProgramGridVisibility();
+        })
+        .catch(function(error) {
+            console.error('加载程序列表出错:', error);
+            programPager.done = true;
+        })
+        .finally(function() {
+            programPager.loading = false;
+            // 一页没有填满屏幕时继续加载
+            if (!programPager.done && programsSentinel &&
+                programsSentinel.getBoundingClientRect().top < window.innerHeight + 200) {
+                loadNextProgramPage();
+            }
+        });
+    }
+    
+    function findProgramItem(programName) {
+        var items = programsContainer ? programsContainer.querySelectorAll('.program-item') : [];
+        for (var i = 0; i < items.length; i++) {
+            if (items[i].dataset.programName === programName) return items[i];
+        }
+        return null;
     }
     
+    // 没有程序时隐藏程序网格
+    function updateProgramGridVisibility() {
+        var gridSection = document.getElementById('program-grid');
+        if (gridSection && programsContainer) {
+            gridSection.classList.toggle('hidden', programsContainer.children.length === 0);
+        }
+    }
+    
+    // 滚动到网格底部时加载下一页
+    if (programsSentinel && 'IntersectionObserver' in window) {
+        new IntersectionObserver(function(entries) {
+            if (entries.some(function(entry) { return entry.isIntersecting; })) {
+                loadNextProgramPage();
+            }
+        }, { rootMargin: '200px' }).observe(programsSentinel);
+    }
+    loadNextProgramPage();
+    
     // ----- 添加程序功能 -----
     
     // 提交添加程序表单
@@ -196,55 +329,50 @@ document.addEventListener('DOMContentLoaded', function() {
             formData.append('name', programName);
             formData.append('code', programCode);
             formData.append('language', 'python'); // Hardcode language to python
+            var programBackend = document.getElementById('program-backend');
+            if (programBackend) {
+                formData.append('backend', programBackend.value);
+            }
             
             if (programIcon.files.length > 0) {
                 formData.append('icon', programIcon.files[0]);
             }
             
             // 显示加载中状态
-            showMessage(addMessageDiv, '正在打包程序为EXE，这可能需要一点时间...', 'info');
-            
-            // 创建一个带超时的fetch（20分钟超时）
-            const controller = new AbortController();
-            const timeoutId = setTimeout(() => controller.abort(), 1200000); // 20分钟超时
+            showMessage(addMessageDiv, '正在提交程序...', 'info');
             
-            // 添加详细的错误处理
+            // 服务器只负责排队，立即返回任务ID，之后轮询打包状态
             fetch('/add_program', {
                 method: 'POST',
-                body: formData,
-                signal: controller.signal // 关联AbortController
+                body: formData
             })
             .then(function(response) { 
                 console.log('收到服务器响应:', response.status, response.statusText);
-                clearTimeout(timeoutId); // 清除超时
-                if (!response.ok) {
+                // 请求过于频繁 (429)、打包队列已满 (503)、上传过大 (413) 等错误也返回 JSON，
+                // 其中的 message 已包含建议的等待时间，按普通错误显示
+                var isJson = (response.headers.get('Content-Type') || '').indexOf('application/json') !== -1;
+                if (!response.ok && !isJson) {
                     throw new Error('网络请求失败: ' + response.status + ' ' + response.statusText);
                 }
-                return response.json(); 
+                return response.json();
             })
             .then(function(result) {
                 console.log('处理服务器返回结果:', result);
-                if (result.status === 'success') {
-                    // 成功后操作
-                    addProgramForm.reset();
-                    hideAllForms();
-                    alert(result.message);
-                    addNewProgram(programName, result.icon_path, 'python');
+                if (result.status === 'queued') {
+                    showMessage(addMessageDiv, '已加入打包队列，正在等待打包...', 'info');
+                    streamBuildLog(result.job_id);
+                    pollBuildStatus(result.job_id, programName, result.icon_path);
                 } else {
                     // 错误处理
                     showMessage(addMessageDiv, result.message, result.status);
                 }
             })
             .catch(function(error) {
-                clearTimeout(timeoutId); // 确保清除超时
                 console.error('添加程序出错:', error);
                 
                 let errorMessage = '添加程序出错: ';
                 
-                // 检查是否是超时错误
-                if (error.name === 'AbortError') {
-                    errorMessage += '请求超时，程序打包可能需要更长时间。请尝试使用更简单的代码或稍后再试。';
-                } else if (error instanceof TypeError && error.message.includes('Failed to fetch')) {
+                if (error instanceof TypeError && error.message.includes('Failed to fetch')) {
                     errorMessage += '无法连接到服务器，请检查网络连接或服务器是否在运行。';
                 } else {
                     errorMessage += error.message || error.toString();
@@ -263,6 +391,80 @@ document.addEventListener('DOMContentLoaded', function() {
         };
     }
     
+    // 通过 Server-Sent Events 实时显示打包日志，页面上只保留最近的若干行
+    var MAX_BUILD_LOG_LINES = 200;
+    function streamBuildLog(jobId) {
+        var logElement = document.getElementById('build-log');
+        if (!logElement || !window.EventSource) return;
+        
+        logElement.textContent = '';
+        logElement.classList.remove('hidden');
+        
+        var source = new EventSource('/build_logs/' + encodeURIComponent(jobId));
+        var appendLine = function(text) {
+            var lines = logElement.textContent ? logElement.textContent.split('\n') : [];
+            lines.push(text);
+            if (lines.length > MAX_BUILD_LOG_LINES) {
+                lines = lines.slice(lines.length - MAX_BUILD_LOG_LINES);
+            }
+            logElement.textContent = lines.join('\n');
+            logElement.scrollTop = logElement.scrollHeight;
+        };
+        source.onmessage = function(event) {
+            appendLine(event.data);
+        };
+        source.addEventListener('skipped', function(event) {
+            appendLine('... 省略 ' + event.data + ' 行日志 ...');
+        });
+        source.addEventListener('end', function() {
+            source.close();
+        });
+        source.onerror = function() {
+            // 任务不存在时服务器返回 404，EventSource 不会自动重连
+            if (source.readyState === EventSource.CLOSED) {
+                console.error('构建日志连接已关闭');
+            }
+        };
+    }
+    
+    // 轮询打包任务状态，直到成功或失败
+    function pollBuildStatus(jobId, programName, iconPath) {
+        var addMessageDiv = document.getElementById('add-message');
+        
+        fetch('/build_status/' + encodeURIComponent(jobId))
+        .then(function(response) { return response.json(); })
+        .then(function(result) {
+            if (result.status !== 'success') {
+                showMessage(addMessageDiv, result.message, 'error');
+                return;
+            }
+            var job = result.job;
+            if (job.state === 'succeeded') {
+                var logElement = document.getElementById('build-log');
+                if (logElement) logElement.classList.add('hidden');
+                addProgramForm.reset();
+                if (editor) editor.setValue('');
+                hideAllForms();
+                alert(job.message);
+                addNewProgram(programName, iconPath, 'python', job.icon_thumbs);
+            } else if (job.state === 'failed') {
+                showMessage(addMessageDiv, job.message, 'error');
+            } else {
+                if (job.state === 'queued' && job.queue_position) {
+                    showMessage(addMessageDiv, '排队中，前面还有 ' + (job.queue_position - 1) + ' 个打包任务...', 'info');
+                } else if (job.state === 'running') {
+                    showMessage(addMessageDiv, '正在打包程序为EXE，这可能需要一点时间...', 'info');
+                }
+                setTimeout(function() { pollBuildStatus(jobId, programName, iconPath); }, 2000);
+            }
+        })
+        .catch(function(error) {
+            // 网络暂时不可用时继续轮询，打包任务在服务器端不受影响
+            console.error('查询打包状态出错:', error);
+            setTimeout(function() { pollBuildStatus(jobId, programName, iconPath); }, 5000);
+        });
+    }
+    
     // ----- 删除程序功能 -----
     
     // 全选按钮
@@ -319,7 +521,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (result.status === 'success' || result.status === 'partial') {
                     // 从页面中移除被删除的程序
                     selectedPrograms.forEach(function(programName) {
-                        var item = document.querySelector('.program-item[data-program-name="' + programName + '"]');
+                        var item = findProgramItem(programName);
                         if (item) item.remove();
                     });
                     
@@ -327,11 +529,8 @@ document.addEventListener('DOMContentLoaded', function() {
                     alert(result.message);
                     
                     // 检查是否还有程序，如果没有则隐藏程序网格
-                    var container = document.getElementById('programs-container');
-                    if (container && container.children.length === 0) {
-                        var gridSection = document.getElementById('program-grid');
-                        if (gridSection) gridSection.remove();
-                    }
+                    updateProgramGridVisibility();
+                    if (!programPager.done) loadNextProgramPage();
                 } else {
                     alert(result.message);
                 }
@@ -352,62 +551,118 @@ document.addEventListener('DOMContentLoaded', function() {
         element.style.display = 'block';
     }
     
-    // 添加新程序到网格
-    function addNewProgram(programName, iconPath, programLanguage) {
-        var gridSection = document.getElementById('program-grid');
-        var container = document.getElementById('programs-container');
-        
-        // 如果网格不存在，创建新的网格
-        if (!gridSection) {
-            gridSection = document.createElement('section');
-            gridSection.id = 'program-grid';
-            
-            container = document.createElement('div');
-            container.id = 'programs-container';
-            container.addEventListener('click', handleProgramClick);
-            
-            gridSection.appendChild(container);
-            
-            var mainElement = document.querySelector('main');
-            var addSection = document.getElementById('add-program');
-            
-            if (addSection && mainElement) {
-                mainElement.insertBefore(gridSection, addSection);
-            } else if (mainElement) {
-                mainElement.appendChild(gridSection);
-            }
-        }
-        
-        // 创建新的程序项
+    // 根据 /api/programs 返回的程序信息创建程序项
+    function createProgramItem(program) {
         var newItem = document.createElement('div');
         newItem.className = 'program-item';
-        newItem.setAttribute('data-program-name', programName);
+        newItem.setAttribute('data-program-name', program.name);
+        newItem.title = '单击运行，右键运行并查看输出';
         
         // 添加语言标识，用于在UI中区分不同语言的程序
-        if (programLanguage) {
-            newItem.setAttribute('data-language', programLanguage);
+        if (program.language) {
+            newItem.setAttribute('data-language', program.language);
         }
         
         var iconImg = document.createElement('img');
-        iconImg.src = '/static/' + iconPath;
-        iconImg.alt = programName + ' 图标';
+        // 有缩略图时按屏幕分辨率选择，原图只在没有缩略图时使用
+        if (program.icon_thumbs && program.icon_thumbs['48']) {
+            iconImg.src = '/static/' + program.icon_thumbs['48'];
+            iconImg.srcset = '/static/' + program.icon_thumbs['48'] + ' 48w, /static/' + program.icon_thumbs['96'] + ' 96w';
+            iconImg.sizes = '(max-width: 600px) 40px, 48px';
+        } else {
+            iconImg.src = '/static/' + (program.icon || 'placeholder_icon.png');
+        }
+        iconImg.width = 48;
+        iconImg.height = 48;
+        iconImg.loading = 'lazy';
+        iconImg.alt = program.name + ' 图标';
         iconImg.className = 'program-icon';
         
         var nameSpan = document.createElement('span');
         nameSpan.className = 'program-name';
-        nameSpan.textContent = programName;
+        nameSpan.textContent = program.name;
+        
+        newItem.appendChild(iconImg);
+        newItem.appendChild(nameSpan);
+        return newItem;
+    }
+    
+    // 添加新程序到网格
+    function addNewProgram(programName, iconPath, programLanguage, iconThumbs) {
+        if (!programsContainer || findProgramItem(programName)) return;
+        var newItem = createProgramItem({
+            name: programName,
+            icon: iconPath,
+            icon_thumbs: iconThumbs,
+            language: programLanguage
+        });
         
         // 添加语言标签
         if (programLanguage) {
             var languageTag = document.createElement('span');
             languageTag.className = 'language-tag ' + programLanguage;
             languageTag.textContent = programLanguage.toUpperCase();
-            newItem.appendChild(languageTag);
+            newItem.insertBefore(languageTag, newItem.firstChild);
         }
         
-        newItem.appendChild(iconImg);
-        newItem.appendChild(nameSpan);
-        container.appendChild(newItem);
+        programsContainer.appendChild(newItem);
+        updateProgramGridVisibility();
+    }
+    
+    // 打开批量删除表单时加载全部程序的复选框
+    function loadDeleteList() {
+        var list = document.getElementById('delete-programs-list');
+        if (!list) return;
+        list.textContent = '正在加载程序列表...';
+        var programs = [];
+        
+        function loadPage(cursor) {
+            var url = '/api/programs?limit=200' + (cursor ? '&cursor=' + encodeURIComponent(cursor) : '');
+            return fetch(url)
+            .then(function(response) { return response.json(); })
+            .then(function(result) {
+                if (result.status !== 'success') {
+                    throw new Error(result.message);
+                }
+                programs = programs.concat(result.programs);
+                return result.next_cursor ? loadPage(result.next_cursor) : programs;
+            });
+        }
+        
+        loadPage(null)
+        .then(function(allPrograms) {
+            list.textContent = '';
+            allPrograms.forEach(function(program) {
+                var row = document.createElement('div');
+                row.className = 'program-checkbox';
+                
+                var checkbox = document.createElement('input');
+                checkbox.type = 'checkbox';
+                checkbox.id = 'delete-' + program.name;
+                checkbox.name = 'programs';
+                checkbox.value = program.name;
+                
+                var label = document.createElement('label');
+                label.htmlFor = checkbox.id;
+                var iconImg = document.createElement('img');
+                iconImg.src = '/static/' + (program.icon_thumbs && program.icon_thumbs['48'] ? program.icon_thumbs['48'] : program.icon);
+                iconImg.loading = 'lazy';
+                iconImg.alt = program.name + ' 图标';
+                iconImg.className = 'program-icon-small';
+                var nameSpan = document.createElement('span');
+                nameSpan.textContent = program.name;
+                label.appendChild(iconImg);
+                label.appendChild(nameSpan);
+                
+                row.appendChild(checkbox);
+                row.appendChild(label);
+                list.appendChild(row);
+            });
+        })
+        .catch(function(error) {
+            console.error('加载程序列表出错:', error);
+            list.textContent = '加载程序列表出错: ' + error.message;
+        });
     }
     
     // 统一的表单切换函数
@@ -430,6 +685,7 @@ document.addEventListener('DOMContentLoaded', function() {
             console.log('显示添加程序表单');
         } else if (formType === 'delete') {
             deleteSection.classList.remove('hidden');
+            loadDeleteList();
             console.log('显示批量删除表单');
         }
         